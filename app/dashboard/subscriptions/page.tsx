@@ -53,6 +53,63 @@ export default function SubscriptionsPage() {
       }
 
       fetchSubscriptions()
+
+      // Live status changes (e.g. a checkout confirmed by Stripe) instead of refreshing.
+      // Each connection opens with a single-use ticket, so the bearer token never goes
+      // in the URL; EventSource would retry with a spent ticket, so reconnects are ours.
+      const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000"
+      let events: EventSource | null = null
+      let reconnectTimer: ReturnType<typeof setTimeout> | undefined
+      let closed = false
+      let connected = false
+
+      const connect = async () => {
+        let source: EventSource
+        try {
+          const response = await fetch(`${apiUrl}/api/subscriptions/stream/ticket`, {
+            method: "POST",
+            headers: {
+              Authorization: `Bearer ${localStorage.getItem("auth_token")}`,
+            },
+          })
+          if (!response.ok) throw new Error(`Ticket request failed: ${response.status}`)
+          const { ticket } = await response.json()
+          if (closed) return
+          source = new EventSource(`${apiUrl}/api/subscriptions/stream?ticket=${encodeURIComponent(ticket)}`)
+          events = source
+        } catch (error) {
+          console.error("Failed to open subscription stream:", error)
+          if (!closed) reconnectTimer = setTimeout(connect, 5000)
+          return
+        }
+        source.addEventListener("ready", () => {
+          // Changes made while reconnecting were missed
+          if (connected) fetchSubscriptions()
+          connected = true
+        })
+        source.addEventListener("resync", () => fetchSubscriptions())
+        source.addEventListener("subscription", (event) => {
+          const changed: Subscription = JSON.parse((event as MessageEvent).data)
+          setSubscriptions((current) => {
+            if (!current.some((s) => s.id === changed.id)) {
+              return changed.status === "active" ? [...current, changed] : current
+            }
+            return current.map((s) => (s.id === changed.id ? { ...s, ...changed } : s))
+          })
+        })
+        source.onerror = () => {
+          source.close()
+          if (!closed) reconnectTimer = setTimeout(connect, 5000)
+        }
+      }
+
+      connect()
+
+      return () => {
+        closed = true
+        clearTimeout(reconnectTimer)
+        events?.close()
+      }
     }
   }, [user, loading, router])
 
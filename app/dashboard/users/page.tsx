@@ -6,7 +6,9 @@ import { Input } from "@/components/ui/input"
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card"
 import { useToast } from "@/hooks/use-toast"
 import { Trash2, CheckCircle, Plus } from "lucide-react"
-import { useState } from "react"
+import { useCallback, useEffect, useState } from "react"
+
+const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000"
 
 interface TeamMember {
   id: string
@@ -17,71 +19,132 @@ interface TeamMember {
   joinedAt: string
 }
 
+interface Organization {
+  id: string
+  name: string
+  role: TeamMember["role"]
+}
+
+async function apiFetch(path: string, init: RequestInit = {}) {
+  const token = localStorage.getItem("auth_token")
+  const response = await fetch(`${API_URL}/api/organizations${path}`, {
+    ...init,
+    headers: {
+      "Content-Type": "application/json",
+      Authorization: `Bearer ${token}`,
+      ...init.headers,
+    },
+  })
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}))
+    throw new Error(typeof error.detail === "string" ? error.detail : "Request failed")
+  }
+  return response.json()
+}
+
 export default function UsersPage() {
   const router = useRouter()
   const { toast } = useToast()
-  const [members, setMembers] = useState<TeamMember[]>([
-    {
-      id: "1",
-      name: "John Doe",
-      email: "john@example.com",
-      role: "owner",
-      status: "active",
-      joinedAt: "2025-01-15",
-    },
-    {
-      id: "2",
-      name: "Jane Smith",
-      email: "jane@example.com",
-      role: "admin",
-      status: "active",
-      joinedAt: "2025-01-20",
-    },
-    {
-      id: "3",
-      name: "Bob Johnson",
-      email: "bob@example.com",
-      role: "member",
-      status: "pending",
-      joinedAt: "2026-01-02",
-    },
-  ])
+  const [organization, setOrganization] = useState<Organization | null>(null)
+  const [members, setMembers] = useState<TeamMember[]>([])
   const [newEmail, setNewEmail] = useState("")
   const [isInviting, setIsInviting] = useState(false)
 
+  const loadMembers = useCallback(async (org: Organization) => {
+    const [active, invites] = await Promise.all([
+      apiFetch(`/${org.id}/members`),
+      // Only admins and owners can see pending invites
+      org.role === "member" ? Promise.resolve([]) : apiFetch(`/${org.id}/invites`),
+    ])
+    setMembers([
+      ...active.map((m: any) => ({
+        id: m.user_id,
+        name: m.full_name || m.email?.split("@")[0] || "Unknown",
+        email: m.email ?? "",
+        role: m.role,
+        status: "active" as const,
+        joinedAt: m.created_at.split("T")[0],
+      })),
+      ...invites.map((i: any) => ({
+        id: i.id,
+        name: i.email.split("@")[0],
+        email: i.email,
+        role: i.role,
+        status: "pending" as const,
+        joinedAt: i.created_at.split("T")[0],
+      })),
+    ])
+  }, [])
+
+  useEffect(() => {
+    if (!localStorage.getItem("auth_token")) {
+      router.push("/login")
+      return
+    }
+    const load = async () => {
+      try {
+        const organizations: Organization[] = await apiFetch("/")
+        // Everyone starts with a team of their own
+        const org =
+          organizations[0] ?? (await apiFetch("/", { method: "POST", body: JSON.stringify({ name: "My Team" }) }))
+        setOrganization(org)
+        await loadMembers(org)
+      } catch (error) {
+        toast({ title: "Error", description: "Failed to load team members", variant: "destructive" })
+      }
+    }
+    load()
+  }, [router, toast, loadMembers])
+
   const handleInvite = async () => {
-    if (!newEmail.trim()) {
+    // Several addresses may be separated by commas or spaces
+    const emails = newEmail.split(/[\s,;]+/).filter(Boolean)
+    if (emails.length === 0) {
       toast({ title: "Error", description: "Please enter an email address", variant: "destructive" })
       return
     }
+    if (!organization) return
 
     setIsInviting(true)
     try {
-      await new Promise((resolve) => setTimeout(resolve, 1000))
-      toast({ title: "Success", description: `Invitation sent to ${newEmail}` })
+      if (emails.length === 1) {
+        await apiFetch(`/${organization.id}/invites`, {
+          method: "POST",
+          body: JSON.stringify({ email: emails[0] }),
+        })
+        toast({ title: "Success", description: `Invitation sent to ${emails[0]}` })
+      } else {
+        const result = await apiFetch(`/${organization.id}/invites/batch`, {
+          method: "POST",
+          body: JSON.stringify({ invites: emails.map((email) => ({ email })) }),
+        })
+        toast({
+          title: result.failed ? "Some invitations failed" : "Success",
+          description: `${result.succeeded} of ${emails.length} invitations sent`,
+          variant: result.failed ? "destructive" : undefined,
+        })
+      }
       setNewEmail("")
-      // Add pending member
-      setMembers([
-        ...members,
-        {
-          id: Date.now().toString(),
-          name: newEmail.split("@")[0],
-          email: newEmail,
-          role: "member",
-          status: "pending",
-          joinedAt: new Date().toISOString().split("T")[0],
-        },
-      ])
+      await loadMembers(organization)
     } catch (error) {
-      toast({ title: "Error", description: "Failed to send invitation", variant: "destructive" })
+      const description = error instanceof Error ? error.message : "Failed to send invitation"
+      toast({ title: "Error", description, variant: "destructive" })
     } finally {
       setIsInviting(false)
     }
   }
 
-  const handleRemove = (id: string) => {
-    setMembers(members.filter((m) => m.id !== id))
-    toast({ title: "Success", description: "Member removed" })
+  const handleRemove = async (member: TeamMember) => {
+    if (!organization) return
+    try {
+      const path = member.status === "pending" ? "invites" : "members"
+      await apiFetch(`/${organization.id}/${path}/${member.id}`, { method: "DELETE" })
+      setMembers(members.filter((m) => m.id !== member.id))
+      toast({ title: "Success", description: member.status === "pending" ? "Invitation revoked" : "Member removed" })
+    } catch (error) {
+      const description = error instanceof Error ? error.message : "Failed to remove member"
+      toast({ title: "Error", description, variant: "destructive" })
+    }
   }
 
   const getRoleBadge = (role: string) => {
@@ -110,13 +173,13 @@ export default function UsersPage() {
         <CardContent>
           <div className="flex gap-2">
             <Input
-              type="email"
-              placeholder="name@example.com"
+              type="text"
+              placeholder="name@example.com, other@example.com"
               value={newEmail}
               onChange={(e) => setNewEmail(e.target.value)}
               disabled={isInviting}
             />
-            <Button onClick={handleInvite} disabled={isInviting} className="gap-2">
+            <Button onClick={handleInvite} disabled={isInviting || !organization} className="gap-2">
               <Plus className="w-4 h-4" />
               {isInviting ? "Sending..." : "Invite"}
             </Button>
@@ -173,7 +236,7 @@ export default function UsersPage() {
                     <td className="px-6 py-4 text-muted-foreground text-sm hidden md:table-cell">{member.joinedAt}</td>
                     <td className="px-6 py-4 text-right">
                       <button
-                        onClick={() => handleRemove(member.id)}
+                        onClick={() => handleRemove(member)}
                         className="text-destructive hover:bg-destructive/10 p-2 rounded-lg transition-colors"
                       >
                         <Trash2 className="w-4 h-4" />
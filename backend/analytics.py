@@ -0,0 +1,195 @@
+"""Subscription and revenue metrics shared by every worker.
+
+Write paths report each created subscription and status change here, and
+the matching counters in subscription_metrics are adjusted with one atomic
+increment, so admin reads never scan the subscriptions table and every
+worker answers with the same numbers (each caches them for at most
+ANALYTICS_CACHE_SECONDS). MRR is active subscriptions per product
+multiplied by the catalog price. The worker holding the analytics lease
+rebuilds the status and active counters from a full scan every
+ANALYTICS_RECOMPUTE_SECONDS to correct drift, e.g. from an increment that
+failed. Transition counts are history and are never recomputed.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+try:
+    from .repository import subscription_repo, subscription_metric_repo, scheduler_lease_repo
+    from .catalog import product_catalog
+except ImportError:
+    from repository import subscription_repo, subscription_metric_repo, scheduler_lease_repo
+    from catalog import product_catalog
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_RECOMPUTE_SECONDS = float(os.getenv("ANALYTICS_RECOMPUTE_SECONDS", "3600"))
+# Delay before the recompute requested after a failed increment
+ANALYTICS_RECOMPUTE_DEBOUNCE_SECONDS = float(os.getenv("ANALYTICS_RECOMPUTE_DEBOUNCE_SECONDS", "60"))
+ANALYTICS_SCAN_PAGE_SIZE = int(os.getenv("ANALYTICS_SCAN_PAGE_SIZE", "1000"))
+ANALYTICS_CACHE_SECONDS = float(os.getenv("ANALYTICS_CACHE_SECONDS", "5"))
+LEASE_NAME = "subscription-analytics"
+
+# Counter name prefixes; recompute replaces everything under RECOMPUTED_PREFIXES
+STATUS, ACTIVE, TRANSITION, META = "status:", "active:", "transition:", "meta:"
+RECOMPUTED_PREFIXES = [STATUS, ACTIVE, META]
+
+Transition = Tuple[str, Optional[str], str]
+
+
+def _status(value) -> Optional[str]:
+    return getattr(value, "value", value)
+
+
+def _under(counters: Dict[str, int], prefix: str) -> Dict[str, int]:
+    return {name[len(prefix):]: value for name, value in counters.items() if name.startswith(prefix)}
+
+
+class SubscriptionMetrics:
+    """Shared counters over the subscriptions table"""
+
+    def __init__(self):
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._counters: Optional[Dict[str, int]] = None
+        self._loaded_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._pending_recompute: Optional[asyncio.Task] = None
+        self._recompute_lock = asyncio.Lock()
+
+    async def record_created(self, subscription: Dict) -> None:
+        await self.record_transitions([(subscription["product_id"], None, subscription["status"])])
+
+    async def record_transition(self, product_id: str, old_status, new_status) -> None:
+        await self.record_transitions([(product_id, old_status, new_status)])
+
+    async def record_transitions(self, transitions: Iterable[Transition]) -> None:
+        """Apply (product_id, old_status, new_status) changes with one increment"""
+        deltas: Counter = Counter()
+        for product_id, old_status, new_status in transitions:
+            old_status, new_status = _status(old_status), _status(new_status)
+            if old_status == new_status:
+                continue
+            if old_status is not None:
+                deltas[STATUS + old_status] -= 1
+                if old_status == "active":
+                    deltas[ACTIVE + product_id] -= 1
+            deltas[STATUS + new_status] += 1
+            if new_status == "active":
+                deltas[ACTIVE + product_id] += 1
+            deltas[f"{TRANSITION}{old_status or 'new'}->{new_status}"] += 1
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        try:
+            await subscription_metric_repo.add(deltas)
+        except Exception:
+            # The write itself succeeded; let a recompute catch the counters up
+            logger.warning("Could not update subscription metrics", exc_info=True)
+            self.request_recompute()
+        self._counters = None
+
+    async def products(self) -> List[Dict]:
+        """Active subscriptions and MRR per catalog product"""
+        active_by_product = _under(await self._load(), ACTIVE)
+        rows = []
+        for product in await product_catalog.list_products():
+            active = active_by_product.get(product["id"], 0)
+            rows.append({
+                "product_id": product["id"],
+                "name": product["name"],
+                "price": product["price"],
+                "active_subscriptions": active,
+                "mrr": round(active * product["price"], 2),
+            })
+        return rows
+
+    async def summary(self) -> Dict:
+        counters = await self._load()
+        products = await self.products()
+        status_counts = {status: count for status, count in _under(counters, STATUS).items() if count}
+        recomputed_at = counters.get(META + "recomputed_at")
+        return {
+            "mrr": round(sum(row["mrr"] for row in products), 2),
+            "active_subscriptions": status_counts.get("active", 0),
+            "status_counts": status_counts,
+            "transitions": _under(counters, TRANSITION),
+            "recomputed_at": (
+                datetime.fromtimestamp(recomputed_at, timezone.utc) if recomputed_at is not None else None
+            ),
+        }
+
+    async def recompute(self) -> None:
+        """Rebuild the status and active counters from a full keyset scan of subscriptions"""
+        async with self._recompute_lock:
+            counts: Counter = Counter()
+            cursor = None
+            while True:
+                rows, cursor = await subscription_repo.page(
+                    ANALYTICS_SCAN_PAGE_SIZE, cursor=cursor, columns="id,created_at,product_id,status"
+                )
+                for row in rows:
+                    counts[STATUS + row["status"]] += 1
+                    if row["status"] == "active":
+                        counts[ACTIVE + row["product_id"]] += 1
+                if cursor is None:
+                    break
+            counts[META + "recomputed_at"] = int(time.time())
+            await subscription_metric_repo.replace(RECOMPUTED_PREFIXES, dict(counts))
+            self._counters = None
+
+    def request_recompute(self) -> None:
+        """Schedule a debounced recompute after an increment that failed"""
+        if self._pending_recompute is not None and not self._pending_recompute.done():
+            return
+
+        async def run():
+            await asyncio.sleep(ANALYTICS_RECOMPUTE_DEBOUNCE_SECONDS)
+            await self._safe_recompute()
+
+        self._pending_recompute = asyncio.create_task(run())
+
+    def start(self) -> None:
+        """Recompute every ANALYTICS_RECOMPUTE_SECONDS while holding the analytics lease"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._pending_recompute):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = self._pending_recompute = None
+
+    async def _load(self) -> Dict[str, int]:
+        if self._counters is None or time.monotonic() - self._loaded_at > ANALYTICS_CACHE_SECONDS:
+            self._counters = await subscription_metric_repo.all()
+            self._loaded_at = time.monotonic()
+        return self._counters
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # The lease outlives one interval, so its holder renews it before anyone else can take it
+                leader = await scheduler_lease_repo.acquire(
+                    LEASE_NAME, self.holder, ANALYTICS_RECOMPUTE_SECONDS * 1.5
+                )
+            except Exception:
+                logger.warning("Could not take the analytics lease", exc_info=True)
+                leader = False
+            if leader:
+                await self._safe_recompute()
+            await asyncio.sleep(ANALYTICS_RECOMPUTE_SECONDS)
+
+    async def _safe_recompute(self) -> None:
+        try:
+            await self.recompute()
+        except Exception:
+            logger.exception("Subscription metrics recompute failed")
+
+
+subscription_metrics = SubscriptionMetrics()
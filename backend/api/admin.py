@@ -1,56 +1,164 @@
-from fastapi import APIRouter, HTTPException, status, Header, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
+from datetime import datetime
+import os
 try:
-    from ..models import UserProfile, ProductCreate, Product
-    from ..utils import verify_jwt_token, get_supabase_admin
+    from ..models import (
+        UserProfile, UserProfilePage, UserRole, ProductCreate, Product,
+        Subscription, SubscriptionStatus,
+        ProductBatchRequest, BatchOperation, BatchItemResult, BatchResult,
+    )
+    from ..utils import MAX_BATCH_SIZE
+    from ..security import get_admin_user
+    from ..repository import (
+        profile_repo, product_repo, subscription_repo, stripe_event_repo, decode_cursor,
+    )
+    from ..catalog import product_catalog
+    from ..export import stream_export, EXPORT_MEDIA_TYPES
+    from ..webhooks import webhook_pipeline
+    from ..billing import provision_in_background
+    from ..analytics import subscription_metrics
+    from ..serialization import model_response
 except ImportError:
-    from models import UserProfile, ProductCreate, Product
-    from utils import verify_jwt_token, get_supabase_admin
+    from models import (
+        UserProfile, UserProfilePage, UserRole, ProductCreate, Product,
+        Subscription, SubscriptionStatus,
+        ProductBatchRequest, BatchOperation, BatchItemResult, BatchResult,
+    )
+    from utils import MAX_BATCH_SIZE
+    from security import get_admin_user
+    from repository import (
+        profile_repo, product_repo, subscription_repo, stripe_event_repo, decode_cursor,
+    )
+    from catalog import product_catalog
+    from export import stream_export, EXPORT_MEDIA_TYPES
+    from webhooks import webhook_pipeline
+    from billing import provision_in_background
+    from analytics import subscription_metrics
+    from serialization import model_response
 
 router = APIRouter()
 
-async def get_admin_user(authorization: Optional[str] = Header(None)):
-    """Verify admin access"""
-    if not authorization:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing authorization header"
-        )
-    
-    try:
-        token = authorization.replace("Bearer ", "")
-        payload = verify_jwt_token(token)
-        user_id = payload["sub"]
-
-        supabase_admin = get_supabase_admin()
-        
-        # Check if user is admin
-        profile = supabase_admin.table("profiles").select("role").eq("id", user_id).single().execute()
-        if profile.data["role"] != "admin":
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Admin access required"
-            )
-        
-        return user_id
-    except Exception as e:
+ADMIN_USERS_PAGE_SIZE = int(os.getenv("ADMIN_USERS_PAGE_SIZE", "50"))
+ADMIN_USERS_MAX_PAGE_SIZE = int(os.getenv("ADMIN_USERS_MAX_PAGE_SIZE", "500"))
+PROFILE_FIELDS = tuple(UserProfile.model_fields)
+SUBSCRIPTION_FIELDS = tuple(Subscription.model_fields)
+
+def parse_fields(fields: Optional[str], allowed: tuple) -> List[str]:
+    """Turn a comma-separated field list into the columns to select.
+
+    id and created_at are always included because the cursor needs them.
+    """
+    if not fields:
+        return list(allowed)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token or insufficient permissions"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
         )
+    return ["id", "created_at"] + [f for f in requested if f not in ("id", "created_at")]
+
+def product_fields(request: ProductCreate) -> dict:
+    return {
+        "name": request.name,
+        "description": request.description,
+        "price": request.price,
+        "features": request.features or []
+    }
+
+def provision_after_write(previous: Optional[dict], product: dict) -> None:
+    """Schedule Stripe price provisioning for a saved product"""
+    # Stripe prices are immutable, so a new amount needs a new price
+    if previous and previous.get("stripe_price_id") and previous["price"] != product["price"]:
+        provision_in_background(product, replace_price_id=previous["stripe_price_id"])
+    elif not product.get("stripe_price_id"):
+        provision_in_background(product)
+
+def export_response(fetch_page, columns: List[str], fmt: str, cursor: Optional[str], name: str) -> StreamingResponse:
+    """Validate the cursor up front, then stream the export"""
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return StreamingResponse(
+        stream_export(fetch_page, columns, fmt, cursor),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
 
-@router.get("/users", response_model=List[UserProfile])
-async def list_all_users(admin_id: str = Depends(get_admin_user)):
-    """List all users - admin only"""
+@router.get("/users", response_model=UserProfilePage, response_model_exclude_unset=True)
+async def list_all_users(
+    limit: int = Query(ADMIN_USERS_PAGE_SIZE, ge=1, le=ADMIN_USERS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated profile fields to return"),
+    role: Optional[UserRole] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    admin_id: str = Depends(get_admin_user)
+):
+    """List users one keyset page at a time, newest first - admin only"""
+    columns = parse_fields(fields, PROFILE_FIELDS)
+    role_value = role.value if role else None
     try:
-        supabase_admin = get_supabase_admin()
-        response = supabase_admin.table("profiles").select("*").execute()
-        return response.data
+        items, next_cursor = await profile_repo.page(
+            limit,
+            cursor=cursor,
+            columns=",".join(columns),
+            role=role_value,
+            created_after=created_after,
+            created_before=created_before,
+        )
+        total_estimate = await profile_repo.count_estimate(role_value, created_after, created_before)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    return model_response(
+        UserProfilePage,
+        {"items": items, "next_cursor": next_cursor, "total_estimate": total_estimate},
+        exclude_unset=True,
+    )
+
+@router.get("/export/users")
+async def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated profile fields to export"),
+    role: Optional[UserRole] = None,
+    admin_id: str = Depends(get_admin_user)
+):
+    """Stream every profile as NDJSON or CSV, resumable by cursor - admin only"""
+    columns = parse_fields(fields, PROFILE_FIELDS)
+    select = ",".join(columns)
+    role_value = role.value if role else None
+
+    async def fetch_page(limit, page_cursor):
+        return await profile_repo.page(limit, cursor=page_cursor, columns=select, role=role_value)
+
+    return export_response(fetch_page, columns, format, cursor, "users")
+
+@router.get("/export/subscriptions")
+async def export_subscriptions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated subscription fields to export"),
+    subscription_status: Optional[SubscriptionStatus] = Query(None, alias="status"),
+    admin_id: str = Depends(get_admin_user)
+):
+    """Stream every subscription as NDJSON or CSV, resumable by cursor - admin only"""
+    columns = parse_fields(fields, SUBSCRIPTION_FIELDS)
+    select = ",".join(columns)
+    status_value = subscription_status.value if subscription_status else None
+
+    async def fetch_page(limit, page_cursor):
+        return await subscription_repo.page(limit, cursor=page_cursor, columns=select, status=status_value)
+
+    return export_response(fetch_page, columns, format, cursor, "subscriptions")
 
 @router.post("/products", response_model=Product)
 async def create_product(
@@ -59,22 +167,103 @@ async def create_product(
 ):
     """Create a new product - admin only"""
     try:
-        supabase_admin = get_supabase_admin()
-        product_data = {
-            "name": request.name,
-            "description": request.description,
-            "price": request.price,
-            "features": request.features or []
-        }
-        
-        response = supabase_admin.table("products").insert(product_data).execute()
-        return response.data[0]
+        product = await product_repo.create(product_fields(request))
+        product = await product_catalog.apply_upsert(product)
+        provision_after_write(None, product)
+        return product
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
 
+@router.post("/products/batch", response_model=BatchResult)
+async def batch_products(
+    request: ProductBatchRequest,
+    admin_id: str = Depends(get_admin_user)
+):
+    """Apply many create/update/delete operations as bulk statements - admin only"""
+    operations = request.operations
+    if len(operations) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {MAX_BATCH_SIZE} operations"
+        )
+
+    results = {}
+    creates, updates, deletes = [], [], []
+    seen_ids = set()
+    for index, item in enumerate(operations):
+        if item.op != BatchOperation.CREATE and not item.id:
+            results[index] = BatchItemResult(index=index, ok=False, error="id is required")
+        elif item.op != BatchOperation.DELETE and item.data is None:
+            results[index] = BatchItemResult(index=index, ok=False, id=item.id, error="data is required")
+        elif item.id and item.id in seen_ids:
+            results[index] = BatchItemResult(index=index, ok=False, id=item.id, error="Duplicate id in batch")
+        else:
+            if item.id:
+                seen_ids.add(item.id)
+            {"create": creates, "update": updates, "delete": deletes}[item.op.value].append((index, item))
+
+    def fail(group, error):
+        for index, item in group:
+            results[index] = BatchItemResult(index=index, ok=False, id=item.id, error=error)
+
+    # One existence check covers every update and delete
+    existing = set()
+    if updates or deletes:
+        try:
+            existing = set(await product_repo.existing_ids([item.id for _, item in updates + deletes]))
+        except Exception as e:
+            fail(updates + deletes, str(e))
+            updates, deletes = [], []
+    fail([(i, item) for i, item in updates + deletes if item.id not in existing], "Product not found")
+    updates = [(i, item) for i, item in updates if item.id in existing]
+    deletes = [(i, item) for i, item in deletes if item.id in existing]
+
+    saved, previous, deleted_ids = [], {}, []
+    if creates:
+        try:
+            rows = await product_repo.bulk_create([product_fields(item.data) for _, item in creates])
+            for (index, _), row in zip(creates, rows):
+                results[index] = BatchItemResult(index=index, ok=True, id=row["id"])
+            saved.extend(rows)
+        except Exception as e:
+            fail(creates, str(e))
+    if updates:
+        try:
+            for _, item in updates:
+                previous[item.id] = await product_catalog.get(item.id)
+            rows = await product_repo.bulk_update([
+                {"id": item.id, **product_fields(item.data)} for _, item in updates
+            ])
+            updated_ids = {row["id"] for row in rows}
+            for index, item in updates:
+                if item.id in updated_ids:
+                    results[index] = BatchItemResult(index=index, ok=True, id=item.id)
+            # Deleted since the existence check above
+            fail([(i, item) for i, item in updates if item.id not in updated_ids], "Product not found")
+            saved.extend(rows)
+        except Exception as e:
+            fail(updates, str(e))
+    if deletes:
+        try:
+            rows = await product_repo.bulk_delete([item.id for _, item in deletes])
+            deleted_ids = [row["id"] for row in rows]
+            for index, item in deletes:
+                results[index] = BatchItemResult(index=index, ok=True, id=item.id)
+        except Exception as e:
+            fail(deletes, str(e))
+
+    if saved or deleted_ids:
+        products = await product_catalog.apply_batch(saved, deleted_ids)
+        for product in products:
+            provision_after_write(previous.get(product["id"]), product)
+
+    ordered = [results[index] for index in range(len(operations))]
+    succeeded = sum(1 for result in ordered if result.ok)
+    return BatchResult(results=ordered, succeeded=succeeded, failed=len(ordered) - succeeded)
+
 @router.put("/products/{product_id}", response_model=Product)
 async def update_product(
     product_id: str,
@@ -83,16 +272,11 @@ async def update_product(
 ):
     """Update a product - admin only"""
     try:
-        supabase_admin = get_supabase_admin()
-        update_data = {
-            "name": request.name,
-            "description": request.description,
-            "price": request.price,
-            "features": request.features or []
-        }
-        
-        response = supabase_admin.table("products").update(update_data).eq("id", product_id).execute()
-        return response.data[0]
+        previous = await product_catalog.get(product_id)
+        product = await product_repo.update(product_id, product_fields(request))
+        product = await product_catalog.apply_upsert(product)
+        provision_after_write(previous, product)
+        return product
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -106,11 +290,79 @@ async def delete_product(
 ):
     """Delete a product - admin only"""
     try:
-        supabase_admin = get_supabase_admin()
-        supabase_admin.table("products").delete().eq("id", product_id).execute()
+        await product_repo.delete(product_id)
+        await product_catalog.apply_delete(product_id)
         return {"message": "Product deleted successfully"}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+
+@router.get("/webhooks/stats")
+async def webhook_stats(admin_id: str = Depends(get_admin_user)):
+    """Webhook pipeline queue depth and counters - admin only"""
+    return webhook_pipeline.stats()
+
+@router.get("/webhooks/dead-letter")
+async def list_dead_letter_events(
+    limit: int = Query(100, ge=1, le=1000),
+    admin_id: str = Depends(get_admin_user)
+):
+    """List Stripe events that exhausted their retries - admin only"""
+    try:
+        return await stripe_event_repo.list_by_status("dead", limit)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.post("/webhooks/dead-letter/{event_id}/replay")
+async def replay_dead_letter_event(
+    event_id: str,
+    admin_id: str = Depends(get_admin_user)
+):
+    """Re-queue a dead-lettered Stripe event - admin only"""
+    try:
+        await webhook_pipeline.replay(event_id)
+        return {"message": "Event queued for replay"}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/analytics/summary")
+async def analytics_summary(admin_id: str = Depends(get_admin_user)):
+    """MRR, subscription status counts and transition counts - admin only"""
+    try:
+        return await subscription_metrics.summary()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/analytics/products")
+async def analytics_products(admin_id: str = Depends(get_admin_user)):
+    """Active subscriptions and MRR per product - admin only"""
+    try:
+        return await subscription_metrics.products()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.post("/analytics/recompute")
+async def analytics_recompute(admin_id: str = Depends(get_admin_user)):
+    """Rebuild the metrics from a full scan - admin only"""
+    try:
+        await subscription_metrics.recompute()
+        return await subscription_metrics.summary()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
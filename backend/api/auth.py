@@ -1,22 +1,37 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.responses import JSONResponse
 try:
     from ..models import AuthRegisterRequest, AuthLoginRequest, AuthResponse
-    from ..utils import create_jwt_token, verify_jwt_token, get_supabase_anon, get_supabase_admin
+    from ..utils import create_jwt_token, get_supabase_anon
+    from ..instrumentation import call_supabase
+    from ..repository import profile_repo
+    from ..security import Principal, get_principal
+    from ..ratelimit import (
+        limit_by_ip, login_ip_limit, login_email_limit, register_ip_limit, auth_upstream,
+    )
 except ImportError:
     from models import AuthRegisterRequest, AuthLoginRequest, AuthResponse
-    from utils import create_jwt_token, verify_jwt_token, get_supabase_anon, get_supabase_admin
+    from utils import create_jwt_token, get_supabase_anon
+    from instrumentation import call_supabase
+    from repository import profile_repo
+    from security import Principal, get_principal
+    from ratelimit import (
+        limit_by_ip, login_ip_limit, login_email_limit, register_ip_limit, auth_upstream,
+    )
 
 router = APIRouter()
 
-@router.post("/register", response_model=AuthResponse)
+@router.post(
+    "/register",
+    response_model=AuthResponse,
+    dependencies=[Depends(limit_by_ip(register_ip_limit)), Depends(auth_upstream)],
+)
 async def register(request: AuthRegisterRequest):
     """Register a new user with email and password"""
     try:
         supabase = get_supabase_anon()
-        supabase_admin = get_supabase_admin()
         # Create user in Supabase Auth
-        auth_response = supabase.auth.sign_up({
+        auth_response = await call_supabase("auth", "sign_up", supabase.auth.sign_up, {
             "email": request.email,
             "password": request.password,
         })
@@ -30,12 +45,12 @@ async def register(request: AuthRegisterRequest):
         user_id = auth_response.user.id
         
         # Create user profile in database
-        supabase_admin.table("profiles").insert({
+        await profile_repo.create({
             "id": user_id,
             "email": request.email,
             "full_name": request.full_name,
             "role": "user"
-        }).execute()
+        })
         
         # Generate JWT token
         access_token = create_jwt_token(user_id, request.email)
@@ -54,14 +69,19 @@ async def register(request: AuthRegisterRequest):
             detail=str(e)
         )
 
-@router.post("/login", response_model=AuthResponse)
+@router.post(
+    "/login",
+    response_model=AuthResponse,
+    dependencies=[Depends(limit_by_ip(login_ip_limit)), Depends(auth_upstream)],
+)
 async def login(request: AuthLoginRequest):
     """Login with email and password"""
+    # Per-account budget slows credential stuffing spread across many IPs
+    await login_email_limit.hit(request.email.lower())
     try:
         supabase = get_supabase_anon()
-        supabase_admin = get_supabase_admin()
         # Authenticate with Supabase
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await call_supabase("auth", "sign_in", supabase.auth.sign_in_with_password, {
             "email": request.email,
             "password": request.password
         })
@@ -75,8 +95,7 @@ async def login(request: AuthLoginRequest):
         user_id = auth_response.user.id
         
         # Fetch user profile
-        profile_response = supabase_admin.table("profiles").select("*").eq("id", user_id).single().execute()
-        profile = profile_response.data
+        profile = await profile_repo.get(user_id)
         
         # Generate JWT token
         access_token = create_jwt_token(user_id, request.email)
@@ -96,21 +115,7 @@ async def login(request: AuthLoginRequest):
         )
 
 @router.post("/refresh")
-async def refresh_token(authorization: str = None):
+async def refresh_token(principal: Principal = Depends(get_principal)):
     """Refresh JWT token"""
-    if not authorization:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing authorization header"
-        )
-    
-    try:
-        token = authorization.replace("Bearer ", "")
-        payload = verify_jwt_token(token)
-        new_token = create_jwt_token(payload["sub"], payload["email"])
-        return {"access_token": new_token, "token_type": "bearer"}
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
+    new_token = create_jwt_token(principal.user_id, principal.email)
+    return {"access_token": new_token, "token_type": "bearer"}
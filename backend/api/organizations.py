@@ -0,0 +1,314 @@
+from fastapi import APIRouter, HTTPException, status, Depends
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+import os
+try:
+    from ..models import (
+        Organization, OrganizationCreate, OrganizationMember, OrganizationMemberUpdate,
+        OrganizationInvite, OrganizationInviteCreate, OrganizationInviteBatchRequest,
+        BatchItemResult, BatchResult,
+    )
+    from ..utils import MAX_BATCH_SIZE
+    from ..repository import organization_repo, organization_invite_repo, LastOwnerError
+    from ..memberships import membership_index
+    from ..security import Principal, get_principal, require_organization_role
+    from ..serialization import model_response
+except ImportError:
+    from models import (
+        Organization, OrganizationCreate, OrganizationMember, OrganizationMemberUpdate,
+        OrganizationInvite, OrganizationInviteCreate, OrganizationInviteBatchRequest,
+        BatchItemResult, BatchResult,
+    )
+    from utils import MAX_BATCH_SIZE
+    from repository import organization_repo, organization_invite_repo, LastOwnerError
+    from memberships import membership_index
+    from security import Principal, get_principal, require_organization_role
+    from serialization import model_response
+
+router = APIRouter()
+
+ORGANIZATION_INVITE_TTL_DAYS = int(os.getenv("ORGANIZATION_INVITE_TTL_DAYS", "7"))
+
+INVITE_ERROR_STATUS = {
+    "Only owners can invite owners": status.HTTP_403_FORBIDDEN,
+    "Already a member": status.HTTP_409_CONFLICT,
+    "Invite already pending": status.HTTP_409_CONFLICT,
+}
+
+is_member = require_organization_role("member")
+is_admin = require_organization_role("admin")
+is_owner = require_organization_role("owner")
+
+
+def _caller_email(principal: Principal) -> str:
+    if not principal.email:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token has no email address"
+        )
+    return principal.email.lower()
+
+
+def _check_owner_change(caller_role: str, *roles: Optional[str]) -> None:
+    """Only owners may grant, change or remove the owner role"""
+    if caller_role != "owner" and "owner" in roles:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only owners can change owner memberships"
+        )
+
+
+def _last_owner_conflict(error: LastOwnerError) -> HTTPException:
+    # Enforced by a trigger on organization_members, so concurrent changes cannot race it
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=str(error)
+    )
+
+
+@router.get("/", response_model=List[Organization])
+async def list_organizations(principal: Principal = Depends(get_principal)):
+    """Organizations the caller belongs to, with the caller's role"""
+    try:
+        organizations = await organization_repo.list_for_user(principal.user_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return model_response(List[Organization], organizations)
+
+@router.post("/", response_model=Organization, status_code=status.HTTP_201_CREATED)
+async def create_organization(request: OrganizationCreate, principal: Principal = Depends(get_principal)):
+    """Create an organization owned by the caller"""
+    try:
+        organization = await organization_repo.create(request.name, principal.user_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    await membership_index.apply(organization["id"], principal.user_id, "owner")
+    return model_response(Organization, {**organization, "role": "owner"}, status_code=status.HTTP_201_CREATED)
+
+@router.get("/invites", response_model=List[OrganizationInvite])
+async def list_my_invites(principal: Principal = Depends(get_principal)):
+    """Pending invites addressed to the caller's email"""
+    invites = await organization_invite_repo.list_for_email(_caller_email(principal))
+    return model_response(List[OrganizationInvite], invites)
+
+@router.post("/invites/{invite_id}/accept", response_model=Organization)
+async def accept_invite(invite_id: str, principal: Principal = Depends(get_principal)):
+    """Join the organization an invite to the caller's email is for"""
+    membership = await organization_invite_repo.accept(invite_id, principal.user_id, _caller_email(principal))
+    if membership is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invite not found or expired"
+        )
+    await membership_index.apply(membership["organization_id"], principal.user_id, membership["role"])
+    organization = await organization_repo.get(membership["organization_id"])
+    return model_response(Organization, {**organization, "role": membership["role"]})
+
+@router.get("/{organization_id}", response_model=Organization)
+async def get_organization(organization_id: str, role: str = Depends(is_member)):
+    """Organization details - members only"""
+    organization = await organization_repo.get(organization_id)
+    if organization is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Organization not found"
+        )
+    return model_response(Organization, {**organization, "role": role})
+
+@router.patch("/{organization_id}", response_model=Organization)
+async def rename_organization(organization_id: str, request: OrganizationCreate, role: str = Depends(is_admin)):
+    """Rename an organization - admins and owners"""
+    try:
+        organization = await organization_repo.update(organization_id, {"name": request.name})
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return model_response(Organization, {**organization, "role": role})
+
+@router.delete("/{organization_id}")
+async def delete_organization(organization_id: str, role: str = Depends(is_owner)):
+    """Delete an organization with its memberships and invites - owners only"""
+    members = await organization_repo.memberships(organization_id)
+    try:
+        await organization_repo.delete(organization_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    await membership_index.drop_organization(organization_id, [row["user_id"] for row in members])
+    return {"message": "Organization deleted successfully"}
+
+@router.get("/{organization_id}/members", response_model=List[OrganizationMember])
+async def list_members(organization_id: str, role: str = Depends(is_member)):
+    """Members with their names, emails and roles - members only"""
+    members = await organization_repo.members(organization_id)
+    return model_response(List[OrganizationMember], members)
+
+@router.patch("/{organization_id}/members/{user_id}", response_model=OrganizationMember)
+async def update_member_role(
+    organization_id: str,
+    user_id: str,
+    request: OrganizationMemberUpdate,
+    role: str = Depends(is_admin)
+):
+    """Change a member's role - admins and owners; only owners manage owners"""
+    current = await membership_index.role(organization_id, user_id)
+    if current is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Member not found"
+        )
+    _check_owner_change(role, current, request.role.value)
+    try:
+        member = await organization_repo.update_member(organization_id, user_id, request.role.value)
+    except LastOwnerError as e:
+        raise _last_owner_conflict(e)
+    if member is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Member not found"
+        )
+    await membership_index.apply(organization_id, user_id, member["role"])
+    return model_response(OrganizationMember, member)
+
+@router.delete("/{organization_id}/members/{user_id}")
+async def remove_member(
+    organization_id: str,
+    user_id: str,
+    role: str = Depends(is_member),
+    principal: Principal = Depends(get_principal)
+):
+    """Remove a member - admins and owners, or members leaving themselves"""
+    current = await membership_index.role(organization_id, user_id)
+    if current is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Member not found"
+        )
+    if user_id != principal.user_id:
+        if role == "member":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Requires the admin role in this organization"
+            )
+        _check_owner_change(role, current)
+    try:
+        await organization_repo.remove_member(organization_id, user_id)
+    except LastOwnerError as e:
+        raise _last_owner_conflict(e)
+    await membership_index.apply(organization_id, user_id, None)
+    return {"message": "Member removed successfully"}
+
+@router.get("/{organization_id}/invites", response_model=List[OrganizationInvite])
+async def list_invites(organization_id: str, role: str = Depends(is_admin)):
+    """Pending invites - admins and owners"""
+    invites = await organization_invite_repo.list_pending(organization_id)
+    return model_response(List[OrganizationInvite], invites)
+
+async def _create_invites(
+    organization_id: str, role: str, inviter_id: str, invites: List[OrganizationInviteCreate]
+) -> Dict[int, BatchItemResult]:
+    """Validate and insert invites with one lookup per check and one insert"""
+    results: Dict[int, BatchItemResult] = {}
+    candidates = []
+    seen = set()
+    for index, invite in enumerate(invites):
+        email = invite.email.lower()
+        if email in seen:
+            results[index] = BatchItemResult(index=index, ok=False, error="Duplicate email in batch")
+        elif role != "owner" and invite.role.value == "owner":
+            results[index] = BatchItemResult(index=index, ok=False, error="Only owners can invite owners")
+        else:
+            seen.add(email)
+            candidates.append((index, email, invite.role.value))
+    if not candidates:
+        return results
+
+    try:
+        member_emails = {
+            (member["email"] or "").lower() for member in await organization_repo.members(organization_id)
+        }
+        pending = set(await organization_invite_repo.pending_emails(organization_id, [c[1] for c in candidates]))
+    except Exception as e:
+        for index, _, _ in candidates:
+            results[index] = BatchItemResult(index=index, ok=False, error=str(e))
+        return results
+
+    rows, invited = [], []
+    expires_at = (datetime.now(timezone.utc) + timedelta(days=ORGANIZATION_INVITE_TTL_DAYS)).isoformat()
+    for index, email, invite_role in candidates:
+        if email in member_emails:
+            results[index] = BatchItemResult(index=index, ok=False, error="Already a member")
+        elif email in pending:
+            results[index] = BatchItemResult(index=index, ok=False, error="Invite already pending")
+        else:
+            invited.append(index)
+            rows.append({
+                "organization_id": organization_id,
+                "email": email,
+                "role": invite_role,
+                "invited_by": inviter_id,
+                "expires_at": expires_at,
+            })
+    if rows:
+        try:
+            created = await organization_invite_repo.bulk_create(organization_id, rows)
+            for index, row in zip(invited, created):
+                results[index] = BatchItemResult(index=index, ok=True, id=row["id"])
+        except Exception as e:
+            for index in invited:
+                results[index] = BatchItemResult(index=index, ok=False, error=str(e))
+    return results
+
+@router.post("/{organization_id}/invites", response_model=BatchItemResult, status_code=status.HTTP_201_CREATED)
+async def create_invite(
+    organization_id: str,
+    request: OrganizationInviteCreate,
+    role: str = Depends(is_admin),
+    principal: Principal = Depends(get_principal)
+):
+    """Invite an email address - admins and owners"""
+    result = (await _create_invites(organization_id, role, principal.user_id, [request]))[0]
+    if not result.ok:
+        raise HTTPException(
+            status_code=INVITE_ERROR_STATUS.get(result.error, status.HTTP_400_BAD_REQUEST),
+            detail=result.error
+        )
+    return result
+
+@router.post("/{organization_id}/invites/batch", response_model=BatchResult)
+async def create_invites_batch(
+    organization_id: str,
+    request: OrganizationInviteBatchRequest,
+    role: str = Depends(is_admin),
+    principal: Principal = Depends(get_principal)
+):
+    """Invite many addresses with bulk statements - admins and owners"""
+    if len(request.invites) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {MAX_BATCH_SIZE} invites"
+        )
+    results = await _create_invites(organization_id, role, principal.user_id, request.invites)
+    ordered = [results[index] for index in range(len(request.invites))]
+    succeeded = sum(1 for result in ordered if result.ok)
+    return BatchResult(results=ordered, succeeded=succeeded, failed=len(ordered) - succeeded)
+
+@router.delete("/{organization_id}/invites/{invite_id}")
+async def revoke_invite(organization_id: str, invite_id: str, role: str = Depends(is_admin)):
+    """Revoke a pending invite - admins and owners"""
+    if not await organization_invite_repo.revoke(organization_id, invite_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invite not found"
+        )
+    return {"message": "Invite revoked successfully"}
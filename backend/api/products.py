@@ -1,36 +1,81 @@
-from fastapi import APIRouter, HTTPException, status, Header
+from fastapi import APIRouter, HTTPException, status, Header, Response, Query, Request
 from typing import List, Optional
+import os
 try:
-    from ..models import Product, ProductCreate
-    from ..utils import verify_jwt_token, get_supabase_anon, get_supabase_admin
+    from ..models import Product, ProductCreate, ProductSort
+    from ..catalog import product_catalog
+    from ..serialization import json_response
+    from ..http_cache import cached_response, content_etag, row_etag, http_date, CACHE_CONTROL_PUBLIC
 except ImportError:
-    from models import Product, ProductCreate
-    from utils import verify_jwt_token, get_supabase_anon, get_supabase_admin
+    from models import Product, ProductCreate, ProductSort
+    from catalog import product_catalog
+    from serialization import json_response
+    from http_cache import cached_response, content_etag, row_etag, http_date, CACHE_CONTROL_PUBLIC
 
 router = APIRouter()
 
+PRODUCT_SEARCH_PAGE_SIZE = int(os.getenv("PRODUCT_SEARCH_PAGE_SIZE", "50"))
+PRODUCT_SEARCH_MAX_PAGE_SIZE = int(os.getenv("PRODUCT_SEARCH_MAX_PAGE_SIZE", "500"))
+
 @router.get("/", response_model=List[Product])
-async def list_products():
+async def list_products(request: Request):
     """List all products - public endpoint"""
     try:
-        supabase = get_supabase_anon()
-        response = supabase.table("products").select("*").execute()
-        return response.data
+        body, etag = await product_catalog.list_snapshot()
+        return cached_response(request, etag, body, CACHE_CONTROL_PUBLIC)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
 
+@router.get("/search", response_model=List[Product])
+async def search_products(
+    request: Request,
+    q: Optional[str] = Query(None, description="Words that must all appear in the name or description"),
+    prefix: Optional[str] = Query(None, description="Match words in the name or description starting with this"),
+    features: List[str] = Query([], alias="feature", description="Required feature; repeat for several"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    currency: Optional[str] = Query(None, min_length=3, max_length=3),
+    sort: ProductSort = ProductSort.CREATED_AT,
+    limit: int = Query(PRODUCT_SEARCH_PAGE_SIZE, ge=1, le=PRODUCT_SEARCH_MAX_PAGE_SIZE),
+):
+    """Filter, search and sort the catalog - public endpoint"""
+    # Results only change with the catalog snapshot, which the index belongs to
+    _, catalog_etag = await product_catalog.list_snapshot()
+    index = product_catalog.index
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    etag = content_etag(f"{catalog_etag}?{query}".encode())
+    return cached_response(request, etag, lambda: json_response(index.search(
+        text=q,
+        prefix=prefix,
+        features=features,
+        min_price=min_price,
+        max_price=max_price,
+        currency=currency,
+        sort=sort.value.lstrip("-"),
+        descending=sort.value.startswith("-"),
+        limit=limit,
+    )), CACHE_CONTROL_PUBLIC)
+
 @router.get("/{product_id}", response_model=Product)
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request):
     """Get product by ID - public endpoint"""
     try:
-        supabase = get_supabase_anon()
-        response = supabase.table("products").select("*").eq("id", product_id).single().execute()
-        return response.data
+        product = await product_catalog.get(product_id)
     except Exception as e:
+        product = None
+    if product is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
+    # Catalog entries are validated when loaded
+    return cached_response(
+        request,
+        row_etag([product]),
+        lambda: json_response(product),
+        CACHE_CONTROL_PUBLIC,
+        http_date(product["updated_at"]),
+    )
@@ -1,146 +1,170 @@
-from fastapi import APIRouter, HTTPException, status, Header, Depends, Request
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Request
 import os
-import stripe
+import json
+import hashlib
+from datetime import datetime, timezone
 from typing import Optional
 try:
     from ..models import Subscription, SubscriptionUpdate
-    from ..utils import verify_jwt_token, get_supabase_anon, get_supabase_admin
+    from ..instrumentation import call_stripe
+    from ..utils import get_stripe
+    from ..security import Principal, get_principal
+    from ..repository import subscription_repo
+    from ..catalog import product_catalog
+    from ..webhooks import webhook_pipeline
+    from ..billing import checkout_price
+    from ..analytics import subscription_metrics
+    from ..ratelimit import limit_by_user, checkout_user_limit, stripe_upstream
+    from ..idempotency import checkout_idempotency
+    from ..serialization import json_response
+    from ..events import subscription_events
 except ImportError:
     from models import Subscription, SubscriptionUpdate
-    from utils import verify_jwt_token, get_supabase_anon, get_supabase_admin
+    from instrumentation import call_stripe
+    from utils import get_stripe
+    from security import Principal, get_principal
+    from repository import subscription_repo
+    from catalog import product_catalog
+    from webhooks import webhook_pipeline
+    from billing import checkout_price
+    from analytics import subscription_metrics
+    from ratelimit import limit_by_user, checkout_user_limit, stripe_upstream
+    from idempotency import checkout_idempotency
+    from serialization import json_response
+    from events import subscription_events
 
 router = APIRouter()
 
-# Initialize Stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
-async def get_current_user(authorization: Optional[str] = Header(None)):
-    """Extract and verify current user from JWT token"""
-    if not authorization:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing authorization header"
-        )
-    
-    try:
-        token = authorization.replace("Bearer ", "")
-        payload = verify_jwt_token(token)
-        return payload["sub"]
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-
-@router.post("/create-checkout-session")
+@router.post(
+    "/create-checkout-session",
+    dependencies=[Depends(limit_by_user(checkout_user_limit)), Depends(stripe_upstream)],
+)
 async def create_checkout_session(
     product_id: str,
-    user_id: str = Depends(get_current_user)
+    principal: Principal = Depends(get_principal),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    """Create a Stripe checkout session for subscription"""
-    try:
-        supabase = get_supabase_anon()
-        supabase_admin = get_supabase_admin()
-        # Get product from database
-        product_response = supabase.table("products").select("*").eq("id", product_id).single().execute()
-        product = product_response.data
+    """Create a Stripe checkout session; retries with the same Idempotency-Key replay the first session"""
+    user_id = principal.user_id
+    stripe_idempotency_key = None
+    if idempotency_key:
+        stripe_idempotency_key = hashlib.sha256(f"checkout:{user_id}:{idempotency_key}".encode()).hexdigest()
+
+    async def checkout():
+        try:
+            # Get product from the catalog cache
+            product = await product_catalog.get(product_id)
+            if product is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Product not found"
+                )
         
-        # Get or create Stripe product
-        if not product.get("stripe_price_id"):
-            # Create Stripe product
-            stripe_product = stripe.Product.create(
-                name=product["name"],
-                description=product["description"]
-            )
-            
-            # Create Stripe price
-            stripe_price = stripe.Price.create(
-                product=stripe_product.id,
-                unit_amount=int(product["price"] * 100),  # Convert to cents
-                currency="usd",
-                recurring={"interval": "month"}
-            )
-            
-            # Update product with Stripe price ID
-            supabase_admin.table("products").update({
-                "stripe_price_id": stripe_price.id
-            }).eq("id", product_id).execute()
-            
-            price_id = stripe_price.id
-        else:
-            price_id = product["stripe_price_id"]
+            # Prices are normally provisioned when the product is saved; this
+            # replaces one that is missing or still charges an old amount
+            price_id = await checkout_price(product)
         
-        # Get user email
-        user_profile = supabase.table("profiles").select("email").eq("id", user_id).single().execute()
+            # The token carries the email; fall back to the profile if it does not
+            customer_email = principal.email
+            if not customer_email:
+                customer_email = (await principal.profile())["email"]
         
-        # Create checkout session
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price": price_id,
-                    "quantity": 1,
-                }
-            ],
-            mode="subscription",
-            customer_email=user_profile.data["email"],
-            success_url=f"{FRONTEND_URL}/dashboard/subscriptions?success=true",
-            cancel_url=f"{FRONTEND_URL}/pricing?canceled=true",
-            metadata={
-                "user_id": user_id,
-                "product_id": product_id
-            }
-        )
+            # Create checkout session
+            session = await call_stripe(
+                "checkout.Session.create",
+                get_stripe().checkout.Session.create,
+                payment_method_types=["card"],
+                line_items=[
+                    {
+                        "price": price_id,
+                        "quantity": 1,
+                    }
+                ],
+                mode="subscription",
+                customer_email=customer_email,
+                success_url=f"{FRONTEND_URL}/dashboard/subscriptions?success=true",
+                cancel_url=f"{FRONTEND_URL}/pricing?canceled=true",
+                metadata={
+                    "user_id": user_id,
+                    "product_id": product_id
+                },
+                # Retries that reach another worker still get the same session
+                idempotency_key=stripe_idempotency_key,
+            )
         
-        return {"session_id": session.id, "url": session.url}
+            return json_response({"session_id": session.id, "url": session.url})
     
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+    return await checkout_idempotency.run(idempotency_key, user_id, {"product_id": product_id}, checkout)
+
+async def apply_stripe_status(stripe_subscription_id: str, update_data: dict):
+    """Update subscriptions linked to a Stripe subscription and record the transitions"""
+    before = await subscription_repo.list_by_stripe_id(stripe_subscription_id, columns="id,product_id,status")
+    rows = await subscription_repo.update_by_stripe_id(stripe_subscription_id, update_data)
+    await subscription_metrics.record_transitions(
+        (row["product_id"], row["status"], update_data["status"]) for row in before
+    )
+    subscription_events.publish_rows(rows)
+
+@webhook_pipeline.handler("customer.subscription.updated")
+async def handle_subscription_updated(event: dict):
+    """Mirror a Stripe subscription status change"""
+    subscription = event["data"]["object"]
+    
+    # Update subscription status in database
+    if subscription["status"] == "active":
+        status_update = "active"
+    elif subscription["status"] == "canceled":
+        status_update = "canceled"
+    elif subscription["status"] == "past_due":
+        status_update = "past_due"
+    else:
+        status_update = "inactive"
+    
+    update_data = {
+        "status": status_update,
+        "stripe_subscription_id": subscription["id"]
+    }
+    # Renewals move the period forward; the lifecycle scheduler keys off end_date
+    if subscription.get("current_period_end"):
+        update_data["end_date"] = datetime.fromtimestamp(subscription["current_period_end"], timezone.utc).isoformat()
+    await apply_stripe_status(subscription["id"], update_data)
+
+@webhook_pipeline.handler("customer.subscription.deleted")
+async def handle_subscription_deleted(event: dict):
+    """Mark a deleted Stripe subscription as canceled"""
+    subscription = event["data"]["object"]
+    await apply_stripe_status(subscription["id"], {
+        "status": "canceled"
+    })
 
 @router.post("/webhook")
 async def stripe_webhook(request: Request):
-    """Handle Stripe webhook events"""
+    """Verify, persist and acknowledge a Stripe webhook event.
+
+    The event is applied by the background webhook pipeline; redeliveries
+    of an already recorded event id are acknowledged without further work.
+    """
     try:
-        supabase_admin = get_supabase_admin()
         payload = await request.body()
         sig_header = request.headers.get("stripe-signature")
         
-        event = stripe.Webhook.construct_event(
+        get_stripe().Webhook.construct_event(
             payload, sig_header, STRIPE_WEBHOOK_SECRET
         )
         
-        # Handle different event types
-        if event["type"] == "customer.subscription.updated":
-            subscription = event["data"]["object"]
-            
-            # Update subscription status in database
-            if subscription["status"] == "active":
-                status_update = "active"
-            elif subscription["status"] == "canceled":
-                status_update = "canceled"
-            elif subscription["status"] == "past_due":
-                status_update = "past_due"
-            else:
-                status_update = "inactive"
-            
-            supabase_admin.table("subscriptions").update({
-                "status": status_update,
-                "stripe_subscription_id": subscription["id"]
-            }).eq("stripe_subscription_id", subscription["id"]).execute()
-        
-        elif event["type"] == "customer.subscription.deleted":
-            subscription = event["data"]["object"]
-            supabase_admin.table("subscriptions").update({
-                "status": "canceled"
-            }).eq("stripe_subscription_id", subscription["id"]).execute()
-        
-        return {"status": "success"}
+        accepted = await webhook_pipeline.submit(json.loads(payload))
+        return {"status": "success", "duplicate": not accepted}
     
     except Exception as e:
         raise HTTPException(
@@ -1,70 +1,156 @@
-from fastapi import APIRouter, HTTPException, status, Header, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Request
 from typing import List, Optional
 try:
-    from ..models import Subscription, SubscriptionCreate, SubscriptionUpdate
-    from ..utils import verify_jwt_token, get_supabase_admin
+    from ..models import (
+        Subscription, SubscriptionCreate, SubscriptionUpdate,
+        SubscriptionBatchRequest, BatchItemResult, BatchResult, StreamTicket,
+    )
+    from ..utils import MAX_BATCH_SIZE, STREAM_TICKET_TTL_SECONDS, create_stream_ticket
+    from ..repository import subscription_repo
+    from ..security import Principal, get_principal, get_current_user, get_stream_principal
+    from ..analytics import subscription_metrics
+    from ..serialization import model_response
+    from ..idempotency import subscription_idempotency
+    from ..events import subscription_events, EventStreamResponse, SSE_MAX_CONNECTIONS
+    from ..http_cache import cached_response, row_etag
 except ImportError:
-    from models import Subscription, SubscriptionCreate, SubscriptionUpdate
-    from utils import verify_jwt_token, get_supabase_admin
+    from models import (
+        Subscription, SubscriptionCreate, SubscriptionUpdate,
+        SubscriptionBatchRequest, BatchItemResult, BatchResult, StreamTicket,
+    )
+    from utils import MAX_BATCH_SIZE, STREAM_TICKET_TTL_SECONDS, create_stream_ticket
+    from repository import subscription_repo
+    from security import Principal, get_principal, get_current_user, get_stream_principal
+    from analytics import subscription_metrics
+    from serialization import model_response
+    from idempotency import subscription_idempotency
+    from events import subscription_events, EventStreamResponse, SSE_MAX_CONNECTIONS
+    from http_cache import cached_response, row_etag
 from datetime import datetime, timedelta
 
 router = APIRouter()
 
-async def get_current_user(authorization: Optional[str] = Header(None)):
-    """Extract and verify current user from JWT token"""
-    if not authorization:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing authorization header"
-        )
-    
-    try:
-        token = authorization.replace("Bearer ", "")
-        payload = verify_jwt_token(token)
-        return payload["sub"]
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-
 @router.get("/", response_model=List[Subscription])
-async def list_user_subscriptions(user_id: str = Depends(get_current_user)):
+async def list_user_subscriptions(request: Request, user_id: str = Depends(get_current_user)):
     """List subscriptions for current user"""
     try:
-        supabase = get_supabase_admin()
-        response = supabase.table("subscriptions").select("*").eq("user_id", user_id).execute()
-        return response.data
+        subscriptions = await subscription_repo.list_for_user(user_id)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    return cached_response(
+        request, row_etag(subscriptions), lambda: model_response(List[Subscription], subscriptions)
+    )
+
+@router.post("/stream/ticket", response_model=StreamTicket)
+async def create_stream_ticket_for_user(principal: Principal = Depends(get_principal)):
+    """Single-use ticket for opening the event stream without a token in the URL"""
+    return StreamTicket(
+        ticket=create_stream_ticket(principal.user_id, principal.email),
+        expires_in=STREAM_TICKET_TTL_SECONDS,
+    )
+
+@router.get("/stream")
+async def stream_subscription_updates(principal: Principal = Depends(get_stream_principal)):
+    """Server-sent events carrying the caller's subscription changes as they happen"""
+    if not subscription_events.can_open(principal.user_id):
+        at_user_cap = subscription_events.connections < SSE_MAX_CONNECTIONS
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS if at_user_cap else status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open subscription streams",
+            headers={"Retry-After": "5"},
+        )
+    return EventStreamResponse(principal.user_id)
 
 @router.post("/", response_model=Subscription)
 async def create_subscription(
     request: SubscriptionCreate,
+    user_id: str = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Create a new subscription; retries with the same Idempotency-Key replay the first result"""
+    async def create():
+        try:
+            subscription_data = {
+                "user_id": user_id,
+                "product_id": request.product_id,
+                "status": "active",
+                "start_date": datetime.utcnow().isoformat(),
+                "end_date": (datetime.utcnow() + timedelta(days=30)).isoformat()
+            }
+            
+            subscription = await subscription_repo.create(subscription_data)
+            await subscription_metrics.record_created(subscription)
+            subscription_events.publish(user_id, [subscription])
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        return model_response(Subscription, subscription)
+
+    return await subscription_idempotency.run(idempotency_key, user_id, request.model_dump(mode="json"), create)
+
+@router.patch("/batch", response_model=BatchResult)
+async def batch_update_subscriptions(
+    request: SubscriptionBatchRequest,
     user_id: str = Depends(get_current_user)
 ):
-    """Create a new subscription"""
-    try:
-        supabase = get_supabase_admin()
-        subscription_data = {
-            "user_id": user_id,
-            "product_id": request.product_id,
-            "status": "active",
-            "start_date": datetime.utcnow().isoformat(),
-            "end_date": (datetime.utcnow() + timedelta(days=30)).isoformat()
-        }
-        
-        response = supabase.table("subscriptions").insert(subscription_data).execute()
-        return response.data[0]
-    except Exception as e:
+    """Change the status of many subscriptions, one statement per target status.
+
+    Ownership is enforced by the update's own user_id filter, so no
+    read-before-write is needed; the update returns each row's previous
+    status for the metrics.
+    """
+    updates = request.updates
+    if len(updates) > MAX_BATCH_SIZE:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {MAX_BATCH_SIZE} updates"
         )
 
+    results = {}
+    changed_rows = []
+    by_status = {}
+    seen_ids = set()
+    for index, item in enumerate(updates):
+        if item.id in seen_ids:
+            results[index] = BatchItemResult(index=index, ok=False, id=item.id, error="Duplicate id in batch")
+            continue
+        seen_ids.add(item.id)
+        by_status.setdefault(item.status, []).append((index, item.id))
+
+    for new_status, items in by_status.items():
+        update_data = {"status": new_status}
+        if new_status == "canceled":
+            update_data["end_date"] = datetime.utcnow().isoformat()
+        try:
+            rows = await subscription_repo.update_many_for_user([i for _, i in items], user_id, update_data)
+            changed = {row["id"] for row in rows}
+            changed_rows.extend(rows)
+            for index, subscription_id in items:
+                if subscription_id in changed:
+                    results[index] = BatchItemResult(index=index, ok=True, id=subscription_id)
+                else:
+                    results[index] = BatchItemResult(
+                        index=index, ok=False, id=subscription_id, error="Subscription not found"
+                    )
+        except Exception as e:
+            for index, subscription_id in items:
+                results[index] = BatchItemResult(index=index, ok=False, id=subscription_id, error=str(e))
+
+    if changed_rows:
+        await subscription_metrics.record_transitions(
+            (row["product_id"], row["previous_status"], row["status"]) for row in changed_rows
+        )
+        subscription_events.publish(user_id, changed_rows)
+
+    ordered = [results[index] for index in range(len(updates))]
+    succeeded = sum(1 for result in ordered if result.ok)
+    return BatchResult(results=ordered, succeeded=succeeded, failed=len(ordered) - succeeded)
+
 @router.patch("/{subscription_id}", response_model=Subscription)
 async def update_subscription(
     subscription_id: str,
@@ -73,11 +159,10 @@ async def update_subscription(
 ):
     """Update a subscription (cancel, etc.)"""
     try:
-        supabase = get_supabase_admin()
         # Verify ownership
-        subscription = supabase.table("subscriptions").select("*").eq("id", subscription_id).single().execute()
+        subscription = await subscription_repo.get(subscription_id)
         
-        if subscription.data["user_id"] != user_id:
+        if subscription["user_id"] != user_id:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to update this subscription"
@@ -87,8 +172,10 @@ async def update_subscription(
         if request.status == "canceled":
             update_data["end_date"] = datetime.utcnow().isoformat()
         
-        response = supabase.table("subscriptions").update(update_data).eq("id", subscription_id).execute()
-        return response.data[0]
+        updated = await subscription_repo.update(subscription_id, update_data)
+        await subscription_metrics.record_transition(subscription["product_id"], subscription["status"], updated["status"])
+        subscription_events.publish(user_id, [updated])
+        return updated
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
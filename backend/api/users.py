@@ -1,53 +1,47 @@
-from fastapi import APIRouter, HTTPException, status, Header, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from typing import Optional
+import asyncio
 try:
-    from ..models import UserProfile, UpdateUserRequest
-    from ..utils import verify_jwt_token, get_supabase_anon
+    from ..models import UserProfile, UpdateUserRequest, DashboardSummary
+    from ..repository import profile_repo, subscription_repo
+    from ..catalog import product_catalog
+    from ..security import Principal, get_principal
+    from ..serialization import model_response
+    from ..http_cache import cached_response, row_etag, http_date
 except ImportError:
-    from models import UserProfile, UpdateUserRequest
-    from utils import verify_jwt_token, get_supabase_anon
+    from models import UserProfile, UpdateUserRequest, DashboardSummary
+    from repository import profile_repo, subscription_repo
+    from catalog import product_catalog
+    from security import Principal, get_principal
+    from serialization import model_response
+    from http_cache import cached_response, row_etag, http_date
 
 router = APIRouter()
 
-async def get_current_user(authorization: Optional[str] = Header(None)):
-    """Extract and verify current user from JWT token"""
-    if not authorization:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing authorization header"
-        )
-    
-    try:
-        token = authorization.replace("Bearer ", "")
-        payload = verify_jwt_token(token)
-        return payload["sub"]
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-
 @router.get("/me", response_model=UserProfile)
-async def get_current_user_profile(user_id: str = Depends(get_current_user)):
+async def get_current_user_profile(request: Request, principal: Principal = Depends(get_principal)):
     """Get current user profile"""
     try:
-        supabase = get_supabase_anon()
-        response = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
-        return response.data
-    except Exception as e:
+        profile = await principal.profile()
+    except LookupError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User profile not found"
         )
+    return cached_response(
+        request,
+        row_etag([profile]),
+        lambda: model_response(UserProfile, profile),
+        last_modified=http_date(profile.get("updated_at")),
+    )
 
 @router.put("/me", response_model=UserProfile)
 async def update_current_user(
     request: UpdateUserRequest,
-    user_id: str = Depends(get_current_user)
+    principal: Principal = Depends(get_principal)
 ):
     """Update current user profile"""
     try:
-        supabase = get_supabase_anon()
         update_data = {}
         if request.full_name:
             update_data["full_name"] = request.full_name
@@ -60,10 +54,50 @@ async def update_current_user(
                 detail="No fields to update"
             )
         
-        response = supabase.table("profiles").update(update_data).eq("id", user_id).execute()
-        return response.data[0]
+        profile = await profile_repo.update(principal.user_id, update_data)
+        principal.set_profile(profile)
+        return profile
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+
+@router.get("/me/dashboard", response_model=DashboardSummary)
+async def get_dashboard_summary(request: Request, principal: Principal = Depends(get_principal)):
+    """Profile, subscriptions with their products and counts in one response"""
+    try:
+        # Warming the catalog alongside keeps the product joins below in memory
+        profile, subscriptions, (_, catalog_etag) = await asyncio.gather(
+            principal.profile(),
+            subscription_repo.list_for_user(principal.user_id),
+            product_catalog.list_snapshot(),
+        )
+    except LookupError:
+        # Only a missing profile is a 404; storage failures surface as 5xx
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User profile not found"
+        )
+
+    status_counts = {}
+    monthly_spend = 0.0
+    joined = []
+    for subscription in subscriptions:
+        product = await product_catalog.get(subscription["product_id"])
+        status_counts[subscription["status"]] = status_counts.get(subscription["status"], 0) + 1
+        if subscription["status"] == "active" and product:
+            monthly_spend += product["price"]
+        joined.append({**subscription, "product": product})
+
+    # Products are covered by the catalog's ETag
+    return cached_response(request, row_etag([profile, *subscriptions], catalog_etag), lambda: model_response(
+        DashboardSummary, {
+            "profile": profile,
+            "subscriptions": joined,
+            "total_subscriptions": len(subscriptions),
+            "active_subscriptions": status_counts.get("active", 0),
+            "status_counts": status_counts,
+            "monthly_spend": round(monthly_spend, 2),
+        },
+    ))
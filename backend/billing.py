@@ -0,0 +1,161 @@
+"""Stripe price provisioning kept off the checkout hot path.
+
+Admin product writes provision the Stripe product/price in the background,
+and `python -m backend.billing` backfills existing products. Checkout calls
+checkout_price, which checks that the stored price still charges the
+product's current amount and currency, and provisions a new one in line if
+the background run has not finished or failed. Stripe prices are
+immutable, so each worker looks up what a price charges only once. A
+per-product lock makes concurrent callers in one worker share a single
+provisioning run, and Stripe idempotency keys stop workers from creating
+duplicate prices.
+"""
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+try:
+    from .cache import TTLCache
+    from .utils import get_stripe
+    from .instrumentation import call_stripe
+    from .repository import product_repo
+    from .catalog import product_catalog
+except ImportError:
+    from cache import TTLCache
+    from utils import get_stripe
+    from instrumentation import call_stripe
+    from repository import product_repo
+    from catalog import product_catalog
+
+logger = logging.getLogger(__name__)
+
+STRIPE_CURRENCY = os.getenv("STRIPE_CURRENCY", "usd").lower()
+STRIPE_PRICE_CACHE_SIZE = int(os.getenv("STRIPE_PRICE_CACHE_SIZE", "10000"))
+
+# Per-product [lock, holders and waiters]; dropped when the count reaches zero
+_price_locks: Dict[str, List] = {}
+_background_tasks: Set[asyncio.Task] = set()
+# Stripe price id -> (unit_amount, currency); prices never change, so no TTL
+_price_terms = TTLCache(maxsize=STRIPE_PRICE_CACHE_SIZE)
+
+
+def _unit_amount(product: Dict) -> int:
+    return int(round(product["price"] * 100))  # Convert to cents
+
+
+@asynccontextmanager
+async def _product_lock(product_id: str) -> AsyncIterator[None]:
+    entry = _price_locks.get(product_id)
+    if entry is None:
+        entry = _price_locks[product_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _price_locks[product_id]
+
+
+async def _price_charges(price_id: str) -> Tuple[int, str]:
+    """(unit_amount, currency) of a Stripe price"""
+    terms = _price_terms.get(price_id)
+    if terms is None:
+        price = await call_stripe("Price.retrieve", get_stripe().Price.retrieve, price_id)
+        terms = (price.unit_amount, price.currency)
+        _price_terms.set(price_id, terms)
+    return terms
+
+
+async def checkout_price(product: Dict) -> str:
+    """The product's Stripe price id, replaced first if it does not charge the product's price"""
+    price_id = product.get("stripe_price_id")
+    if not price_id:
+        return await ensure_stripe_price(product)
+    if await _price_charges(price_id) == (_unit_amount(product), STRIPE_CURRENCY):
+        return price_id
+    return await ensure_stripe_price(product, replace_price_id=price_id)
+
+
+async def ensure_stripe_price(product: Dict, replace_price_id: Optional[str] = None) -> str:
+    """Return the product's Stripe price id, creating it at most once.
+
+    replace_price_id is the product's previous price when its amount
+    changed; the new price is attached to the same Stripe product.
+    """
+    if product.get("stripe_price_id") and not replace_price_id:
+        return product["stripe_price_id"]
+
+    product_id = product["id"]
+    stripe = get_stripe()
+    async with _product_lock(product_id):
+        current = await product_catalog.get(product_id) or product
+        if current.get("stripe_price_id") and current["stripe_price_id"] != replace_price_id:
+            return current["stripe_price_id"]
+
+        if replace_price_id:
+            old_price = await call_stripe("Price.retrieve", stripe.Price.retrieve, replace_price_id)
+            stripe_product_id = old_price.product
+        else:
+            stripe_product = await call_stripe(
+                "Product.create",
+                stripe.Product.create,
+                name=current["name"],
+                description=current.get("description"),
+                metadata={"product_id": product_id},
+                idempotency_key=f"product-{product_id}",
+            )
+            stripe_product_id = stripe_product.id
+
+        amount = _unit_amount(current)
+        stripe_price = await call_stripe(
+            "Price.create",
+            stripe.Price.create,
+            product=stripe_product_id,
+            unit_amount=amount,
+            currency=STRIPE_CURRENCY,
+            recurring={"interval": "month"},
+            idempotency_key=f"price-{product_id}-{amount}",
+        )
+        _price_terms.set(stripe_price.id, (amount, STRIPE_CURRENCY))
+
+        updated = await product_repo.update(product_id, {"stripe_price_id": stripe_price.id})
+        await product_catalog.apply_upsert(updated)
+        return stripe_price.id
+
+
+def provision_in_background(product: Dict, replace_price_id: Optional[str] = None) -> None:
+    """Schedule ensure_stripe_price without waiting for it"""
+    async def run():
+        try:
+            await ensure_stripe_price(product, replace_price_id)
+        except Exception:
+            logger.exception("Stripe price provisioning failed for product %s", product["id"])
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def sync_all_prices() -> Dict[str, int]:
+    """Provision Stripe prices for every product that lacks one"""
+    await product_catalog.refresh()
+    result = {"provisioned": 0, "failed": 0, "skipped": 0}
+    for product in await product_catalog.list_products():
+        if product.get("stripe_price_id"):
+            result["skipped"] += 1
+            continue
+        try:
+            await ensure_stripe_price(product)
+            result["provisioned"] += 1
+        except Exception:
+            logger.exception("Stripe price provisioning failed for product %s", product["id"])
+            result["failed"] += 1
+    return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(sync_all_prices()))
@@ -0,0 +1,182 @@
+"""In-process product catalog cache.
+
+The catalog is small and only changes through the admin routes, so each
+worker keeps a copy in memory: the validated product list, an id index,
+the list response pre-serialized to JSON bytes with its ETag, and a search
+index (product_index.ProductIndex) rebuilt with them. Admin mutations update the
+local copy write-through and bump a shared version counter; other workers
+poll that counter and reload when it moves. A TTL bounds staleness if the
+counter cannot be read.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import orjson
+try:
+    from .models import Product
+    from .serialization import type_adapter
+    from .repository import product_repo, cache_version_repo
+    from .product_index import ProductIndex
+    from .http_cache import content_etag
+except ImportError:
+    from models import Product
+    from serialization import type_adapter
+    from repository import product_repo, cache_version_repo
+    from product_index import ProductIndex
+    from http_cache import content_etag
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL_SECONDS = float(os.getenv("CATALOG_TTL_SECONDS", "300"))
+CATALOG_VERSION_POLL_SECONDS = float(os.getenv("CATALOG_VERSION_POLL_SECONDS", "5"))
+CATALOG_VERSION_KEY = "products"
+
+
+class ProductCatalog:
+    """Versioned, TTL-bounded cache of the products table"""
+
+    def __init__(self, ttl: float = CATALOG_TTL_SECONDS, poll_interval: float = CATALOG_VERSION_POLL_SECONDS):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._products: List[Dict] = []
+        self._by_id: Dict[str, Dict] = {}
+        self._list_body: bytes = b"[]"
+        self._list_etag = content_etag(self._list_body)
+        self._index = ProductIndex([])
+        self._version: Optional[int] = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    async def list_products(self) -> List[Dict]:
+        """Return the validated product list"""
+        await self._ensure_fresh()
+        return self._products
+
+    async def list_body(self) -> bytes:
+        """Return the product list serialized as a JSON array"""
+        await self._ensure_fresh()
+        return self._list_body
+
+    async def list_snapshot(self) -> Tuple[bytes, str]:
+        """Return the serialized product list and its ETag"""
+        await self._ensure_fresh()
+        return self._list_body, self._list_etag
+
+    async def get(self, product_id: str) -> Optional[Dict]:
+        """Return a single product, or None if it is not in the catalog"""
+        await self._ensure_fresh()
+        return self._by_id.get(product_id)
+
+    @property
+    def index(self) -> ProductIndex:
+        """Search index of the current snapshot; read after an awaited accessor"""
+        return self._index
+
+    def invalidate(self) -> None:
+        """Force a reload on the next read"""
+        self._loaded = False
+
+    async def refresh(self) -> None:
+        """Reload the catalog from the database"""
+        async with self._lock:
+            await self._reload()
+
+    async def apply_upsert(self, row: Dict) -> Dict:
+        """Write-through a created or updated product row"""
+        product = _validate(row)
+        async with self._lock:
+            if self._loaded:
+                self._by_id[product["id"]] = product
+                self._rebuild(list(self._by_id.values()))
+            await self._publish()
+        return product
+
+    async def apply_delete(self, product_id: str) -> None:
+        """Write-through a deleted product"""
+        async with self._lock:
+            if self._loaded and self._by_id.pop(product_id, None) is not None:
+                self._rebuild(list(self._by_id.values()))
+            await self._publish()
+
+    async def apply_batch(self, rows: List[Dict], deleted_ids: List[str]) -> List[Dict]:
+        """Write-through a batch of changes with a single version bump"""
+        products = [_validate(row) for row in rows]
+        async with self._lock:
+            if self._loaded:
+                for product in products:
+                    self._by_id[product["id"]] = product
+                for product_id in deleted_ids:
+                    self._by_id.pop(product_id, None)
+                self._rebuild(list(self._by_id.values()))
+            await self._publish()
+        return products
+
+    async def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._loaded and now - self._loaded_at < self.ttl:
+            if now - self._checked_at < self.poll_interval:
+                return
+        async with self._lock:
+            now = time.monotonic()
+            if not self._loaded or now - self._loaded_at >= self.ttl:
+                await self._reload()
+                return
+            if now - self._checked_at < self.poll_interval:
+                return
+            self._checked_at = now
+            remote = await self._remote_version()
+            if remote is not None and remote != self._version:
+                await self._reload()
+
+    async def _reload(self) -> None:
+        # Read the version first so a bump racing the load triggers another reload
+        version = await self._remote_version()
+        rows = await product_repo.list_all()
+        self._rebuild([_validate(row) for row in rows])
+        self._version = version
+        self._loaded_at = self._checked_at = time.monotonic()
+        self._loaded = True
+
+    def _rebuild(self, products: List[Dict]) -> None:
+        products.sort(key=lambda p: (p["created_at"], p["id"]))
+        self._products = products
+        self._by_id = {p["id"]: p for p in products}
+        self._list_body = orjson.dumps(products)
+        self._list_etag = content_etag(self._list_body)
+        self._index = ProductIndex(products)
+
+    async def _publish(self) -> None:
+        previous = self._version
+        try:
+            version = await cache_version_repo.bump(CATALOG_VERSION_KEY)
+        except Exception:
+            logger.warning("Could not bump catalog version; other workers rely on TTL", exc_info=True)
+            return
+        if previous is not None and version == previous + 1:
+            self._version = version
+        else:
+            # Another worker changed the catalog since our last load
+            self._loaded = False
+
+    async def _remote_version(self) -> Optional[int]:
+        try:
+            return await cache_version_repo.get(CATALOG_VERSION_KEY)
+        except Exception:
+            logger.warning("Could not read catalog version", exc_info=True)
+            return None
+
+
+def _validate(row: Dict) -> Dict:
+    adapter = type_adapter(Product)
+    return adapter.dump_python(adapter.validate_python(row), mode="json")
+
+
+product_catalog = ProductCatalog()
@@ -0,0 +1,235 @@
+"""In-process fan-out of subscription changes to server-sent event streams.
+
+Write paths call publish() with the changed rows; each row is encoded once
+and appended to the buffer of every stream its owner has open on this
+worker. An idle stream costs one small object, one pending future and a
+task watching for disconnect, so a worker can hold tens of thousands of
+idle dashboards.
+A single task marks all streams for a heartbeat comment every
+SSE_HEARTBEAT_SECONDS, so proxies keep the connections open, and ends
+streams older than SSE_MAX_STREAM_SECONDS: uvicorn waits for open responses
+before shutting down, and reconnecting clients spread over the workers
+again after a deploy. A client that
+falls more than SSE_BUFFER_SIZE events behind gets a "resync" event and
+should refetch its list.
+
+Events only reach streams on the worker that made the change. With several
+workers a dashboard can miss a change made elsewhere; it still sees the
+next change made on its own worker, and refetches on "resync" and after
+reconnecting.
+
+EventStreamResponse writes a stream straight to the ASGI connection:
+StreamingResponse would add a task group, a second task and a generator
+per connection.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Mapping, Optional, Set
+import orjson
+from fastapi import Response
+try:
+    from .instrumentation import Counter, REGISTRY, register_collector, gauge_lines
+except ImportError:
+    from instrumentation import Counter, REGISTRY, register_collector, gauge_lines
+
+logger = logging.getLogger(__name__)
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "25"))
+SSE_BUFFER_SIZE = int(os.getenv("SSE_BUFFER_SIZE", "16"))
+SSE_MAX_CONNECTIONS = int(os.getenv("SSE_MAX_CONNECTIONS", "50000"))
+SSE_MAX_CONNECTIONS_PER_USER = int(os.getenv("SSE_MAX_CONNECTIONS_PER_USER", "10"))
+# Client reconnect delay sent in the stream's retry field
+SSE_RETRY_MILLISECONDS = int(os.getenv("SSE_RETRY_MILLISECONDS", "5000"))
+SSE_MAX_STREAM_SECONDS = float(os.getenv("SSE_MAX_STREAM_SECONDS", "900"))
+
+# Fields a dashboard needs to update a row in place
+EVENT_FIELDS = ("id", "product_id", "status", "start_date", "end_date")
+
+HEARTBEAT = b": ping\n\n"
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+SSE_EVENTS = Counter("sse_events_published_total", "Subscription events delivered to open streams", ("type",))
+REGISTRY.append(SSE_EVENTS)
+
+
+class _Stream:
+    """Pending messages for one open connection"""
+
+    __slots__ = ("pending", "waiter", "overflowed", "heartbeat_due", "closed", "opened_at")
+
+    def __init__(self):
+        # Allocated on the first event; most streams sit idle
+        self.pending: Optional[deque] = None
+        self.waiter: Optional[asyncio.Future] = None
+        self.overflowed = False
+        self.heartbeat_due = False
+        self.closed = False
+        self.opened_at = time.monotonic()
+
+    def wake(self) -> None:
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def push(self, message: bytes) -> None:
+        if self.pending is None:
+            self.pending = deque(maxlen=SSE_BUFFER_SIZE)
+        elif len(self.pending) == SSE_BUFFER_SIZE:
+            self.overflowed = True
+        self.pending.append(message)
+        self.wake()
+
+    def close(self) -> None:
+        self.closed = True
+        self.wake()
+
+    async def next(self) -> Optional[bytes]:
+        """The next message to write, or None once the stream is closed"""
+        while not self.closed:
+            if self.overflowed:
+                self.overflowed = False
+                self.pending.clear()
+                return RESYNC
+            if self.pending:
+                return self.pending.popleft()
+            if self.heartbeat_due:
+                self.heartbeat_due = False
+                return HEARTBEAT
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return None
+
+
+class SubscriptionEvents:
+    """Per-user fan-out of subscription changes to open streams"""
+
+    def __init__(self):
+        self._streams: Dict[str, Set[_Stream]] = {}
+        self.connections = 0
+        self._closing = False
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._closing = False
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._beat())
+
+    async def stop(self) -> None:
+        """End every open stream so the server can shut down"""
+        self._closing = True
+        for streams in self._streams.values():
+            for stream in streams:
+                stream.close()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+
+    def can_open(self, user_id: str) -> bool:
+        return (
+            not self._closing
+            and self.connections < SSE_MAX_CONNECTIONS
+            and len(self._streams.get(user_id, ())) < SSE_MAX_CONNECTIONS_PER_USER
+        )
+
+    def publish(self, user_id: str, subscriptions: Iterable[Dict[str, Any]], event: str = "subscription") -> None:
+        """Send changed subscription rows to the owner's open streams"""
+        streams = self._streams.get(user_id)
+        if not streams:
+            return
+        for row in subscriptions:
+            data = orjson.dumps({field: row.get(field) for field in EVENT_FIELDS})
+            message = b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+            for stream in streams:
+                stream.push(message)
+            SSE_EVENTS.inc((event,), len(streams))
+
+    def publish_rows(self, rows: Iterable[Dict[str, Any]], event: str = "subscription") -> None:
+        """publish() for rows that may belong to several users"""
+        by_user: Dict[str, list] = {}
+        for row in rows:
+            if row.get("user_id") in self._streams:
+                by_user.setdefault(row["user_id"], []).append(row)
+        for user_id, user_rows in by_user.items():
+            self.publish(user_id, user_rows, event)
+
+    def open(self, user_id: str) -> _Stream:
+        stream = _Stream()
+        self._streams.setdefault(user_id, set()).add(stream)
+        self.connections += 1
+        return stream
+
+    def close(self, user_id: str, stream: _Stream) -> None:
+        self.connections -= 1
+        streams = self._streams.get(user_id)
+        if streams is not None:
+            streams.discard(stream)
+            if not streams:
+                del self._streams[user_id]
+
+    async def _beat(self) -> None:
+        while True:
+            await asyncio.sleep(SSE_HEARTBEAT_SECONDS)
+            expired_before = time.monotonic() - SSE_MAX_STREAM_SECONDS
+            for streams in list(self._streams.values()):
+                for stream in streams:
+                    if stream.opened_at < expired_before:
+                        stream.close()
+                    else:
+                        stream.heartbeat_due = True
+                        stream.wake()
+
+
+subscription_events = SubscriptionEvents()
+
+
+class EventStreamResponse(Response):
+    """text/event-stream of one user's subscription changes"""
+
+    media_type = "text/event-stream"
+
+    def __init__(
+        self,
+        user_id: str,
+        events: SubscriptionEvents = subscription_events,
+        headers: Optional[Mapping[str, str]] = None,
+    ):
+        self.user_id = user_id
+        self.events = events
+        self.status_code = 200
+        self.background = None
+        self.init_headers({"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(headers or {})})
+
+    async def __call__(self, scope, receive, send) -> None:
+        stream = self.events.open(self.user_id)
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, stream))
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            hello = f"retry: {SSE_RETRY_MILLISECONDS}\nevent: ready\ndata: {{}}\n\n".encode()
+            await send({"type": "http.response.body", "body": hello, "more_body": True})
+            while True:
+                message = await stream.next()
+                if message is None:
+                    break
+                await send({"type": "http.response.body", "body": message, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            watcher.cancel()
+            self.events.close(self.user_id, stream)
+
+    @staticmethod
+    async def _watch_disconnect(receive, stream: _Stream) -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        stream.close()
+
+
+def _stream_gauges():
+    yield from gauge_lines("sse_connections", "Open subscription event streams", subscription_events.connections)
+
+register_collector(_stream_gauges)
@@ -0,0 +1,254 @@
+"""Conditional requests and response compression for read endpoints.
+
+Read handlers derive a strong ETag before building a body: from the rows'
+id and updated_at (kept current by the set_updated_at trigger), or from a
+content hash the product catalog computes once per snapshot. A request
+whose If-None-Match (or, failing that, If-Modified-Since) still matches
+gets a bodiless 304, so nothing is serialized or sent. Public product data
+is cacheable by browsers and CDNs for CACHE_CONTROL_PUBLIC; per-user data
+is private and revalidated on every use.
+
+CompressionMiddleware encodes responses of at least COMPRESSION_MIN_BYTES
+with brotli (when the Brotli package is installed) or gzip, following the
+client's Accept-Encoding. An encoded response gets its own ETag ("-br" or
+"-gzip" appended), which conditional checks strip again, and encodings of
+responses with an ETag are cached by path and body digest, so a hot
+catalog is compressed once.
+Event streams and already-encoded responses pass through untouched.
+"""
+import hashlib
+import os
+import zlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Dict, Iterable, List, Optional, Union
+from fastapi import Request, Response
+try:
+    from .cache import TTLCache
+except ImportError:
+    from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_CONTROL_PUBLIC = os.getenv("CACHE_CONTROL_PUBLIC", "public, max-age=60, stale-while-revalidate=300")
+CACHE_CONTROL_PRIVATE = os.getenv("CACHE_CONTROL_PRIVATE", "private, no-cache")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", "256"))
+
+# Media types worth encoding; event streams are excluded because buffering
+# them in an encoder would hold back events
+COMPRESSIBLE_TYPES = (b"application/json", b"text/csv", b"text/plain", b"application/x-ndjson")
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag of a serialized body"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def row_etag(rows: Iterable[Dict], *extra: str) -> str:
+    """Strong ETag of rows from their ids and updated_at, plus any extra parts"""
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(f"{row['id']}@{row.get('updated_at')}\n".encode())
+    for part in extra:
+        digest.update(part.encode())
+    return '"' + digest.hexdigest() + '"'
+
+
+def http_date(value: Union[str, datetime, None]) -> Optional[str]:
+    """Format a row timestamp as an HTTP date"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _strip_tag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[: -len(suffix) - 1] + '"'
+    return tag
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[str] = None) -> bool:
+    """Whether the client's cached copy is still current"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or any(
+            _strip_tag(tag) == etag for tag in if_none_match.split(",")
+        )
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_response(
+    request: Request,
+    etag: str,
+    body: Union[bytes, Callable[[], Response]],
+    cache_control: str = CACHE_CONTROL_PRIVATE,
+    last_modified: Optional[str] = None,
+) -> Response:
+    """304 if the client's copy matches etag, otherwise the body with validators.
+
+    body is JSON bytes or a callable building the Response, which is only
+    called when the client needs the representation.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    if callable(body):
+        response = body()
+        response.headers.update(headers)
+        return response
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _accepted_encoding(headers: List) -> Optional[str]:
+    for name, value in headers:
+        if name == b"accept-encoding":
+            accepted = {}
+            for item in value.decode("latin-1").split(","):
+                coding, _, params = item.strip().partition(";")
+                quality = 1.0
+                if params.strip().startswith("q="):
+                    try:
+                        quality = float(params.strip()[2:])
+                    except ValueError:
+                        pass
+                accepted[coding.strip().lower()] = quality
+            if brotli is not None and accepted.get("br", 0) > 0:
+                return "br"
+            if accepted.get("gzip", 0) > 0:
+                return "gzip"
+            return None
+    return None
+
+
+def _compressor(encoding: str):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    process, finish = _compressor(encoding)
+    return process(body) + finish()
+
+
+def _not_modified_headers(headers: List, request_headers: List, encoding: Optional[str]) -> List:
+    """Vary, and the encoded ETag if that is the one the client revalidated"""
+    headers = [*headers, (b"vary", b"Accept-Encoding")]
+    etag = next((v for k, v in headers if k == b"etag"), None)
+    if_none_match = next((v for k, v in request_headers if k == b"if-none-match"), b"")
+    if encoding is not None and etag is not None and etag.endswith(b'"'):
+        encoded_etag = etag[:-1] + f'-{encoding}"'.encode()
+        if encoded_etag in if_none_match:
+            headers = [(k, encoded_etag if k == b"etag" else v) for k, v in headers]
+    return headers
+
+
+_encoded = TTLCache(maxsize=COMPRESSION_CACHE_SIZE)
+
+
+class CompressionMiddleware:
+    """ASGI middleware negotiating brotli or gzip for large responses"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(scope["headers"])
+        start = None
+        etag = None
+        encoder = None
+
+        async def send_wrapper(message):
+            nonlocal start, etag, encoder
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                if message["status"] == 304:
+                    await send({**message, "headers": _not_modified_headers(headers, scope["headers"], encoding)})
+                    return
+                content_type = next((v for k, v in headers if k == b"content-type"), b"")
+                if not content_type.startswith(COMPRESSIBLE_TYPES) or any(k == b"content-encoding" for k, _ in headers):
+                    await send(message)
+                    return
+                # Caches must key compressible responses on Accept-Encoding
+                message = {**message, "headers": [*headers, (b"vary", b"Accept-Encoding")]}
+                if encoding is None or message["status"] == 204:
+                    await send(message)
+                    return
+                start = message
+                etag = next((v.decode("latin-1") for k, v in headers if k == b"etag"), None)
+                return
+            if encoder is None and start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    start = None
+                    return
+                headers = [(k, v) for k, v in start["headers"] if k not in (b"content-length", b"etag")]
+                headers.append((b"content-encoding", encoding.encode()))
+                if etag is not None and etag.endswith('"'):
+                    headers.append((b"etag", (etag[:-1] + f'-{encoding}"').encode("latin-1")))
+                if not more_body:
+                    # Only responses with a strong ETag repeat often enough to cache; the
+                    # key still covers the path and the body itself, so a stale ETag
+                    # cannot serve stale bytes
+                    cache_key = None
+                    if etag is not None and not etag.startswith("W/"):
+                        digest = hashlib.blake2b(body, digest_size=16).digest()
+                        cache_key = (scope["path"], scope["query_string"], encoding, digest)
+                    encoded = _encoded.get(cache_key) if cache_key else None
+                    if encoded is None:
+                        encoded = compress(body, encoding)
+                        if cache_key:
+                            _encoded.set(cache_key, encoded)
+                    headers.append((b"content-length", str(len(encoded)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": encoded})
+                    start = None
+                    return
+                # Streamed (e.g. exports): encode chunk by chunk
+                await send({**start, "headers": headers})
+                start = None
+                encoder = _compressor(encoding)
+            process, finish = encoder
+            chunk = process(body)
+            if not more_body:
+                chunk += finish()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
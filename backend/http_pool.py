@@ -0,0 +1,133 @@
+"""Shared HTTP connection pools for the Supabase and Stripe clients.
+
+Left alone, every supabase-py component builds its own httpx client (and
+PostgREST rebuilds it after each auth event) while stripe keeps one requests
+session per thread, so bursts open fresh TCP/TLS connections. Instead each
+upstream gets one keep-alive transport, HTTP/2 where the server offers it,
+sized and timed from HTTP_POOL_* settings and shared by every client and
+executor thread that talks to it. Connection churn and pool occupancy are
+exported on /metrics.
+"""
+import os
+import threading
+from typing import Any, Dict, Iterable, Tuple
+import httpx
+try:
+    from .instrumentation import register_collector, labelled_gauge_lines
+except ImportError:
+    from instrumentation import register_collector, labelled_gauge_lines
+
+# Limits apply per upstream, i.e. per host
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "64"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "32"))
+HTTP_POOL_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "60"))
+HTTP_POOL_HTTP2 = os.getenv("HTTP_POOL_HTTP2", "true").lower() in ("1", "true", "yes")
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+# How long a request waits for a free connection when the pool is full
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", "1"))
+
+TIMEOUT = httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+
+# Trace events counted per upstream (httpcore reports them from worker threads)
+_TRACED = {
+    "connection.connect_tcp.complete": "connections_opened",
+    "connection.start_tls.complete": "tls_handshakes",
+    "connection.connect_tcp.failed": "connect_errors",
+}
+
+
+class PooledTransport(httpx.HTTPTransport):
+    """Keep-alive transport shared by every client of one upstream"""
+
+    def __init__(self, upstream: str):
+        super().__init__(
+            http2=HTTP_POOL_HTTP2,
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_POOL_KEEPALIVE_EXPIRY,
+            ),
+            retries=HTTP_CONNECT_RETRIES,
+        )
+        self.upstream = upstream
+        self.counts = {"requests": 0, **{name: 0 for name in _TRACED.values()}}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _trace(self, event: str, info: Dict[str, Any]) -> None:
+        name = _TRACED.get(event)
+        if name:
+            self._count(name)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._count("requests")
+        request.extensions["trace"] = self._trace
+        return super().handle_request(request)
+
+    def close(self) -> None:
+        # Clients come and go (PostgREST sessions are rebuilt on auth
+        # events); the pool itself is closed by close_pools at shutdown
+        pass
+
+    def shutdown(self) -> None:
+        super().close()
+
+    def connection_stats(self) -> Tuple[int, int]:
+        """(open, idle) connections"""
+        connections = self._pool.connections
+        return len(connections), sum(1 for c in connections if c.is_idle())
+
+
+_transports: Dict[str, PooledTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(upstream: str) -> PooledTransport:
+    """The shared transport for an upstream, created on first use"""
+    transport = _transports.get(upstream)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.setdefault(upstream, PooledTransport(upstream))
+    return transport
+
+
+def pooled_client(upstream: str, client_class=httpx.Client, **kwargs: Any) -> httpx.Client:
+    """An httpx client of client_class sending through the upstream's pool"""
+    kwargs.setdefault("timeout", TIMEOUT)
+    return client_class(transport=get_transport(upstream), **kwargs)
+
+
+def close_pools() -> None:
+    for transport in list(_transports.values()):
+        transport.shutdown()
+    _transports.clear()
+
+
+def _pool_metrics() -> Iterable[str]:
+    transports = list(_transports.values())
+    for name, help in (
+        ("requests", "Requests sent through the shared HTTP pool"),
+        ("connections_opened", "TCP connections opened by the shared HTTP pool"),
+        ("tls_handshakes", "TLS handshakes performed by the shared HTTP pool"),
+        ("connect_errors", "Failed connection attempts in the shared HTTP pool"),
+    ):
+        yield f"# HELP http_pool_{name}_total {help}"
+        yield f"# TYPE http_pool_{name}_total counter"
+        for transport in transports:
+            yield f'http_pool_{name}_total{{upstream="{transport.upstream}"}} {transport.counts[name]}'
+    stats = {transport.upstream: transport.connection_stats() for transport in transports}
+    yield from labelled_gauge_lines(
+        "http_pool_connections", "Open connections in the shared HTTP pool", ("upstream",),
+        {(upstream,): open_connections for upstream, (open_connections, _) in stats.items()},
+    )
+    yield from labelled_gauge_lines(
+        "http_pool_idle_connections", "Idle keep-alive connections in the shared HTTP pool", ("upstream",),
+        {(upstream,): idle for upstream, (_, idle) in stats.items()},
+    )
+
+register_collector(_pool_metrics)
@@ -0,0 +1,180 @@
+"""Idempotency-Key support for POST endpoints.
+
+A client retrying a POST with the same Idempotency-Key header gets the
+first response replayed (marked Idempotent-Replayed: true) instead of a
+second subscription or checkout session. Keys are scoped to the endpoint
+and the authenticated user and remembered for IDEMPOTENCY_TTL_SECONDS.
+
+Completed responses are kept in a per-worker LRU. A duplicate arriving
+while the first request is still running waits for it rather than
+repeating the work. IDEMPOTENCY_STORE=database also records keys in the
+storage backend, so duplicates that land on other workers are replayed (or
+wait) too; if that store is unreachable, the worker falls back to its own
+memory. Only successful responses are recorded; after a failure the key
+can be retried. Reusing a key with a different payload is rejected with 422.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+import orjson
+from fastapi import HTTPException, Response, status
+try:
+    from .cache import TTLCache
+    from .instrumentation import Counter, REGISTRY
+    from .repository import idempotency_repo
+except ImportError:
+    from cache import TTLCache
+    from instrumentation import Counter, REGISTRY
+    from repository import idempotency_repo
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "memory").lower()
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# How long a duplicate waits for the original request before answering 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_POLL_SECONDS = float(os.getenv("IDEMPOTENCY_POLL_SECONDS", "0.1"))
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENT_REQUESTS = Counter(
+    "idempotent_requests_total", "Requests carrying an Idempotency-Key by outcome", ("scope", "outcome")
+)
+REGISTRY.append(IDEMPOTENT_REQUESTS)
+
+_completed = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS)
+_in_flight: Dict[str, "asyncio.Future[None]"] = {}
+
+
+def _fingerprint(payload: Any) -> str:
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _still_running() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still being processed",
+        headers={"Retry-After": "1"},
+    )
+
+
+class Idempotency:
+    """Idempotency-Key handling for one endpoint"""
+
+    def __init__(self, scope: str):
+        self.scope = scope
+
+    async def run(
+        self, key: Optional[str], owner: str, payload: Any, func: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """Run func once per key and owner; replay its response for repeats"""
+        if key is None:
+            return await func()
+        if not key.strip() or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters",
+            )
+        cache_key = f"{self.scope}:{owner}:{key}"
+        fingerprint = _fingerprint(payload)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+
+        while True:
+            record = _completed.get(cache_key)
+            if record is not None:
+                return self._replay(record, fingerprint)
+            pending = _in_flight.get(cache_key)
+            if pending is None:
+                break
+            # The first request failed if nothing is recorded once it finishes; try again then
+            try:
+                await asyncio.wait_for(asyncio.shield(pending), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                IDEMPOTENT_REQUESTS.inc((self.scope, "conflict"))
+                raise _still_running()
+
+        done = asyncio.get_running_loop().create_future()
+        _in_flight[cache_key] = done
+        try:
+            shared_key = hashlib.sha256(cache_key.encode()).hexdigest()
+            shared = IDEMPOTENCY_STORE == "database"
+            if shared:
+                record = await self._claim_shared(shared_key, fingerprint, deadline)
+                if record is not None:
+                    _completed.set(cache_key, record)
+                    return self._replay(record, fingerprint)
+            return await self._execute(cache_key, shared_key if shared else None, fingerprint, func)
+        finally:
+            del _in_flight[cache_key]
+            done.set_result(None)
+
+    async def _claim_shared(self, shared_key: str, fingerprint: str, deadline: float) -> Optional[Dict]:
+        """Claim the key in the shared store, or return the record another worker completed"""
+        while True:
+            try:
+                if await idempotency_repo.claim(shared_key, fingerprint, IDEMPOTENCY_TTL_SECONDS):
+                    return None
+                record = await idempotency_repo.get(shared_key)
+            except Exception:
+                logger.warning("Shared idempotency store unavailable; using worker-local keys", exc_info=True)
+                return None
+            if record is not None and record["status_code"] is not None:
+                return record
+            if record is not None and fingerprint != record["fingerprint"]:
+                # Fail fast rather than wait for a response that could not be replayed
+                self._replay(record, fingerprint)
+            if time.monotonic() >= deadline:
+                IDEMPOTENT_REQUESTS.inc((self.scope, "conflict"))
+                raise _still_running()
+            await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    async def _execute(
+        self, cache_key: str, shared_key: Optional[str], fingerprint: str, func: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        try:
+            response = await func()
+        except BaseException:
+            if shared_key is not None:
+                await self._release(shared_key)
+            raise
+        if not 200 <= response.status_code < 300:
+            if shared_key is not None:
+                await self._release(shared_key)
+            return response
+        record = {"fingerprint": fingerprint, "status_code": response.status_code, "body": response.body.decode()}
+        _completed.set(cache_key, record)
+        IDEMPOTENT_REQUESTS.inc((self.scope, "executed"))
+        if shared_key is not None:
+            try:
+                await idempotency_repo.complete(shared_key, record["status_code"], record["body"])
+            except Exception:
+                logger.warning("Could not record idempotent response in the shared store", exc_info=True)
+        return response
+
+    async def _release(self, shared_key: str) -> None:
+        try:
+            await idempotency_repo.release(shared_key)
+        except Exception:
+            logger.warning("Could not release idempotency key", exc_info=True)
+
+    def _replay(self, record: Dict, fingerprint: str) -> Response:
+        if record["fingerprint"] != fingerprint:
+            IDEMPOTENT_REQUESTS.inc((self.scope, "mismatch"))
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used with a different request",
+            )
+        IDEMPOTENT_REQUESTS.inc((self.scope, "replayed"))
+        return Response(
+            content=record["body"],
+            status_code=record["status_code"],
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+
+subscription_idempotency = Idempotency("subscriptions.create")
+checkout_idempotency = Idempotency("stripe.checkout")
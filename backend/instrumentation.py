@@ -0,0 +1,238 @@
+"""Latency histograms and counters exposed in Prometheus text format.
+
+Recording is a bisect and a few integer increments, done on the event loop
+thread (blocking calls are timed around their await), so it is cheap
+enough to leave on in production.
+"""
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Tuple, TypeVar
+try:
+    from .utils import run_sync
+except ImportError:
+    from utils import run_sync
+
+T = TypeVar("T")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by label values"""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, labels: Tuple, seconds: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, seconds)] += 1
+        series[-1] += seconds
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple, int] = {}
+
+    def inc(self, labels: Tuple, amount: int = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge:
+    """Single value that can go up and down"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.value}"
+
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP responses by route and status", ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+SUPABASE_LATENCY = Histogram("supabase_query_duration_seconds", "Supabase call latency", ("table", "operation"))
+SUPABASE_ERRORS = Counter("supabase_errors_total", "Failed Supabase calls", ("table", "operation"))
+STRIPE_LATENCY = Histogram("stripe_api_duration_seconds", "Stripe API call latency", ("api",))
+STRIPE_ERRORS = Counter("stripe_errors_total", "Failed Stripe API calls", ("api",))
+SQLITE_LATENCY = Histogram("sqlite_query_duration_seconds", "Embedded SQLite query latency", ("table", "operation"))
+SQLITE_ERRORS = Counter("sqlite_errors_total", "Failed SQLite queries", ("table", "operation"))
+
+REGISTRY = [
+    HTTP_LATENCY, HTTP_REQUESTS, HTTP_IN_FLIGHT,
+    SUPABASE_LATENCY, SUPABASE_ERRORS,
+    STRIPE_LATENCY, STRIPE_ERRORS,
+    SQLITE_LATENCY, SQLITE_ERRORS,
+]
+
+_collectors: List[Callable[[], Iterable[str]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[str]]) -> None:
+    """Add a callable yielding extra exposition lines at scrape time"""
+    _collectors.append(collector)
+
+
+def gauge_lines(name: str, help: str, value: Any) -> List[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def labelled_gauge_lines(name: str, help: str, labelnames: Tuple[str, ...], series: Dict[Tuple, Any]) -> List[str]:
+    """One gauge family with a sample per label-value tuple"""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in sorted(series.items()):
+        lines.append(f"{name}{_labels(labelnames, labels)} {value}")
+    return lines
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def _postgrest_labels(query) -> Tuple[str, str]:
+    path = getattr(query, "path", "") or ""
+    method = getattr(query, "http_method", "")
+    if path.startswith("/rpc/"):
+        return path[len("/rpc/"):], "rpc"
+    if method == "POST":
+        prefer = (getattr(query, "headers", None) or {}).get("prefer", "")
+        return path.lstrip("/"), "upsert" if "resolution=" in prefer else "insert"
+    operation = {"GET": "select", "HEAD": "select", "PATCH": "update", "DELETE": "delete"}.get(method, method.lower())
+    return path.lstrip("/"), operation
+
+
+async def execute_query(query) -> Any:
+    """Execute a PostgREST query off the event loop, recording its latency"""
+    labels = _postgrest_labels(query)
+    started = time.perf_counter()
+    try:
+        return await run_sync(query.execute)
+    except Exception:
+        SUPABASE_ERRORS.inc(labels)
+        raise
+    finally:
+        SUPABASE_LATENCY.observe(labels, time.perf_counter() - started)
+
+
+async def call_supabase(table: str, operation: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a non-PostgREST Supabase call (e.g. auth) with timing"""
+    labels = (table, operation)
+    started = time.perf_counter()
+    try:
+        return await run_sync(func, *args, **kwargs)
+    except Exception:
+        SUPABASE_ERRORS.inc(labels)
+        raise
+    finally:
+        SUPABASE_LATENCY.observe(labels, time.perf_counter() - started)
+
+
+async def call_stripe(api: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking Stripe SDK call off the event loop with timing"""
+    labels = (api,)
+    started = time.perf_counter()
+    try:
+        return await run_sync(func, *args, **kwargs)
+    except Exception:
+        STRIPE_ERRORS.inc(labels)
+        raise
+    finally:
+        STRIPE_LATENCY.observe(labels, time.perf_counter() - started)
+
+
+async def call_sqlite(table: str, operation: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking SQLite query off the event loop with timing"""
+    labels = (table, operation)
+    started = time.perf_counter()
+    try:
+        return await run_sync(func, *args, **kwargs)
+    except Exception:
+        SQLITE_ERRORS.inc(labels)
+        raise
+    finally:
+        SQLITE_LATENCY.observe(labels, time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight requests per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.value += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.value -= 1
+            route = scope.get("route")
+            # Route templates keep label cardinality bounded
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_LATENCY.observe((method, path), time.perf_counter() - started)
+            HTTP_REQUESTS.inc((method, path, str(status_code)))
@@ -0,0 +1,149 @@
+"""Background expiry and renewal of subscriptions.
+
+Subscriptions carry an end_date but requests never check it. Instead one
+worker, elected through an expiring lease in scheduler_leases, scans for
+active subscriptions whose end_date has passed (an index range scan on
+status, end_date) every SUBSCRIPTION_SCHEDULER_INTERVAL_SECONDS and moves
+them on in bounded batches:
+
+- linked to Stripe: Stripe renews them and the webhook moves end_date
+  forward, so one still due after the grace period is marked past_due;
+- local: renewed for SUBSCRIPTION_PERIOD_DAYS from their previous end_date
+  (so periods do not drift by how late the sweep ran) when
+  SUBSCRIPTION_AUTO_RENEW is set, otherwise marked inactive.
+
+Each batch update re-checks status and end_date, so a subscription changed
+by a request or webhook in the meantime is left alone.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+try:
+    from .repository import subscription_repo, scheduler_lease_repo
+    from .analytics import subscription_metrics
+    from .events import subscription_events
+    from .instrumentation import Counter, REGISTRY, register_collector, gauge_lines
+except ImportError:
+    from repository import subscription_repo, scheduler_lease_repo
+    from analytics import subscription_metrics
+    from events import subscription_events
+    from instrumentation import Counter, REGISTRY, register_collector, gauge_lines
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_SCHEDULER_ENABLED = os.getenv("SUBSCRIPTION_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+SUBSCRIPTION_SCHEDULER_INTERVAL_SECONDS = float(os.getenv("SUBSCRIPTION_SCHEDULER_INTERVAL_SECONDS", "60"))
+# A leader that stops renewing is replaced after this long
+SUBSCRIPTION_LEASE_SECONDS = float(
+    os.getenv("SUBSCRIPTION_LEASE_SECONDS", str(3 * SUBSCRIPTION_SCHEDULER_INTERVAL_SECONDS))
+)
+SUBSCRIPTION_BATCH_SIZE = int(os.getenv("SUBSCRIPTION_BATCH_SIZE", "200"))
+# Caps the work done per tick; the rest is picked up on the next one
+SUBSCRIPTION_MAX_BATCHES = int(os.getenv("SUBSCRIPTION_MAX_BATCHES", "50"))
+SUBSCRIPTION_GRACE_SECONDS = float(os.getenv("SUBSCRIPTION_GRACE_SECONDS", "3600"))
+SUBSCRIPTION_AUTO_RENEW = os.getenv("SUBSCRIPTION_AUTO_RENEW", "false").lower() in ("1", "true", "yes")
+SUBSCRIPTION_PERIOD_DAYS = int(os.getenv("SUBSCRIPTION_PERIOD_DAYS", "30"))
+
+LEASE_NAME = "subscription_lifecycle"
+
+LIFECYCLE_ACTIONS = Counter(
+    "subscription_lifecycle_total", "Subscriptions expired or renewed by the scheduler", ("action",)
+)
+REGISTRY.append(LIFECYCLE_ACTIONS)
+
+
+class SubscriptionLifecycle:
+    """Leader-elected periodic sweep over due subscriptions"""
+
+    def __init__(self):
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.last_run_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if SUBSCRIPTION_SCHEDULER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            # Let another worker take over without waiting for the lease to expire
+            try:
+                await scheduler_lease_repo.release(LEASE_NAME, self.holder)
+            except Exception:
+                logger.warning("Could not release the subscription lifecycle lease", exc_info=True)
+            self.is_leader = False
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.is_leader = await scheduler_lease_repo.acquire(
+                    LEASE_NAME, self.holder, SUBSCRIPTION_LEASE_SECONDS
+                )
+                if self.is_leader:
+                    await self.run_once()
+            except Exception:
+                logger.exception("Subscription lifecycle sweep failed")
+            await asyncio.sleep(SUBSCRIPTION_SCHEDULER_INTERVAL_SECONDS)
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Expire or renew every due subscription, up to the per-tick cap"""
+        now = now or datetime.now(timezone.utc)
+        due_before = now - timedelta(seconds=SUBSCRIPTION_GRACE_SECONDS)
+        if SUBSCRIPTION_AUTO_RENEW:
+            local_action = "renewed"
+            local_update = None
+        else:
+            local_action = "expired_inactive"
+            local_update = {"status": "inactive"}
+        counts = {
+            "expired_past_due": await self._sweep(due_before, True, {"status": "past_due"}),
+            local_action: await self._sweep(due_before, False, local_update),
+        }
+        self.last_run_at = now
+        for action, count in counts.items():
+            if count:
+                LIFECYCLE_ACTIONS.inc((action,), count)
+                logger.info("Subscription lifecycle: %s %d subscription(s)", action, count)
+        return counts
+
+    async def _sweep(self, due_before: datetime, stripe_managed: bool, update: Optional[Dict]) -> int:
+        """Apply update to due subscriptions, or renew them when update is None"""
+        changed_total = 0
+        for _ in range(SUBSCRIPTION_MAX_BATCHES):
+            due = await subscription_repo.list_due("active", due_before, SUBSCRIPTION_BATCH_SIZE, stripe_managed)
+            if not due:
+                break
+            ids = [row["id"] for row in due]
+            if update is None:
+                changed = await subscription_repo.renew_due(ids, "active", due_before, SUBSCRIPTION_PERIOD_DAYS)
+            else:
+                changed = await subscription_repo.update_due(ids, "active", due_before, update)
+            if update and "status" in update:
+                await subscription_metrics.record_transitions(
+                    (row["product_id"], "active", update["status"]) for row in changed
+                )
+            subscription_events.publish_rows(changed)
+            changed_total += len(changed)
+            if len(due) < SUBSCRIPTION_BATCH_SIZE:
+                break
+        return changed_total
+
+
+subscription_lifecycle = SubscriptionLifecycle()
+
+
+def _lifecycle_gauges():
+    yield from gauge_lines(
+        "subscription_lifecycle_leader", "1 if this worker holds the lifecycle lease", int(subscription_lifecycle.is_leader)
+    )
+
+register_collector(_lifecycle_gauges)
@@ -1,21 +1,75 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+import time
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, ORJSONResponse
+import logging
 import os
 from typing import Optional
-import jwt
 from datetime import datetime, timedelta
 
 # Import routers
 try:
-    from .api import auth, users, products, subscriptions, admin, stripe_integration
+    from .api import auth, users, products, subscriptions, admin, stripe_integration, organizations
+    from .webhooks import webhook_pipeline
+    from .analytics import subscription_metrics
+    from .lifecycle import subscription_lifecycle
+    from .events import subscription_events
+    from .security import ServerTimingMiddleware
+    from .http_cache import CompressionMiddleware
+    from .instrumentation import MetricsMiddleware, render_metrics, register_collector, gauge_lines
+    from .utils import token_cache_stats
+    from .http_pool import close_pools
+    from .warmup import warm_up
 except ImportError:
-    from api import auth, users, products, subscriptions, admin, stripe_integration
+    from api import auth, users, products, subscriptions, admin, stripe_integration, organizations
+    from webhooks import webhook_pipeline
+    from analytics import subscription_metrics
+    from lifecycle import subscription_lifecycle
+    from events import subscription_events
+    from security import ServerTimingMiddleware
+    from http_cache import CompressionMiddleware
+    from instrumentation import MetricsMiddleware, render_metrics, register_collector, gauge_lines
+    from utils import token_cache_stats
+    from http_pool import close_pools
+    from warmup import warm_up
+
+# Reported next to uvicorn's own startup messages
+logger = logging.getLogger("uvicorn.error")
+
+startup_report = {"import_seconds": time.perf_counter() - _import_started, "warmup_seconds": None}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm clients and caches, run the background workers, stop them on shutdown"""
+    started = time.perf_counter()
+    steps = await warm_up()
+    await webhook_pipeline.start()
+    subscription_metrics.start()
+    subscription_lifecycle.start()
+    subscription_events.start()
+    startup_report["warmup_seconds"] = time.perf_counter() - started
+    logger.info(
+        "Startup: imports %.0f ms, warmup %.0f ms (%s)",
+        startup_report["import_seconds"] * 1000,
+        startup_report["warmup_seconds"] * 1000,
+        ", ".join(f"{name} {'failed' if s is None else f'{s * 1000:.0f} ms'}" for name, s in steps.items()),
+    )
+    yield
+    await subscription_events.stop()
+    await subscription_lifecycle.stop()
+    await webhook_pipeline.stop()
+    await subscription_metrics.stop()
+    close_pools()
 
 app = FastAPI(
     title="bilel SaaS API",
     description="Production-ready SaaS backend with Supabase",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 # CORS middleware configuration
@@ -33,11 +87,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# brotli/gzip for large JSON, CSV and NDJSON responses (never event streams)
+app.add_middleware(CompressionMiddleware)
+
+# Server-Timing: auth;dur=... on authenticated responses
+app.add_middleware(ServerTimingMiddleware)
+
+# Added last so it is outermost and also times the other middleware
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(products.router, prefix="/api/products", tags=["products"])
 app.include_router(subscriptions.router, prefix="/api/subscriptions", tags=["subscriptions"])
+app.include_router(organizations.router, prefix="/api/organizations", tags=["organizations"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(stripe_integration.router, prefix="/api/stripe", tags=["stripe"])
 
@@ -50,6 +114,24 @@ async def root():
         "status": "running"
     }
 
+def _runtime_gauges():
+    tokens = token_cache_stats()
+    webhooks = webhook_pipeline.stats()
+    yield from gauge_lines("jwt_cache_hits", "Verified-token cache hits", tokens["hits"])
+    yield from gauge_lines("jwt_cache_misses", "Verified-token cache misses", tokens["misses"])
+    yield from gauge_lines("webhook_queue_depth", "Stripe events waiting to be applied", webhooks["queue_depth"])
+    yield from gauge_lines("webhook_dead_lettered", "Stripe events dead-lettered by this worker", webhooks["dead_lettered"])
+    yield from gauge_lines("startup_import_seconds", "Time to import the application", startup_report["import_seconds"])
+    if startup_report["warmup_seconds"] is not None:
+        yield from gauge_lines("startup_warmup_seconds", "Time spent in startup warmup", startup_report["warmup_seconds"])
+
+register_collector(_runtime_gauges)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health():
     """Health check endpoint for deployment monitoring"""
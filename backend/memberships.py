@@ -0,0 +1,191 @@
+"""Per-worker cache of organization memberships.
+
+Every organization-scoped request needs the caller's role in that
+organization, so each worker keeps the membership graph in memory in both
+directions: organization -> {user: role} and user -> {organization: role}.
+Entries are loaded on first use, and concurrent misses share one query.
+Both maps are bounded LRUs, so an authorization check is a dict lookup.
+
+Changes made through the API update this worker's copy write-through and
+bump the shared "memberships" version in cache_versions. Other workers
+poll that counter every MEMBERSHIP_VERSION_POLL_SECONDS and drop their copy
+when it moves, so a removed member keeps access on other workers for at
+most the poll interval. MEMBERSHIP_CACHE_TTL_SECONDS bounds staleness if
+the counter cannot be read.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional
+try:
+    from .cache import TTLCache
+    from .repository import organization_repo, cache_version_repo
+    from .instrumentation import register_collector, gauge_lines
+except ImportError:
+    from cache import TTLCache
+    from repository import organization_repo, cache_version_repo
+    from instrumentation import register_collector, gauge_lines
+
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "10000"))
+MEMBERSHIP_CACHE_TTL_SECONDS = float(os.getenv("MEMBERSHIP_CACHE_TTL_SECONDS", "300"))
+MEMBERSHIP_VERSION_POLL_SECONDS = float(os.getenv("MEMBERSHIP_VERSION_POLL_SECONDS", "5"))
+MEMBERSHIP_VERSION_KEY = "memberships"
+
+ROLE_RANK = {"member": 0, "admin": 1, "owner": 2}
+
+
+def role_at_least(role: Optional[str], minimum: str) -> bool:
+    return role is not None and ROLE_RANK[role] >= ROLE_RANK[minimum]
+
+
+class MembershipIndex:
+    """Cached organization <-> user role graph for this worker"""
+
+    def __init__(self, ttl: float = MEMBERSHIP_CACHE_TTL_SECONDS, poll_interval: float = MEMBERSHIP_VERSION_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self._by_org = TTLCache(maxsize=MEMBERSHIP_CACHE_SIZE, ttl=ttl)
+        self._by_user = TTLCache(maxsize=MEMBERSHIP_CACHE_SIZE, ttl=ttl)
+        self._loading: Dict[Hashable, "asyncio.Task[Dict[str, str]]"] = {}
+        # Bumped on every local change, so a load that raced one is not cached
+        self._generation = 0
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def members(self, organization_id: str) -> Dict[str, str]:
+        """user_id -> role for every member of the organization"""
+        await self._ensure_fresh()
+        members = self._by_org.get(organization_id)
+        if members is None:
+            members = await self._load(
+                self._by_org, organization_id, organization_repo.memberships, "user_id"
+            )
+        return members
+
+    async def organizations(self, user_id: str) -> Dict[str, str]:
+        """organization_id -> role for every organization the user is in"""
+        await self._ensure_fresh()
+        organizations = self._by_user.get(user_id)
+        if organizations is None:
+            organizations = await self._load(
+                self._by_user, user_id, organization_repo.user_memberships, "organization_id"
+            )
+        return organizations
+
+    async def role(self, organization_id: str, user_id: str) -> Optional[str]:
+        """The user's role in the organization, or None if not a member"""
+        return (await self.members(organization_id)).get(user_id)
+
+    async def apply(self, organization_id: str, user_id: str, role: Optional[str]) -> None:
+        """Write-through a membership added or changed (role) or removed (None)"""
+        self._set(organization_id, user_id, role)
+        await self._publish()
+
+    async def apply_many(self, changes: Iterable[Dict]) -> None:
+        """apply() for several organization_id/user_id/role rows with one version bump"""
+        for change in changes:
+            self._set(change["organization_id"], change["user_id"], change.get("role"))
+        await self._publish()
+
+    async def drop_organization(self, organization_id: str, user_ids: Iterable[str]) -> None:
+        """Forget a deleted organization and its former members' links to it"""
+        for user_id in user_ids:
+            self._set(organization_id, user_id, None)
+        self._by_org.pop(organization_id)
+        await self._publish()
+
+    def stats(self) -> Dict[str, int]:
+        organizations, users = self._by_org.stats(), self._by_user.stats()
+        return {
+            "organizations": organizations["size"],
+            "users": users["size"],
+            "hits": organizations["hits"] + users["hits"],
+            "misses": organizations["misses"] + users["misses"],
+        }
+
+    def _set(self, organization_id: str, user_id: str, role: Optional[str]) -> None:
+        self._generation += 1
+        # Cached maps are replaced, never mutated, as callers may hold them
+        for cache, key, member in (
+            (self._by_org, organization_id, user_id),
+            (self._by_user, user_id, organization_id),
+        ):
+            current = cache.get(key)
+            if current is None:
+                continue
+            updated = dict(current)
+            if role is None:
+                updated.pop(member, None)
+            else:
+                updated[member] = role
+            cache.set(key, updated)
+
+    async def _load(
+        self, cache: TTLCache, key: str, fetch: Callable[[str], Awaitable[list]], column: str
+    ) -> Dict[str, str]:
+        flight_key = (id(cache), key)
+        task = self._loading.get(flight_key)
+        if task is None:
+            # A task of its own, so a caller that gives up does not cancel it for the others
+            task = asyncio.ensure_future(self._fetch(cache, key, fetch, column))
+            self._loading[flight_key] = task
+            task.add_done_callback(lambda _: self._loading.pop(flight_key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(
+        self, cache: TTLCache, key: str, fetch: Callable[[str], Awaitable[list]], column: str
+    ) -> Dict[str, str]:
+        generation = self._generation
+        loaded = {row[column]: row["role"] for row in await fetch(key)}
+        if generation == self._generation:
+            cache.set(key, loaded)
+        return loaded
+
+    def _clear(self) -> None:
+        self._generation += 1
+        self._by_org.clear()
+        self._by_user.clear()
+
+    async def _ensure_fresh(self) -> None:
+        if time.monotonic() - self._checked_at < self.poll_interval:
+            return
+        async with self._lock:
+            if time.monotonic() - self._checked_at < self.poll_interval:
+                return
+            self._checked_at = time.monotonic()
+            try:
+                remote = await cache_version_repo.get(MEMBERSHIP_VERSION_KEY)
+            except Exception:
+                logger.warning("Could not read membership version", exc_info=True)
+                return
+            if self._version is not None and remote != self._version:
+                self._clear()
+            self._version = remote
+
+    async def _publish(self) -> None:
+        previous = self._version
+        try:
+            version = await cache_version_repo.bump(MEMBERSHIP_VERSION_KEY)
+        except Exception:
+            logger.warning("Could not bump membership version; other workers rely on TTL", exc_info=True)
+            return
+        if previous is None or version != previous + 1:
+            # Another worker changed memberships since our last check
+            self._clear()
+        self._version = version
+
+
+membership_index = MembershipIndex()
+
+
+def _membership_gauges():
+    stats = membership_index.stats()
+    yield from gauge_lines("membership_cache_organizations", "Organizations in the membership cache", stats["organizations"])
+    yield from gauge_lines("membership_cache_users", "Users in the membership cache", stats["users"])
+    yield from gauge_lines("membership_cache_hits", "Membership cache hits", stats["hits"])
+    yield from gauge_lines("membership_cache_misses", "Membership cache misses", stats["misses"])
+
+register_collector(_membership_gauges)
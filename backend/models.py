@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from enum import Enum
 import uuid
@@ -15,6 +15,16 @@ class SubscriptionStatus(str, Enum):
     PAST_DUE = "past_due"
     INACTIVE = "inactive"
 
+class OrganizationRole(str, Enum):
+    OWNER = "owner"
+    ADMIN = "admin"
+    MEMBER = "member"
+
+class InviteStatus(str, Enum):
+    PENDING = "pending"
+    ACCEPTED = "accepted"
+    REVOKED = "revoked"
+
 # Auth Models
 class AuthRegisterRequest(BaseModel):
     email: EmailStr
@@ -44,6 +54,19 @@ class UserProfile(BaseModel):
     class Config:
         from_attributes = True
 
+class UserProfileFields(BaseModel):
+    """Profile with every field optional, for projected listings"""
+    id: Optional[str] = None
+    email: Optional[str] = None
+    full_name: Optional[str] = None
+    role: Optional[UserRole] = None
+    created_at: Optional[datetime] = None
+
+class UserProfilePage(BaseModel):
+    items: List[UserProfileFields]
+    next_cursor: Optional[str] = None
+    total_estimate: Optional[int] = None
+
 class UpdateUserRequest(BaseModel):
     full_name: Optional[str] = None
     email: Optional[EmailStr] = None
@@ -68,6 +91,14 @@ class Product(ProductCreate):
     class Config:
         from_attributes = True
 
+class ProductSort(str, Enum):
+    CREATED_AT = "created_at"
+    CREATED_AT_DESC = "-created_at"
+    PRICE = "price"
+    PRICE_DESC = "-price"
+    NAME = "name"
+    NAME_DESC = "-name"
+
 # Subscription Models
 class SubscriptionCreate(BaseModel):
     product_id: str
@@ -89,6 +120,91 @@ class Subscription(BaseModel):
 class SubscriptionUpdate(BaseModel):
     status: SubscriptionStatus
 
+class SubscriptionWithProduct(Subscription):
+    product: Optional[Product] = None
+
+# Dashboard Models
+class DashboardSummary(BaseModel):
+    profile: UserProfile
+    subscriptions: List[SubscriptionWithProduct]
+    total_subscriptions: int
+    active_subscriptions: int
+    status_counts: Dict[str, int]
+    monthly_spend: float
+
+# Batch Models
+class BatchOperation(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+class ProductBatchItem(BaseModel):
+    op: BatchOperation
+    id: Optional[str] = None
+    data: Optional[ProductCreate] = None
+
+class ProductBatchRequest(BaseModel):
+    operations: List[ProductBatchItem]
+
+class SubscriptionBatchItem(BaseModel):
+    id: str
+    status: SubscriptionStatus
+
+class SubscriptionBatchRequest(BaseModel):
+    updates: List[SubscriptionBatchItem]
+
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchResult(BaseModel):
+    results: List[BatchItemResult]
+    succeeded: int
+    failed: int
+
+# Organization Models
+class OrganizationCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+
+class Organization(OrganizationCreate):
+    id: str
+    created_at: datetime
+    updated_at: datetime
+    role: Optional[OrganizationRole] = None  # the caller's role
+
+class OrganizationMember(BaseModel):
+    user_id: str
+    full_name: Optional[str] = None
+    email: Optional[str] = None
+    role: OrganizationRole
+    created_at: datetime
+
+class OrganizationMemberUpdate(BaseModel):
+    role: OrganizationRole
+
+class OrganizationInviteCreate(BaseModel):
+    email: EmailStr
+    role: OrganizationRole = OrganizationRole.MEMBER
+
+class OrganizationInvite(BaseModel):
+    id: str
+    organization_id: str
+    organization_name: Optional[str] = None
+    email: str
+    role: OrganizationRole
+    status: InviteStatus
+    expires_at: datetime
+    created_at: datetime
+
+class OrganizationInviteBatchRequest(BaseModel):
+    invites: List[OrganizationInviteCreate]
+
 # Error response
 class ErrorResponse(BaseModel):
     detail: str
@@ -0,0 +1,121 @@
+"""In-memory search index over the product catalog.
+
+Built by the catalog whenever its product list changes, so queries never
+touch the database. Words from name and description map to posting sets
+(an inverted index); a sorted vocabulary answers prefix lookups with a
+binary search; features map to posting sets so required features are a set
+intersection; a price-sorted order answers price ranges with bisect. Sorts
+use rank tables computed at build time, so a query does work in proportion
+to its candidates rather than to the catalog size.
+
+Products carry no currency of their own: every price is in the currency
+checkout charges (STRIPE_CURRENCY).
+"""
+import os
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Set
+
+CATALOG_CURRENCY = os.getenv("STRIPE_CURRENCY", "usd").lower()
+
+_WORD = re.compile(r"\w+")
+
+# Sort key -> field compared (ties broken by catalog order)
+SORT_FIELDS = {
+    "created_at": lambda p: (p["created_at"], p["id"]),
+    "price": lambda p: (p["price"], p["created_at"], p["id"]),
+    "name": lambda p: (p["name"].casefold(), p["created_at"], p["id"]),
+}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD.findall(text.casefold()) if text else []
+
+
+def normalize_feature(feature: str) -> str:
+    return " ".join(feature.casefold().split())
+
+
+class ProductIndex:
+    """Inverted, feature and price indexes over one catalog snapshot"""
+
+    def __init__(self, products: List[Dict]):
+        self.products = products
+        self._terms: Dict[str, Set[int]] = {}
+        self._features: Dict[str, Set[int]] = {}
+        for position, product in enumerate(products):
+            for term in tokenize(product["name"]) + tokenize(product.get("description")):
+                self._terms.setdefault(term, set()).add(position)
+            for feature in product.get("features") or ():
+                self._features.setdefault(normalize_feature(feature), set()).add(position)
+        self._vocabulary = sorted(self._terms)
+        self._order = {
+            sort: sorted(range(len(products)), key=lambda i, key=key: key(products[i]))
+            for sort, key in SORT_FIELDS.items()
+        }
+        self._rank = {sort: _ranks(order) for sort, order in self._order.items()}
+        self._prices = [products[i]["price"] for i in self._order["price"]]
+
+    def search(
+        self,
+        text: Optional[str] = None,
+        prefix: Optional[str] = None,
+        features: Iterable[str] = (),
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        currency: Optional[str] = None,
+        sort: str = "created_at",
+        descending: bool = False,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """Products matching every given filter, sorted and limited"""
+        if currency is not None and currency.casefold() != CATALOG_CURRENCY:
+            return []
+        postings: List[Set[int]] = []
+        for term in tokenize(text):
+            postings.append(self._terms.get(term, set()))
+        for term in tokenize(prefix):
+            postings.append(self._prefix(term))
+        for feature in features:
+            postings.append(self._features.get(normalize_feature(feature), set()))
+
+        price_order = self._order["price"]
+        low = 0 if min_price is None else bisect_left(self._prices, min_price)
+        high = len(price_order) if max_price is None else bisect_right(self._prices, max_price)
+        if low >= high:
+            return []
+        priced = low > 0 or high < len(price_order)
+
+        if postings:
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            if priced:
+                price_rank = self._rank["price"]
+                candidates = {i for i in candidates if low <= price_rank[i] < high}
+            positions = sorted(candidates, key=self._rank[sort].__getitem__, reverse=descending)
+        elif priced and sort != "price":
+            positions = sorted(price_order[low:high], key=self._rank[sort].__getitem__, reverse=descending)
+        else:
+            # Already in order: a slice of the price order or a whole sort order
+            order = self._order[sort][low:high] if sort == "price" else self._order[sort]
+            positions = order[::-1] if descending else order
+        if limit is not None:
+            positions = positions[:limit]
+        return [self.products[i] for i in positions]
+
+    def _prefix(self, prefix: str) -> Set[int]:
+        """Products containing a word that starts with prefix"""
+        matches: Set[int] = set()
+        vocabulary = self._vocabulary
+        index = bisect_left(vocabulary, prefix)
+        while index < len(vocabulary) and vocabulary[index].startswith(prefix):
+            matches |= self._terms[vocabulary[index]]
+            index += 1
+        return matches
+
+
+def _ranks(order: List[int]) -> List[int]:
+    rank = [0] * len(order)
+    for position, product in enumerate(order):
+        rank[product] = position
+    return rank
@@ -0,0 +1,195 @@
+"""Rate limiting and upstream load shedding.
+
+RateLimiter is a token bucket per key (client IP, email or user id).
+Buckets live in this worker's memory by default; RATE_LIMIT_STORE=database
+keeps them in the storage backend so every worker shares one budget, and
+falls back to memory if that store cannot be reached. Exhausted buckets
+answer 429 with Retry-After.
+
+UpstreamGate caps concurrent requests that call one upstream (Supabase
+Auth, Stripe). A request that cannot get a slot within
+UPSTREAM_QUEUE_TIMEOUT_SECONDS is shed with 503 and Retry-After instead
+of queueing behind a saturated dependency.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from fastapi import Depends, HTTPException, Request, status
+try:
+    from .instrumentation import Counter, REGISTRY, register_collector, labelled_gauge_lines
+    from .repository import rate_limit_repo
+    from .security import Principal, get_principal
+except ImportError:
+    from instrumentation import Counter, REGISTRY, register_collector, labelled_gauge_lines
+    from repository import rate_limit_repo
+    from security import Principal, get_principal
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+RATE_LIMIT_BUCKETS = int(os.getenv("RATE_LIMIT_BUCKETS", "100000"))
+# Use the first X-Forwarded-For address; only safe behind a proxy that sets it
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "false").lower() in ("1", "true", "yes")
+UPSTREAM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_SECONDS", "0.25"))
+UPSTREAM_RETRY_AFTER_SECONDS = int(os.getenv("UPSTREAM_RETRY_AFTER_SECONDS", "1"))
+
+RATE_LIMITED = Counter("rate_limited_total", "Requests rejected by a rate limit", ("limit",))
+UPSTREAM_SHED = Counter("upstream_shed_total", "Requests shed at an upstream concurrency cap", ("upstream",))
+REGISTRY.extend([RATE_LIMITED, UPSTREAM_SHED])
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(value: str) -> Optional[Tuple[float, float]]:
+    """Parse "N/period" into (tokens per second, capacity); "off" disables"""
+    value = value.strip().lower()
+    if value in ("", "0", "off", "none"):
+        return None
+    count, _, period = value.partition("/")
+    seconds = PERIODS.get(period.strip() or "second")
+    if seconds is None:
+        raise ValueError(f"Unknown rate period in {value!r}; use second, minute, hour or day")
+    capacity = float(count)
+    return capacity / seconds, capacity
+
+
+class MemoryBucketStore:
+    """Token buckets in this worker's memory, LRU-bounded"""
+
+    def __init__(self, maxsize: int = RATE_LIMIT_BUCKETS):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class DatabaseBucketStore:
+    """Token buckets in the storage backend, shared by every worker"""
+
+    def __init__(self, fallback: MemoryBucketStore):
+        self.fallback = fallback
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        # Keys can contain emails; store a digest instead
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        try:
+            return await rate_limit_repo.take(digest, rate, capacity, cost)
+        except Exception:
+            logger.warning("Shared rate-limit store unavailable; using worker-local buckets", exc_info=True)
+            return await self.fallback.take(key, rate, capacity, cost)
+
+
+memory_store = MemoryBucketStore()
+bucket_store = DatabaseBucketStore(memory_store) if RATE_LIMIT_STORE == "database" else memory_store
+
+
+class RateLimiter:
+    """A named token-bucket limit applied per key"""
+
+    def __init__(self, name: str, rate: str):
+        self.name = name
+        self.limit = parse_rate(rate)
+
+    async def hit(self, key: str) -> None:
+        """Take one token for key or raise 429"""
+        if self.limit is None:
+            return
+        rate, capacity = self.limit
+        allowed, retry_after = await bucket_store.take(f"{self.name}:{key}", rate, capacity)
+        if not allowed:
+            RATE_LIMITED.inc((self.name,))
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def limit_by_ip(limiter: RateLimiter) -> Callable:
+    """Dependency applying limiter to the client address"""
+    async def dependency(request: Request) -> None:
+        await limiter.hit(client_ip(request))
+    return dependency
+
+
+def limit_by_user(limiter: RateLimiter) -> Callable:
+    """Dependency applying limiter to the authenticated user"""
+    async def dependency(principal: Principal = Depends(get_principal)) -> None:
+        await limiter.hit(principal.user_id)
+    return dependency
+
+
+class UpstreamGate:
+    """Concurrency cap for requests that call one upstream"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+
+    async def __call__(self):
+        """Dependency holding a slot for the rest of the request"""
+        if self._semaphore is None:
+            yield
+            return
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), UPSTREAM_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            UPSTREAM_SHED.inc((self.name,))
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"{self.name} is busy, retry shortly",
+                headers={"Retry-After": str(UPSTREAM_RETRY_AFTER_SECONDS)},
+            )
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._semaphore.release()
+
+
+login_ip_limit = RateLimiter("login_ip", os.getenv("RATE_LIMIT_LOGIN_IP", "20/minute"))
+login_email_limit = RateLimiter("login_email", os.getenv("RATE_LIMIT_LOGIN_EMAIL", "5/minute"))
+register_ip_limit = RateLimiter("register_ip", os.getenv("RATE_LIMIT_REGISTER_IP", "5/minute"))
+checkout_user_limit = RateLimiter("checkout_user", os.getenv("RATE_LIMIT_CHECKOUT_USER", "10/minute"))
+
+auth_upstream = UpstreamGate("auth", int(os.getenv("UPSTREAM_AUTH_CONCURRENCY", "32")))
+stripe_upstream = UpstreamGate("stripe", int(os.getenv("UPSTREAM_STRIPE_CONCURRENCY", "32")))
+
+
+def _upstream_gauges():
+    yield from labelled_gauge_lines(
+        "upstream_in_use", "Requests holding an upstream concurrency slot", ("upstream",),
+        {(gate.name,): gate.in_use for gate in (auth_upstream, stripe_upstream)},
+    )
+
+register_collector(_upstream_gauges)
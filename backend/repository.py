@@ -0,0 +1,1031 @@
+"""Async data-access layer.
+
+The *Repository base classes are the storage interface the routers use;
+STORAGE_BACKEND selects the implementation behind the module singletons:
+"supabase" (default) or "sqlite" (embedded, see sqlite_store.py).
+
+supabase-py is synchronous, so every query is built on the event loop and
+executed on the bounded I/O executor from utils. Handlers await these
+methods and concurrent requests overlap their database round trips.
+"""
+import asyncio
+import os
+import base64
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from postgrest.exceptions import APIError
+try:
+    from .utils import get_supabase_admin, get_supabase_anon
+    from .cache import TTLCache, MISSING
+    from .instrumentation import execute_query
+except ImportError:
+    from utils import get_supabase_admin, get_supabase_anon
+    from cache import TTLCache, MISSING
+    from instrumentation import execute_query
+
+# Role lookups gate every admin request; unknown users are cached briefly too
+ROLE_CACHE_TTL_SECONDS = float(os.getenv("ROLE_CACHE_TTL_SECONDS", "30"))
+ROLE_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("ROLE_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+ROLE_CACHE_SIZE = int(os.getenv("ROLE_CACHE_SIZE", "10000"))
+# Approximate row counts shown alongside paginated listings
+COUNT_CACHE_TTL_SECONDS = float(os.getenv("COUNT_CACHE_TTL_SECONDS", "60"))
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+
+
+async def _execute(query) -> Any:
+    """Execute a PostgREST query off the event loop and return its data"""
+    response = await execute_query(query)
+    return response.data
+
+
+async def _execute_single(query, table: str, key: str) -> Dict:
+    """Execute a .single() query; LookupError when no row matches, as in sqlite_store"""
+    try:
+        return await _execute(query)
+    except APIError as e:
+        if e.code == "PGRST116":
+            raise LookupError(f"No {table} row matches {key}")
+        raise
+
+
+def encode_cursor(row: Dict) -> str:
+    """Encode the (created_at, id) keyset position of a row"""
+    raw = f"{row['created_at']}|{row['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode and validate a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(row_id))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+async def _keyset_page(query, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Fetch one page ordered by (created_at, id) descending"""
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})'
+        )
+    query = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+    rows = await _execute(query)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def _created_range(query, created_after: Optional[datetime], created_before: Optional[datetime]):
+    if created_after:
+        query = query.gte("created_at", created_after.isoformat())
+    if created_before:
+        query = query.lt("created_at", created_before.isoformat())
+    return query
+
+
+class ProfileRepository(ABC):
+    """Profiles storage interface; caches roles and row-count estimates"""
+
+    table = "profiles"
+
+    def __init__(self):
+        self.role_cache = TTLCache(maxsize=ROLE_CACHE_SIZE, ttl=ROLE_CACHE_TTL_SECONDS)
+        self.count_cache = TTLCache(maxsize=256, ttl=COUNT_CACHE_TTL_SECONDS)
+
+    @abstractmethod
+    async def get(self, user_id: str, columns: str = "*") -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: str = "*",
+        role: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Return one keyset page of profiles and the cursor for the next"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _insert(self, data: Dict) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _update(self, user_id: str, data: Dict) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _fetch_role(self, user_id: str) -> Any:
+        """The stored role, or MISSING if there is no profile"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _count(
+        self,
+        role: Optional[str],
+        created_after: Optional[datetime],
+        created_before: Optional[datetime],
+    ) -> Optional[int]:
+        raise NotImplementedError
+
+    async def count_estimate(
+        self,
+        role: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Optional[int]:
+        """Approximate row count, cached for COUNT_CACHE_TTL_SECONDS"""
+        key = (role, created_after, created_before)
+        count = self.count_cache.lookup(key)
+        if count is not MISSING:
+            return count
+        count = await self._count(role, created_after, created_before)
+        self.count_cache.set(key, count)
+        return count
+
+    async def get_role(self, user_id: str) -> Optional[str]:
+        """Return the user's role, or None if there is no profile"""
+        role = self.role_cache.lookup(user_id)
+        if role is not MISSING:
+            return role
+        role = await self._fetch_role(user_id)
+        if role is MISSING:
+            role = None
+            self.role_cache.set(user_id, None, ttl=ROLE_CACHE_NEGATIVE_TTL_SECONDS)
+        else:
+            self.role_cache.set(user_id, role)
+        return role
+
+    def invalidate_role(self, user_id: str) -> None:
+        self.role_cache.pop(user_id)
+
+    async def create(self, data: Dict) -> Dict:
+        row = await self._insert(data)
+        self.invalidate_role(row["id"])
+        return row
+
+    async def update(self, user_id: str, data: Dict) -> Dict:
+        row = await self._update(user_id, data)
+        if "role" in data:
+            self.invalidate_role(user_id)
+        return row
+
+
+class SupabaseProfileRepository(ProfileRepository):
+    """Profiles stored in Supabase"""
+
+    async def get(self, user_id: str, columns: str = "*") -> Dict:
+        query = get_supabase_admin().table(self.table).select(columns).eq("id", user_id).single()
+        return await _execute_single(query, self.table, user_id)
+
+    def _filtered(self, columns: str, role: Optional[str], created_after: Optional[datetime],
+                  created_before: Optional[datetime], count: Optional[str] = None):
+        query = get_supabase_admin().table(self.table).select(columns, count=count)
+        if role:
+            query = query.eq("role", role)
+        return _created_range(query, created_after, created_before)
+
+    async def page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: str = "*",
+        role: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        query = self._filtered(columns, role, created_after, created_before)
+        return await _keyset_page(query, limit, cursor)
+
+    async def _count(
+        self,
+        role: Optional[str],
+        created_after: Optional[datetime],
+        created_before: Optional[datetime],
+    ) -> Optional[int]:
+        # Planner estimate; an exact count would scan the table
+        query = self._filtered("id", role, created_after, created_before, count="estimated").limit(1)
+        response = await execute_query(query)
+        return response.count
+
+    async def _fetch_role(self, user_id: str) -> Any:
+        query = get_supabase_admin().table(self.table).select("role").eq("id", user_id).limit(1)
+        rows = await _execute(query)
+        return rows[0]["role"] if rows else MISSING
+
+    async def _insert(self, data: Dict) -> Dict:
+        rows = await _execute(get_supabase_admin().table(self.table).insert(data))
+        return rows[0]
+
+    async def _update(self, user_id: str, data: Dict) -> Dict:
+        rows = await _execute(get_supabase_admin().table(self.table).update(data).eq("id", user_id))
+        return rows[0]
+
+
+class ProductRepository(ABC):
+    """Products storage interface"""
+
+    table = "products"
+
+    @abstractmethod
+    async def list_all(self) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, product_id: str) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create(self, data: Dict) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, product_id: str, data: Dict) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, product_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def existing_ids(self, product_ids: List[str]) -> List[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def bulk_create(self, rows: List[Dict]) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def bulk_update(self, rows: List[Dict]) -> List[Dict]:
+        """Update existing rows by id; ids that no longer exist are left out
+        of the result and never inserted"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def bulk_delete(self, product_ids: List[str]) -> List[Dict]:
+        raise NotImplementedError
+
+
+class SupabaseProductRepository(ProductRepository):
+    """Products stored in Supabase"""
+
+    async def list_all(self) -> List[Dict]:
+        return await _execute(get_supabase_anon().table(self.table).select("*"))
+
+    async def get(self, product_id: str) -> Dict:
+        query = get_supabase_anon().table(self.table).select("*").eq("id", product_id).single()
+        return await _execute_single(query, self.table, product_id)
+
+    async def create(self, data: Dict) -> Dict:
+        rows = await _execute(get_supabase_admin().table(self.table).insert(data))
+        return rows[0]
+
+    async def update(self, product_id: str, data: Dict) -> Dict:
+        rows = await _execute(get_supabase_admin().table(self.table).update(data).eq("id", product_id))
+        return rows[0]
+
+    async def delete(self, product_id: str) -> None:
+        await _execute(get_supabase_admin().table(self.table).delete().eq("id", product_id))
+
+    async def existing_ids(self, product_ids: List[str]) -> List[str]:
+        query = get_supabase_admin().table(self.table).select("id").in_("id", product_ids)
+        return [row["id"] for row in await _execute(query)]
+
+    async def bulk_create(self, rows: List[Dict]) -> List[Dict]:
+        return await _execute(get_supabase_admin().table(self.table).insert(rows))
+
+    async def bulk_update(self, rows: List[Dict]) -> List[Dict]:
+        # One UPDATE per row, overlapped on the executor; an upsert would
+        # re-create a product deleted since the batch checked it
+        admin = get_supabase_admin()
+        updated = await asyncio.gather(*(
+            _execute(admin.table(self.table).update({k: v for k, v in row.items() if k != "id"}).eq("id", row["id"]))
+            for row in rows
+        ))
+        return [changed[0] for changed in updated if changed]
+
+    async def bulk_delete(self, product_ids: List[str]) -> List[Dict]:
+        return await _execute(get_supabase_admin().table(self.table).delete().in_("id", product_ids))
+
+
+class SubscriptionRepository(ABC):
+    """Subscriptions storage interface"""
+
+    table = "subscriptions"
+
+    @abstractmethod
+    async def list_for_user(self, user_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, subscription_id: str) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create(self, data: Dict) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, subscription_id: str, data: Dict) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_many_for_user(self, subscription_ids: List[str], user_id: str, data: Dict) -> List[Dict]:
+        """Update the listed subscriptions owned by user_id (status and end_date only);
+        returns the rows changed, each with the status it had before as previous_status"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: str = "*",
+        status: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Return one keyset page of subscriptions and the cursor for the next"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_by_stripe_id(self, stripe_subscription_id: str, columns: str = "*") -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_by_stripe_id(self, stripe_subscription_id: str, data: Dict) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_due(
+        self, status: str, due_before: datetime, limit: int, stripe_managed: bool, columns: str = "id,product_id"
+    ) -> List[Dict]:
+        """Subscriptions in status whose end_date is before due_before, earliest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_due(self, subscription_ids: List[str], status: str, due_before: datetime, data: Dict) -> List[Dict]:
+        """Update the listed subscriptions that are still in status and due; returns the rows changed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def renew_due(self, subscription_ids: List[str], status: str, due_before: datetime, period_days: int) -> List[Dict]:
+        """Like update_due, moving each end_date period_days past its current value"""
+        raise NotImplementedError
+
+
+class SupabaseSubscriptionRepository(SubscriptionRepository):
+    """Subscriptions stored in Supabase"""
+
+    async def list_for_user(self, user_id: str) -> List[Dict]:
+        query = get_supabase_admin().table(self.table).select("*").eq("user_id", user_id)
+        return await _execute(query)
+
+    async def get(self, subscription_id: str) -> Dict:
+        query = get_supabase_admin().table(self.table).select("*").eq("id", subscription_id).single()
+        return await _execute_single(query, self.table, subscription_id)
+
+    async def create(self, data: Dict) -> Dict:
+        rows = await _execute(get_supabase_admin().table(self.table).insert(data))
+        return rows[0]
+
+    async def update(self, subscription_id: str, data: Dict) -> Dict:
+        query = get_supabase_admin().table(self.table).update(data).eq("id", subscription_id)
+        rows = await _execute(query)
+        return rows[0]
+
+    async def update_many_for_user(self, subscription_ids: List[str], user_id: str, data: Dict) -> List[Dict]:
+        unsupported = set(data).difference(("status", "end_date"))
+        if unsupported:
+            raise ValueError(f"Cannot batch-update subscription column(s): {', '.join(sorted(unsupported))}")
+        # An RPC, since a plain UPDATE cannot return the statuses it replaced
+        query = get_supabase_admin().rpc("update_subscriptions_for_user", {
+            "subscription_ids": subscription_ids,
+            "owner_id": user_id,
+            "changes": data,
+        })
+        return await _execute(query)
+
+    async def page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: str = "*",
+        status: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        query = get_supabase_admin().table(self.table).select(columns)
+        if status:
+            query = query.eq("status", status)
+        query = _created_range(query, created_after, created_before)
+        return await _keyset_page(query, limit, cursor)
+
+    async def list_by_stripe_id(self, stripe_subscription_id: str, columns: str = "*") -> List[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .select(columns)
+            .eq("stripe_subscription_id", stripe_subscription_id)
+        )
+        return await _execute(query)
+
+    async def update_by_stripe_id(self, stripe_subscription_id: str, data: Dict) -> List[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .update(data)
+            .eq("stripe_subscription_id", stripe_subscription_id)
+        )
+        return await _execute(query)
+
+    async def list_due(
+        self, status: str, due_before: datetime, limit: int, stripe_managed: bool, columns: str = "id,product_id"
+    ) -> List[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .select(columns)
+            .eq("status", status)
+            .lte("end_date", due_before.isoformat())
+        )
+        if stripe_managed:
+            query = query.not_.is_("stripe_subscription_id", "null")
+        else:
+            query = query.is_("stripe_subscription_id", "null")
+        return await _execute(query.order("end_date").limit(limit))
+
+    async def update_due(self, subscription_ids: List[str], status: str, due_before: datetime, data: Dict) -> List[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .update(data)
+            .in_("id", subscription_ids)
+            .eq("status", status)
+            .lte("end_date", due_before.isoformat())
+        )
+        return await _execute(query)
+
+    async def renew_due(self, subscription_ids: List[str], status: str, due_before: datetime, period_days: int) -> List[Dict]:
+        query = get_supabase_admin().rpc("renew_due_subscriptions", {
+            "subscription_ids": subscription_ids,
+            "due_status": status,
+            "due_before": due_before.isoformat(),
+            "period_days": period_days,
+        })
+        return await _execute(query)
+
+
+class StripeEventRepository(ABC):
+    """Durable log of received Stripe webhook events"""
+
+    table = "stripe_events"
+
+    @abstractmethod
+    async def record(self, data: Dict) -> bool:
+        """Insert an event; False if its id was already recorded"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, event_id: str, data: Dict) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, event_id: str) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_by_status(self, status: str, limit: int) -> List[Dict]:
+        """Oldest first by received_at"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_claimable(self, stale_before: datetime, limit: int) -> List[Dict]:
+        """Pending events that are unclaimed or were claimed before stale_before, oldest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim(self, event_id: str, stale_before: datetime) -> Optional[Dict]:
+        """Atomically claim a pending event that is unclaimed or was claimed
+        before stale_before; the claimed row, or None if another worker has it"""
+        raise NotImplementedError
+
+
+class SupabaseStripeEventRepository(StripeEventRepository):
+    """Stripe events stored in Supabase"""
+
+    async def record(self, data: Dict) -> bool:
+        query = get_supabase_admin().table(self.table).upsert(data, on_conflict="id", ignore_duplicates=True)
+        rows = await _execute(query)
+        return bool(rows)
+
+    async def update(self, event_id: str, data: Dict) -> None:
+        await _execute(get_supabase_admin().table(self.table).update(data).eq("id", event_id))
+
+    async def get(self, event_id: str) -> Dict:
+        query = get_supabase_admin().table(self.table).select("*").eq("id", event_id).single()
+        return await _execute_single(query, self.table, event_id)
+
+    async def list_by_status(self, status: str, limit: int) -> List[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .select("*")
+            .eq("status", status)
+            .order("received_at")
+            .limit(limit)
+        )
+        return await _execute(query)
+
+    async def list_claimable(self, stale_before: datetime, limit: int) -> List[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .select("*")
+            .eq("status", "pending")
+            .or_(f"claimed_at.is.null,claimed_at.lt.{stale_before.isoformat()}")
+            .order("received_at")
+            .limit(limit)
+        )
+        return await _execute(query)
+
+    async def claim(self, event_id: str, stale_before: datetime) -> Optional[Dict]:
+        # One UPDATE: a concurrent claimer re-checks the filters after the row lock and matches nothing
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .update({"claimed_at": datetime.utcnow().isoformat()})
+            .eq("id", event_id)
+            .eq("status", "pending")
+            .or_(f"claimed_at.is.null,claimed_at.lt.{stale_before.isoformat()}")
+        )
+        rows = await _execute(query)
+        return rows[0] if rows else None
+
+
+class CacheVersionRepository(ABC):
+    """Shared version counters used to invalidate per-worker caches"""
+
+    table = "cache_versions"
+
+    @abstractmethod
+    async def get(self, name: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def bump(self, name: str) -> int:
+        """Atomically increment a counter and return the new value"""
+        raise NotImplementedError
+
+
+class SupabaseCacheVersionRepository(CacheVersionRepository):
+    """Cache versions stored in Supabase"""
+
+    async def get(self, name: str) -> int:
+        query = get_supabase_admin().table(self.table).select("version").eq("name", name)
+        rows = await _execute(query)
+        return rows[0]["version"] if rows else 0
+
+    async def bump(self, name: str) -> int:
+        query = get_supabase_admin().rpc("bump_cache_version", {"cache_name": name})
+        return await _execute(query)
+
+
+class SchedulerLeaseRepository(ABC):
+    """Expiring leases that elect one worker to run a background job"""
+
+    table = "scheduler_leases"
+
+    @abstractmethod
+    async def acquire(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        """Take or renew the lease if it is free, expired or already held by holder"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, name: str, holder: str) -> None:
+        raise NotImplementedError
+
+
+class SupabaseSchedulerLeaseRepository(SchedulerLeaseRepository):
+    """Leases in Supabase, taken by the acquire_scheduler_lease function"""
+
+    async def acquire(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        query = get_supabase_admin().rpc("acquire_scheduler_lease", {
+            "lease_name": name,
+            "lease_holder": holder,
+            "ttl_seconds": ttl_seconds,
+        })
+        return bool(await _execute(query))
+
+    async def release(self, name: str, holder: str) -> None:
+        query = get_supabase_admin().table(self.table).delete().eq("name", name).eq("holder", holder)
+        await _execute(query)
+
+
+class SubscriptionMetricRepository(ABC):
+    """Named subscription counters shared by every worker"""
+
+    table = "subscription_metrics"
+
+    @abstractmethod
+    async def add(self, deltas: Dict[str, int]) -> None:
+        """Atomically add each delta to its counter, creating missing ones"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def all(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def replace(self, prefixes: List[str], counts: Dict[str, int]) -> None:
+        """Atomically replace every counter named under prefixes with counts"""
+        raise NotImplementedError
+
+
+class SupabaseSubscriptionMetricRepository(SubscriptionMetricRepository):
+    """Counters in Supabase, changed through the *_subscription_metrics functions"""
+
+    async def add(self, deltas: Dict[str, int]) -> None:
+        await _execute(get_supabase_admin().rpc("add_subscription_metrics", {"deltas": deltas}))
+
+    async def all(self) -> Dict[str, int]:
+        rows = await _execute(get_supabase_admin().table(self.table).select("name, value"))
+        return {row["name"]: row["value"] for row in rows}
+
+    async def replace(self, prefixes: List[str], counts: Dict[str, int]) -> None:
+        query = get_supabase_admin().rpc("replace_subscription_metrics", {"prefixes": prefixes, "counts": counts})
+        await _execute(query)
+
+
+class IdempotencyRepository(ABC):
+    """Idempotency keys and the responses recorded for them, shared by every worker"""
+
+    table = "idempotency_keys"
+
+    @abstractmethod
+    async def claim(self, key: str, fingerprint: str, ttl_seconds: float) -> bool:
+        """Reserve an unused or expired key; False if it is already taken"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict]:
+        """The unexpired record (fingerprint, status_code, body) or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete(self, key: str, status_code: int, body: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, key: str) -> None:
+        """Drop a claim whose request failed so it can be retried"""
+        raise NotImplementedError
+
+
+class SupabaseIdempotencyRepository(IdempotencyRepository):
+    """Idempotency keys in Supabase, claimed by the claim_idempotency_key function"""
+
+    async def claim(self, key: str, fingerprint: str, ttl_seconds: float) -> bool:
+        query = get_supabase_admin().rpc("claim_idempotency_key", {
+            "idempotency_key": key,
+            "request_fingerprint": fingerprint,
+            "ttl_seconds": ttl_seconds,
+        })
+        return bool(await _execute(query))
+
+    async def get(self, key: str) -> Optional[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .select("fingerprint,status_code,body")
+            .eq("key", key)
+            .gt("expires_at", datetime.utcnow().isoformat())
+        )
+        rows = await _execute(query)
+        return rows[0] if rows else None
+
+    async def complete(self, key: str, status_code: int, body: str) -> None:
+        query = get_supabase_admin().table(self.table).update({"status_code": status_code, "body": body}).eq("key", key)
+        await _execute(query)
+
+    async def release(self, key: str) -> None:
+        query = get_supabase_admin().table(self.table).delete().eq("key", key).is_("status_code", "null")
+        await _execute(query)
+
+
+LAST_OWNER_MESSAGE = "An organization needs at least one owner"
+
+
+class LastOwnerError(Exception):
+    """A member change rejected for leaving its organization without an owner"""
+
+
+def _raise_if_last_owner(error: Exception) -> None:
+    # Both backends enforce the rule with a trigger that fails with this message
+    if LAST_OWNER_MESSAGE in str(error):
+        raise LastOwnerError(LAST_OWNER_MESSAGE) from error
+
+
+class OrganizationRepository(ABC):
+    """Organizations and their members"""
+
+    table = "organizations"
+
+    @abstractmethod
+    async def create(self, name: str, owner_id: str) -> Dict:
+        """Create an organization with owner_id as its owner"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, organization_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update(self, organization_id: str, data: Dict) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, organization_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_for_user(self, user_id: str) -> List[Dict]:
+        """Organizations the user belongs to, each with the user's role"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def memberships(self, organization_id: str) -> List[Dict]:
+        """user_id and role of every member"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def user_memberships(self, user_id: str) -> List[Dict]:
+        """organization_id and role of every membership the user has"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def members(self, organization_id: str) -> List[Dict]:
+        """Members with their profile's full_name and email"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_member(self, organization_id: str, user_id: str, role: str) -> Optional[Dict]:
+        """The updated member with full_name and email, or None if not a member.
+
+        Raises LastOwnerError if this would demote the organization's last owner.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove_member(self, organization_id: str, user_id: str) -> bool:
+        """Raises LastOwnerError if user_id is the organization's last owner"""
+        raise NotImplementedError
+
+
+def _flatten_profile(row: Dict) -> Dict:
+    profile = row.pop("profiles", None) or {}
+    row["full_name"] = profile.get("full_name")
+    row["email"] = profile.get("email")
+    return row
+
+
+class SupabaseOrganizationRepository(OrganizationRepository):
+    """Organizations in Supabase; creation goes through the create_organization function"""
+
+    members_table = "organization_members"
+
+    async def create(self, name: str, owner_id: str) -> Dict:
+        query = get_supabase_admin().rpc("create_organization", {"org_name": name, "owner_id": owner_id})
+        return await _execute(query)
+
+    async def get(self, organization_id: str) -> Optional[Dict]:
+        query = get_supabase_admin().table(self.table).select("*").eq("id", organization_id).limit(1)
+        rows = await _execute(query)
+        return rows[0] if rows else None
+
+    async def update(self, organization_id: str, data: Dict) -> Dict:
+        rows = await _execute(get_supabase_admin().table(self.table).update(data).eq("id", organization_id))
+        return rows[0]
+
+    async def delete(self, organization_id: str) -> None:
+        await _execute(get_supabase_admin().table(self.table).delete().eq("id", organization_id))
+
+    async def list_for_user(self, user_id: str) -> List[Dict]:
+        query = get_supabase_admin().table(self.members_table).select("role, organizations(*)").eq("user_id", user_id)
+        return [{**row["organizations"], "role": row["role"]} for row in await _execute(query)]
+
+    async def memberships(self, organization_id: str) -> List[Dict]:
+        query = get_supabase_admin().table(self.members_table).select("user_id, role").eq("organization_id", organization_id)
+        return await _execute(query)
+
+    async def user_memberships(self, user_id: str) -> List[Dict]:
+        query = get_supabase_admin().table(self.members_table).select("organization_id, role").eq("user_id", user_id)
+        return await _execute(query)
+
+    async def members(self, organization_id: str) -> List[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.members_table)
+            .select("user_id, role, created_at, profiles(full_name, email)")
+            .eq("organization_id", organization_id)
+            .order("created_at")
+        )
+        return [_flatten_profile(row) for row in await _execute(query)]
+
+    async def update_member(self, organization_id: str, user_id: str, role: str) -> Optional[Dict]:
+        query = (
+            get_supabase_admin()
+            .table(self.members_table)
+            .update({"role": role})
+            .eq("organization_id", organization_id)
+            .eq("user_id", user_id)
+        )
+        try:
+            updated = await _execute(query)
+        except Exception as e:
+            _raise_if_last_owner(e)
+            raise
+        if not updated:
+            return None
+        query = (
+            get_supabase_admin()
+            .table(self.members_table)
+            .select("user_id, role, created_at, profiles(full_name, email)")
+            .eq("organization_id", organization_id)
+            .eq("user_id", user_id)
+        )
+        rows = await _execute(query)
+        return _flatten_profile(rows[0]) if rows else None
+
+    async def remove_member(self, organization_id: str, user_id: str) -> bool:
+        query = (
+            get_supabase_admin()
+            .table(self.members_table)
+            .delete()
+            .eq("organization_id", organization_id)
+            .eq("user_id", user_id)
+        )
+        try:
+            return bool(await _execute(query))
+        except Exception as e:
+            _raise_if_last_owner(e)
+            raise
+
+
+class OrganizationInviteRepository(ABC):
+    """Email invitations to join an organization"""
+
+    table = "organization_invites"
+
+    @abstractmethod
+    async def bulk_create(self, organization_id: str, rows: List[Dict]) -> List[Dict]:
+        """Insert invites, first revoking expired pending invites to the same addresses"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_pending(self, organization_id: str) -> List[Dict]:
+        """Unexpired pending invites, oldest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def pending_emails(self, organization_id: str, emails: List[str]) -> List[str]:
+        """The given addresses that already have a pending invite"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_for_email(self, email: str) -> List[Dict]:
+        """Unexpired pending invites to an address, with organization_name"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def revoke(self, organization_id: str, invite_id: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def accept(self, invite_id: str, user_id: str, email: str) -> Optional[Dict]:
+        """Mark the invite accepted and add the membership; None if it is not acceptable"""
+        raise NotImplementedError
+
+
+class SupabaseOrganizationInviteRepository(OrganizationInviteRepository):
+    """Invites in Supabase, accepted by the accept_organization_invite function"""
+
+    async def bulk_create(self, organization_id: str, rows: List[Dict]) -> List[Dict]:
+        # Expired invites still hold the one-pending-invite-per-address index
+        expired = (
+            get_supabase_admin()
+            .table(self.table)
+            .update({"status": "revoked"})
+            .eq("organization_id", organization_id)
+            .eq("status", "pending")
+            .lte("expires_at", datetime.utcnow().isoformat())
+            .in_("email", [row["email"] for row in rows])
+        )
+        await _execute(expired)
+        return await _execute(get_supabase_admin().table(self.table).insert(rows))
+
+    def _pending(self, columns: str = "*"):
+        return (
+            get_supabase_admin()
+            .table(self.table)
+            .select(columns)
+            .eq("status", "pending")
+            .gt("expires_at", datetime.utcnow().isoformat())
+        )
+
+    async def list_pending(self, organization_id: str) -> List[Dict]:
+        query = self._pending().eq("organization_id", organization_id).order("created_at")
+        return await _execute(query)
+
+    async def pending_emails(self, organization_id: str, emails: List[str]) -> List[str]:
+        query = self._pending("email").eq("organization_id", organization_id).in_("email", emails)
+        return [row["email"] for row in await _execute(query)]
+
+    async def list_for_email(self, email: str) -> List[Dict]:
+        rows = await _execute(self._pending("*, organizations(name)").eq("email", email).order("created_at"))
+        for row in rows:
+            row["organization_name"] = (row.pop("organizations", None) or {}).get("name")
+        return rows
+
+    async def revoke(self, organization_id: str, invite_id: str) -> bool:
+        query = (
+            get_supabase_admin()
+            .table(self.table)
+            .update({"status": "revoked"})
+            .eq("id", invite_id)
+            .eq("organization_id", organization_id)
+            .eq("status", "pending")
+        )
+        return bool(await _execute(query))
+
+    async def accept(self, invite_id: str, user_id: str, email: str) -> Optional[Dict]:
+        query = get_supabase_admin().rpc("accept_organization_invite", {
+            "invite_id": invite_id,
+            "accepting_user": user_id,
+            "user_email": email,
+        })
+        rows = await _execute(query)
+        return rows[0] if rows else None
+
+
+class RateLimitRepository(ABC):
+    """Token buckets shared by every API worker"""
+
+    table = "rate_limit_buckets"
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Refill the bucket, then try to take cost tokens atomically.
+
+        Returns (allowed, seconds until enough tokens would be available).
+        """
+        raise NotImplementedError
+
+
+class SupabaseRateLimitRepository(RateLimitRepository):
+    """Rate-limit buckets in Supabase, updated by the take_rate_limit_token function"""
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        query = get_supabase_admin().rpc("take_rate_limit_token", {
+            "bucket_key": key,
+            "refill_per_second": rate,
+            "bucket_capacity": capacity,
+            "cost": cost,
+        })
+        result = await _execute(query)
+        return bool(result["allowed"]), float(result["retry_after"])
+
+
+if STORAGE_BACKEND == "sqlite":
+    # Imported late: sqlite_store subclasses the interfaces defined above
+    try:
+        from .sqlite_store import create_repositories
+    except ImportError:
+        from sqlite_store import create_repositories
+    (profile_repo, product_repo, subscription_repo, stripe_event_repo, cache_version_repo,
+     rate_limit_repo, scheduler_lease_repo, idempotency_repo, organization_repo,
+     organization_invite_repo, subscription_metric_repo) = create_repositories()
+elif STORAGE_BACKEND == "supabase":
+    profile_repo = SupabaseProfileRepository()
+    product_repo = SupabaseProductRepository()
+    subscription_repo = SupabaseSubscriptionRepository()
+    stripe_event_repo = SupabaseStripeEventRepository()
+    cache_version_repo = SupabaseCacheVersionRepository()
+    rate_limit_repo = SupabaseRateLimitRepository()
+    scheduler_lease_repo = SupabaseSchedulerLeaseRepository()
+    idempotency_repo = SupabaseIdempotencyRepository()
+    organization_repo = SupabaseOrganizationRepository()
+    organization_invite_repo = SupabaseOrganizationInviteRepository()
+    subscription_metric_repo = SupabaseSubscriptionMetricRepository()
+else:
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected 'supabase' or 'sqlite'")
@@ -0,0 +1,203 @@
+"""Request-scoped authentication.
+
+get_principal verifies the bearer token once per request and stores the
+result on request.state, so every dependency and nested call in the same
+request shares it. The profile and role are loaded lazily, at most once.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+from fastapi import Depends, HTTPException, Request, status
+try:
+    from .cache import TTLCache
+    from .utils import verify_jwt_token, verify_stream_ticket, extract_bearer_token, STREAM_TICKET_TTL_SECONDS
+    from .repository import profile_repo, idempotency_repo
+    from .memberships import membership_index, role_at_least
+except ImportError:
+    from cache import TTLCache
+    from utils import verify_jwt_token, verify_stream_ticket, extract_bearer_token, STREAM_TICKET_TTL_SECONDS
+    from repository import profile_repo, idempotency_repo
+    from memberships import membership_index, role_at_least
+
+logger = logging.getLogger(__name__)
+
+# Ticket ids already used on this worker, kept until the tickets expire anyway;
+# a fast reject in front of the shared record
+_redeemed_tickets = TTLCache(maxsize=100000, ttl=STREAM_TICKET_TTL_SECONDS)
+
+
+class Principal:
+    """The authenticated caller of the current request"""
+
+    def __init__(self, claims: Dict):
+        self.claims = claims
+        self.user_id: str = claims["sub"]
+        self.email: Optional[str] = claims.get("email")
+        self._profile: Optional[Dict] = None
+        self._lock = asyncio.Lock()
+
+    async def profile(self) -> Dict:
+        """The caller's profile row, fetched on first use"""
+        if self._profile is None:
+            async with self._lock:
+                if self._profile is None:
+                    self._profile = await profile_repo.get(self.user_id)
+        return self._profile
+
+    def set_profile(self, profile: Dict) -> None:
+        """Replace the cached profile after the caller updates it"""
+        self._profile = profile
+
+    async def role(self) -> Optional[str]:
+        if self._profile is not None:
+            return self._profile.get("role")
+        return await profile_repo.get_role(self.user_id)
+
+
+async def get_principal(request: Request) -> Principal:
+    """Resolve the caller from the Authorization header once per request.
+
+    Async although it never awaits: FastAPI runs sync dependencies on the
+    threadpool, and token verification is cheap, cached CPU work.
+    """
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        return principal
+
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing authorization header"
+        )
+    return _authenticate(request, extract_bearer_token(authorization) or authorization.strip())
+
+
+async def get_stream_principal(request: Request) -> Principal:
+    """Like get_principal, also accepting a single-use ?ticket= (EventSource cannot set headers).
+
+    Tickets come from POST /api/subscriptions/stream/ticket and expire after
+    STREAM_TICKET_TTL_SECONDS, so the query string never carries the bearer token.
+    """
+    ticket = request.query_params.get("ticket")
+    if not ticket or request.headers.get("authorization"):
+        return await get_principal(request)
+    try:
+        claims = verify_stream_ticket(ticket)
+    except Exception:
+        claims = None
+    if claims is None or not await _redeem_ticket(claims["jti"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or used ticket"
+        )
+    principal = Principal(claims)
+    request.state.principal = principal
+    return principal
+
+
+async def _redeem_ticket(jti: str) -> bool:
+    """Mark a ticket used; False if it already was.
+
+    Redemptions are recorded in the shared idempotency table whatever
+    IDEMPOTENCY_STORE is, so a ticket is single-use across workers. If that
+    store cannot be reached the ticket is refused rather than trusted.
+    """
+    if _redeemed_tickets.get(jti) is not None:
+        return False
+    try:
+        redeemed = await idempotency_repo.claim(f"stream-ticket:{jti}", "", STREAM_TICKET_TTL_SECONDS)
+    except Exception:
+        logger.warning("Could not record stream ticket redemption", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Could not verify ticket",
+            headers={"Retry-After": "1"}
+        )
+    _redeemed_tickets.set(jti, True)
+    return redeemed
+
+
+def _authenticate(request: Request, token: str) -> Principal:
+    started = time.perf_counter()
+    try:
+        principal = Principal(verify_jwt_token(token))
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    finally:
+        request.state.auth_ms = (time.perf_counter() - started) * 1000
+    request.state.principal = principal
+    return principal
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware reporting time spent authenticating as Server-Timing.
+
+    Plain ASGI rather than @app.middleware("http"), which would put every
+    response, including long-lived event streams, through an extra task
+    and memory stream.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                auth_ms = scope.get("state", {}).get("auth_ms")
+                if auth_ms is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", f"auth;dur={auth_ms:.2f}".encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+async def get_current_user(principal: Principal = Depends(get_principal)) -> str:
+    """Id of the authenticated user"""
+    return principal.user_id
+
+
+async def get_admin_user(principal: Principal = Depends(get_principal)) -> str:
+    """Id of the authenticated user, who must be an admin"""
+    try:
+        role = await principal.role()
+    except Exception:
+        role = None
+    if role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return principal.user_id
+
+
+def require_organization_role(minimum: str):
+    """Dependency: the caller's role in the path's organization, at least minimum.
+
+    Answered from the membership index, so it costs no query once warm.
+    Non-members get 404 so organization ids cannot be probed.
+    """
+    async def organization_role(organization_id: str, principal: Principal = Depends(get_principal)) -> str:
+        role = await membership_index.role(organization_id, principal.user_id)
+        if role is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Organization not found"
+            )
+        if not role_at_least(role, minimum):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Requires the {minimum} role in this organization"
+            )
+        return role
+    return organization_role
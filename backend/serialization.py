@@ -0,0 +1,33 @@
+"""Response serialization fast path.
+
+For a plain return value FastAPI validates it against response_model, dumps
+the result to Python objects and encodes those with the json module. Hot
+handlers instead validate once with a cached TypeAdapter and return the
+JSON bytes pydantic-core produces, or hand data that is already validated
+(the product catalog) straight to orjson. Returning a Response skips
+FastAPI's pass; routes keep response_model so the OpenAPI schema is
+unchanged. Everything else goes through the app's ORJSONResponse default.
+"""
+from functools import lru_cache
+from typing import Any
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def type_adapter(tp: Any) -> TypeAdapter:
+    """Build the validator/serializer for a type once per process"""
+    return TypeAdapter(tp)
+
+
+def model_response(tp: Any, data: Any, status_code: int = 200, exclude_unset: bool = False) -> Response:
+    """Validate data as tp and respond with its JSON serialization"""
+    adapter = type_adapter(tp)
+    body = adapter.dump_json(adapter.validate_python(data), exclude_unset=exclude_unset)
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """Respond with data that has already been validated"""
+    return ORJSONResponse(content, status_code=status_code)
@@ -0,0 +1,984 @@
+"""Embedded SQLite storage backend, selected with STORAGE_BACKEND=sqlite.
+
+Implements the repository interfaces on a local database file for
+single-node deployments, tests and benchmarks. The database runs in WAL
+mode so readers never wait for the writer, and a small pool of
+connections is shared by the I/O executor threads. The schema mirrors
+scripts/01_create_tables.sql plus the cache_versions, stripe_events,
+rate_limit_buckets, scheduler_leases, idempotency_keys, organization and
+subscription_metrics tables, with indexes for every lookup and keyset scan
+the routers make.
+"""
+import os
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+try:
+    from .repository import (
+        ProfileRepository, ProductRepository, SubscriptionRepository,
+        StripeEventRepository, CacheVersionRepository, RateLimitRepository,
+        SchedulerLeaseRepository, IdempotencyRepository, OrganizationRepository,
+        OrganizationInviteRepository, SubscriptionMetricRepository,
+        encode_cursor, decode_cursor, _raise_if_last_owner,
+    )
+    from .cache import MISSING
+    from .instrumentation import call_sqlite
+except ImportError:
+    from repository import (
+        ProfileRepository, ProductRepository, SubscriptionRepository,
+        StripeEventRepository, CacheVersionRepository, RateLimitRepository,
+        SchedulerLeaseRepository, IdempotencyRepository, OrganizationRepository,
+        OrganizationInviteRepository, SubscriptionMetricRepository,
+        encode_cursor, decode_cursor, _raise_if_last_owner,
+    )
+    from cache import MISSING
+    from instrumentation import call_sqlite
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "saas.db")
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+  id TEXT PRIMARY KEY,
+  full_name TEXT,
+  email TEXT UNIQUE,
+  avatar_url TEXT,
+  role TEXT DEFAULT 'user' CHECK (role IN ('user', 'admin')),
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_profiles_created ON profiles(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_profiles_role_created ON profiles(role, created_at, id);
+
+CREATE TABLE IF NOT EXISTS products (
+  id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  description TEXT,
+  price REAL NOT NULL,
+  stripe_price_id TEXT,
+  features TEXT DEFAULT '[]',
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS subscriptions (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+  product_id TEXT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+  stripe_subscription_id TEXT UNIQUE,
+  status TEXT DEFAULT 'inactive' CHECK (status IN ('active', 'canceled', 'past_due', 'inactive')),
+  start_date TEXT,
+  end_date TEXT,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id ON subscriptions(user_id);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_product_id ON subscriptions(product_id);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_created ON subscriptions(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_status_created ON subscriptions(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_status_end_date ON subscriptions(status, end_date);
+
+CREATE TABLE IF NOT EXISTS cache_versions (
+  name TEXT PRIMARY KEY,
+  version INTEGER NOT NULL DEFAULT 0,
+  updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS stripe_events (
+  id TEXT PRIMARY KEY,
+  type TEXT NOT NULL,
+  ordering_key TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'processed', 'dead')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  received_at TEXT NOT NULL,
+  processed_at TEXT,
+  claimed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_stripe_events_status_received ON stripe_events(status, received_at);
+
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+  key TEXT PRIMARY KEY,
+  tokens REAL NOT NULL,
+  updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS scheduler_leases (
+  name TEXT PRIMARY KEY,
+  holder TEXT NOT NULL,
+  expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  key TEXT PRIMARY KEY,
+  fingerprint TEXT NOT NULL,
+  status_code INTEGER,
+  body TEXT,
+  expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at);
+
+CREATE TABLE IF NOT EXISTS subscription_metrics (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL DEFAULT 0,
+  updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS organizations (
+  id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  created_by TEXT REFERENCES profiles(id) ON DELETE SET NULL,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS organization_members (
+  organization_id TEXT NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+  user_id TEXT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+  role TEXT NOT NULL DEFAULT 'member' CHECK (role IN ('owner', 'admin', 'member')),
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (organization_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_organization_members_user ON organization_members(user_id);
+-- Mirrors ensure_organization_owner in scripts/09_create_organizations.sql;
+-- writes are serialized, so the check cannot race another change
+CREATE TRIGGER IF NOT EXISTS organization_members_keep_owner_update
+BEFORE UPDATE OF role ON organization_members
+WHEN OLD.role = 'owner' AND NEW.role <> 'owner' AND NOT EXISTS (
+  SELECT 1 FROM organization_members
+   WHERE organization_id = OLD.organization_id AND role = 'owner' AND user_id <> OLD.user_id
+)
+BEGIN
+  SELECT RAISE(ABORT, 'An organization needs at least one owner');
+END;
+CREATE TRIGGER IF NOT EXISTS organization_members_keep_owner_delete
+BEFORE DELETE ON organization_members
+WHEN OLD.role = 'owner'
+  AND EXISTS (SELECT 1 FROM organizations WHERE id = OLD.organization_id)
+  AND NOT EXISTS (
+    SELECT 1 FROM organization_members
+     WHERE organization_id = OLD.organization_id AND role = 'owner' AND user_id <> OLD.user_id
+  )
+BEGIN
+  SELECT RAISE(ABORT, 'An organization needs at least one owner');
+END;
+
+CREATE TABLE IF NOT EXISTS organization_invites (
+  id TEXT PRIMARY KEY,
+  organization_id TEXT NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+  email TEXT NOT NULL,
+  role TEXT NOT NULL DEFAULT 'member' CHECK (role IN ('owner', 'admin', 'member')),
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'accepted', 'revoked')),
+  invited_by TEXT REFERENCES profiles(id) ON DELETE SET NULL,
+  expires_at TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_organization_invites_pending
+  ON organization_invites(organization_id, email) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_organization_invites_email_status ON organization_invites(email, status);
+"""
+
+COLUMNS = {
+    "profiles": ("id", "full_name", "email", "avatar_url", "role", "created_at", "updated_at"),
+    "products": ("id", "name", "description", "price", "stripe_price_id", "features", "created_at", "updated_at"),
+    "subscriptions": (
+        "id", "user_id", "product_id", "stripe_subscription_id", "status",
+        "start_date", "end_date", "created_at", "updated_at",
+    ),
+    "cache_versions": ("name", "version", "updated_at"),
+    "organizations": ("id", "name", "created_by", "created_at", "updated_at"),
+    "organization_members": ("organization_id", "user_id", "role", "created_at", "updated_at"),
+    "organization_invites": (
+        "id", "organization_id", "email", "role", "status", "invited_by",
+        "expires_at", "created_at", "updated_at",
+    ),
+    "stripe_events": (
+        "id", "type", "ordering_key", "payload", "status", "attempts",
+        "last_error", "received_at", "processed_at", "claimed_at",
+    ),
+}
+JSON_COLUMNS = {"features", "payload"}
+TIMESTAMP_COLUMNS = {
+    "created_at", "updated_at", "start_date", "end_date", "received_at", "processed_at", "expires_at",
+    "claimed_at",
+}
+# Filled in by the application when an insert omits them
+GENERATED_COLUMNS = {
+    "profiles": ("id", "created_at", "updated_at"),
+    "products": ("id", "created_at", "updated_at"),
+    "subscriptions": ("id", "created_at", "updated_at", "start_date"),
+    "stripe_events": ("received_at",),
+    "cache_versions": (),
+    "organizations": ("id", "created_at", "updated_at"),
+    "organization_members": ("created_at", "updated_at"),
+    "organization_invites": ("id", "created_at", "updated_at"),
+}
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+)
+
+
+def _timestamp(value: Any) -> Optional[str]:
+    """Normalise to UTC ISO-8601 with microseconds, so text order is time order"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _now() -> str:
+    return _timestamp(datetime.now(timezone.utc))
+
+
+def _encode(column: str, value: Any) -> Any:
+    value = getattr(value, "value", value)  # str enums
+    if value is None:
+        return None
+    if column in JSON_COLUMNS:
+        return json.dumps(value)
+    if column in TIMESTAMP_COLUMNS:
+        return _timestamp(value)
+    return value
+
+
+def _decode(row: sqlite3.Row) -> Dict:
+    data = dict(row)
+    for column in JSON_COLUMNS.intersection(data):
+        if data[column] is not None:
+            data[column] = json.loads(data[column])
+    return data
+
+
+def _check_columns(table: str, columns: Sequence[str]) -> None:
+    unknown = set(columns).difference(COLUMNS[table])
+    if unknown:
+        raise ValueError(f"Unknown {table} column(s): {', '.join(sorted(unknown))}")
+
+
+def _select_list(table: str, columns: str) -> str:
+    if columns.strip() == "*":
+        return "*"
+    names = [name.strip() for name in columns.split(",") if name.strip()]
+    _check_columns(table, names)
+    return ", ".join(names)
+
+
+def _insert(table: str, data: Dict, conflict: str = "") -> Tuple[str, List]:
+    row = dict(data)
+    now = _now()
+    for column in GENERATED_COLUMNS[table]:
+        if row.get(column) is None:
+            row[column] = str(uuid.uuid4()) if column == "id" else now
+    _check_columns(table, row)
+    names = list(row)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+        f"{conflict} RETURNING *"
+    )
+    return sql, [_encode(name, row[name]) for name in names]
+
+
+def _touch(table: str, data: Dict) -> Dict:
+    """data with a fresh updated_at, as the set_updated_at trigger in scripts/08_maintain_updated_at.sql sets it"""
+    if "updated_at" in COLUMNS[table] and "updated_at" not in data:
+        return {**data, "updated_at": _now()}
+    return data
+
+
+def _assignments(table: str, data: Dict) -> Tuple[str, List]:
+    _check_columns(table, data)
+    data = _touch(table, data)
+    return ", ".join(f"{name} = ?" for name in data), [_encode(name, value) for name, value in data.items()]
+
+
+def _placeholders(values: Sequence) -> str:
+    return ", ".join("?" * len(values))
+
+
+def _first(rows: List[Dict], table: str, key: str) -> Dict:
+    if not rows:
+        raise LookupError(f"No {table} row matches {key}")
+    return rows[0]
+
+
+class SQLiteDatabase:
+    """A database file with a bounded pool of shared connections"""
+
+    def __init__(self, path: str = SQLITE_PATH, pool_size: int = SQLITE_POOL_SIZE):
+        if path == ":memory:":
+            # A named shared-cache database, so every pooled connection sees it
+            path = f"file:saas-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        self.path = path
+        self.pool_size = pool_size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            uri=self.path.startswith("file:"),
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            isolation_level=None,  # explicit transactions only
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.pool_size:
+                conn = self._connect()
+                if self._opened == 0:
+                    conn.executescript(SCHEMA)
+                self._opened += 1
+                return conn
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def fetch_all(self, sql: str, params: Sequence = ()) -> List[Dict]:
+        with self.connection() as conn:
+            return [_decode(row) for row in conn.execute(sql, params).fetchall()]
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """A connection inside a write transaction, committed on success"""
+        with self.connection() as conn:
+            # IMMEDIATE takes the write lock up front instead of failing mid-transaction
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def write(self, statements: List[Tuple[str, Sequence]]) -> List[Dict]:
+        """Run statements in one transaction and return every RETURNING row"""
+        with self.transaction() as conn:
+            rows = []
+            for sql, params in statements:
+                rows.extend(conn.execute(sql, params).fetchall())
+        return [_decode(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            while not self._idle.empty():
+                self._idle.get_nowait().close()
+            self._opened = 0
+
+
+class _SQLiteRepository:
+    table: str
+
+    def __init__(self, db: SQLiteDatabase):
+        super().__init__()
+        self.db = db
+
+    async def _select(self, sql: str, params: Sequence = ()) -> List[Dict]:
+        return await call_sqlite(self.table, "select", self.db.fetch_all, sql, params)
+
+    async def _write(self, operation: str, statements: List[Tuple[str, Sequence]]) -> List[Dict]:
+        return await call_sqlite(self.table, operation, self.db.write, statements)
+
+    async def _keyset_page(
+        self, columns: str, where: List[str], params: List, limit: int, cursor: Optional[str]
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """One page ordered by (created_at, id) descending"""
+        where, params = list(where), list(params)
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            created_at = _timestamp(created_at)
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params += [created_at, created_at, row_id]
+        sql = f"SELECT {_select_list(self.table, columns)} FROM {self.table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        rows = await self._select(sql, params + [limit + 1])
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, encode_cursor(rows[-1])
+        return rows, None
+
+
+def _created_range(where: List[str], params: List, created_after: Optional[datetime],
+                   created_before: Optional[datetime]) -> None:
+    if created_after:
+        where.append("created_at >= ?")
+        params.append(_timestamp(created_after))
+    if created_before:
+        where.append("created_at < ?")
+        params.append(_timestamp(created_before))
+
+
+class SQLiteProfileRepository(_SQLiteRepository, ProfileRepository):
+    """Profiles stored in SQLite"""
+
+    async def get(self, user_id: str, columns: str = "*") -> Dict:
+        rows = await self._select(
+            f"SELECT {_select_list(self.table, columns)} FROM profiles WHERE id = ?", (user_id,)
+        )
+        return _first(rows, self.table, f"id={user_id}")
+
+    def _filters(self, role: Optional[str], created_after: Optional[datetime],
+                 created_before: Optional[datetime]) -> Tuple[List[str], List]:
+        where, params = [], []
+        if role:
+            where.append("role = ?")
+            params.append(role)
+        _created_range(where, params, created_after, created_before)
+        return where, params
+
+    async def page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: str = "*",
+        role: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        where, params = self._filters(role, created_after, created_before)
+        return await self._keyset_page(columns, where, params, limit, cursor)
+
+    async def _count(
+        self,
+        role: Optional[str],
+        created_after: Optional[datetime],
+        created_before: Optional[datetime],
+    ) -> Optional[int]:
+        # Exact: the role/created_at indexes make the count cheap
+        where, params = self._filters(role, created_after, created_before)
+        sql = "SELECT count(*) AS n FROM profiles" + (" WHERE " + " AND ".join(where) if where else "")
+        rows = await self._select(sql, params)
+        return rows[0]["n"]
+
+    async def _fetch_role(self, user_id: str) -> Any:
+        rows = await self._select("SELECT role FROM profiles WHERE id = ?", (user_id,))
+        return rows[0]["role"] if rows else MISSING
+
+    async def _insert(self, data: Dict) -> Dict:
+        rows = await self._write("insert", [_insert(self.table, data)])
+        return rows[0]
+
+    async def _update(self, user_id: str, data: Dict) -> Dict:
+        assignments, params = _assignments(self.table, data)
+        rows = await self._write("update", [
+            (f"UPDATE profiles SET {assignments} WHERE id = ? RETURNING *", params + [user_id]),
+        ])
+        return _first(rows, self.table, f"id={user_id}")
+
+
+class SQLiteProductRepository(_SQLiteRepository, ProductRepository):
+    """Products stored in SQLite"""
+
+    async def list_all(self) -> List[Dict]:
+        return await self._select("SELECT * FROM products")
+
+    async def get(self, product_id: str) -> Dict:
+        rows = await self._select("SELECT * FROM products WHERE id = ?", (product_id,))
+        return _first(rows, self.table, f"id={product_id}")
+
+    async def create(self, data: Dict) -> Dict:
+        rows = await self._write("insert", [_insert(self.table, data)])
+        return rows[0]
+
+    async def update(self, product_id: str, data: Dict) -> Dict:
+        assignments, params = _assignments(self.table, data)
+        rows = await self._write("update", [
+            (f"UPDATE products SET {assignments} WHERE id = ? RETURNING *", params + [product_id]),
+        ])
+        return _first(rows, self.table, f"id={product_id}")
+
+    async def delete(self, product_id: str) -> None:
+        await self._write("delete", [("DELETE FROM products WHERE id = ? RETURNING id", (product_id,))])
+
+    async def existing_ids(self, product_ids: List[str]) -> List[str]:
+        rows = await self._select(
+            f"SELECT id FROM products WHERE id IN ({_placeholders(product_ids)})", product_ids
+        )
+        return [row["id"] for row in rows]
+
+    async def bulk_create(self, rows: List[Dict]) -> List[Dict]:
+        return await self._write("insert", [_insert(self.table, row) for row in rows])
+
+    async def bulk_update(self, rows: List[Dict]) -> List[Dict]:
+        statements = []
+        for row in rows:
+            assignments, params = _assignments(self.table, {k: v for k, v in row.items() if k != "id"})
+            statements.append((f"UPDATE products SET {assignments} WHERE id = ? RETURNING *", params + [row["id"]]))
+        return await self._write("update", statements)
+
+    async def bulk_delete(self, product_ids: List[str]) -> List[Dict]:
+        return await self._write("delete", [
+            (f"DELETE FROM products WHERE id IN ({_placeholders(product_ids)}) RETURNING *", product_ids),
+        ])
+
+
+class SQLiteSubscriptionRepository(_SQLiteRepository, SubscriptionRepository):
+    """Subscriptions stored in SQLite"""
+
+    async def list_for_user(self, user_id: str) -> List[Dict]:
+        return await self._select("SELECT * FROM subscriptions WHERE user_id = ?", (user_id,))
+
+    async def get(self, subscription_id: str) -> Dict:
+        rows = await self._select("SELECT * FROM subscriptions WHERE id = ?", (subscription_id,))
+        return _first(rows, self.table, f"id={subscription_id}")
+
+    async def create(self, data: Dict) -> Dict:
+        rows = await self._write("insert", [_insert(self.table, data)])
+        return rows[0]
+
+    async def update(self, subscription_id: str, data: Dict) -> Dict:
+        assignments, params = _assignments(self.table, data)
+        rows = await self._write("update", [
+            (f"UPDATE subscriptions SET {assignments} WHERE id = ? RETURNING *", params + [subscription_id]),
+        ])
+        return _first(rows, self.table, f"id={subscription_id}")
+
+    def _update_many_for_user(self, subscription_ids: List[str], user_id: str, data: Dict) -> List[Dict]:
+        assignments, params = _assignments(self.table, data)
+        where = f"WHERE id IN ({_placeholders(subscription_ids)}) AND user_id = ?"
+        keys = list(subscription_ids) + [user_id]
+        # The write lock is held from the read on, so the previous statuses are the ones replaced
+        with self.db.transaction() as conn:
+            previous = dict(conn.execute(f"SELECT id, status FROM subscriptions {where}", keys).fetchall())
+            rows = conn.execute(f"UPDATE subscriptions SET {assignments} {where} RETURNING *", params + keys).fetchall()
+        return [{**_decode(row), "previous_status": previous[row["id"]]} for row in rows]
+
+    async def update_many_for_user(self, subscription_ids: List[str], user_id: str, data: Dict) -> List[Dict]:
+        return await call_sqlite(self.table, "update", self._update_many_for_user, subscription_ids, user_id, data)
+
+    async def page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        columns: str = "*",
+        status: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        _created_range(where, params, created_after, created_before)
+        return await self._keyset_page(columns, where, params, limit, cursor)
+
+    async def list_by_stripe_id(self, stripe_subscription_id: str, columns: str = "*") -> List[Dict]:
+        return await self._select(
+            f"SELECT {_select_list(self.table, columns)} FROM subscriptions WHERE stripe_subscription_id = ?",
+            (stripe_subscription_id,),
+        )
+
+    async def update_by_stripe_id(self, stripe_subscription_id: str, data: Dict) -> List[Dict]:
+        assignments, params = _assignments(self.table, data)
+        return await self._write("update", [(
+            f"UPDATE subscriptions SET {assignments} WHERE stripe_subscription_id = ? RETURNING *",
+            params + [stripe_subscription_id],
+        )])
+
+    async def list_due(
+        self, status: str, due_before: datetime, limit: int, stripe_managed: bool, columns: str = "id,product_id"
+    ) -> List[Dict]:
+        linked = "IS NOT NULL" if stripe_managed else "IS NULL"
+        return await self._select(
+            f"SELECT {_select_list(self.table, columns)} FROM subscriptions "
+            f"WHERE status = ? AND end_date <= ? AND stripe_subscription_id {linked} ORDER BY end_date LIMIT ?",
+            (status, _timestamp(due_before), limit),
+        )
+
+    async def update_due(self, subscription_ids: List[str], status: str, due_before: datetime, data: Dict) -> List[Dict]:
+        assignments, params = _assignments(self.table, data)
+        sql = (
+            f"UPDATE subscriptions SET {assignments} "
+            f"WHERE id IN ({_placeholders(subscription_ids)}) AND status = ? AND end_date <= ? RETURNING *"
+        )
+        return await self._write("update", [(sql, params + list(subscription_ids) + [status, _timestamp(due_before)])])
+
+    def _renew_due(self, subscription_ids: List[str], status: str, due_before: datetime, period_days: int) -> List[Dict]:
+        period = timedelta(days=period_days)
+        rows = []
+        with self.db.transaction() as conn:
+            due = conn.execute(
+                f"SELECT id, end_date FROM subscriptions "
+                f"WHERE id IN ({_placeholders(subscription_ids)}) AND status = ? AND end_date <= ?",
+                list(subscription_ids) + [status, _timestamp(due_before)],
+            ).fetchall()
+            for subscription_id, end_date in due:
+                assignments, params = _assignments(self.table, {
+                    "end_date": _timestamp(datetime.fromisoformat(end_date) + period),
+                })
+                rows.extend(conn.execute(
+                    f"UPDATE subscriptions SET {assignments} WHERE id = ? RETURNING *", params + [subscription_id],
+                ).fetchall())
+        return [_decode(row) for row in rows]
+
+    async def renew_due(self, subscription_ids: List[str], status: str, due_before: datetime, period_days: int) -> List[Dict]:
+        return await call_sqlite(self.table, "update", self._renew_due, subscription_ids, status, due_before, period_days)
+
+
+class SQLiteStripeEventRepository(_SQLiteRepository, StripeEventRepository):
+    """Stripe events stored in SQLite"""
+
+    async def record(self, data: Dict) -> bool:
+        rows = await self._write("upsert", [_insert(self.table, data, "ON CONFLICT (id) DO NOTHING")])
+        return bool(rows)
+
+    async def update(self, event_id: str, data: Dict) -> None:
+        assignments, params = _assignments(self.table, data)
+        await self._write("update", [
+            (f"UPDATE stripe_events SET {assignments} WHERE id = ? RETURNING id", params + [event_id]),
+        ])
+
+    async def get(self, event_id: str) -> Dict:
+        rows = await self._select("SELECT * FROM stripe_events WHERE id = ?", (event_id,))
+        return _first(rows, self.table, f"id={event_id}")
+
+    async def list_by_status(self, status: str, limit: int) -> List[Dict]:
+        return await self._select(
+            "SELECT * FROM stripe_events WHERE status = ? ORDER BY received_at LIMIT ?", (status, limit)
+        )
+
+    async def list_claimable(self, stale_before: datetime, limit: int) -> List[Dict]:
+        return await self._select(
+            "SELECT * FROM stripe_events WHERE status = 'pending' "
+            "AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY received_at LIMIT ?",
+            (_timestamp(stale_before), limit),
+        )
+
+    async def claim(self, event_id: str, stale_before: datetime) -> Optional[Dict]:
+        rows = await self._write("update", [(
+            "UPDATE stripe_events SET claimed_at = ? WHERE id = ? AND status = 'pending' "
+            "AND (claimed_at IS NULL OR claimed_at < ?) RETURNING *",
+            (_now(), event_id, _timestamp(stale_before)),
+        )])
+        return rows[0] if rows else None
+
+
+class SQLiteCacheVersionRepository(_SQLiteRepository, CacheVersionRepository):
+    """Cache versions stored in SQLite"""
+
+    async def get(self, name: str) -> int:
+        rows = await self._select("SELECT version FROM cache_versions WHERE name = ?", (name,))
+        return rows[0]["version"] if rows else 0
+
+    async def bump(self, name: str) -> int:
+        rows = await self._write("rpc", [(
+            "INSERT INTO cache_versions (name, version, updated_at) VALUES (?, 1, ?) "
+            "ON CONFLICT (name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at "
+            "RETURNING version",
+            (name, _now()),
+        )])
+        return rows[0]["version"]
+
+
+class SQLiteRateLimitRepository(_SQLiteRepository, RateLimitRepository):
+    """Rate-limit buckets in SQLite, shared by workers on the same host"""
+
+    def _take(self, key: str, rate: float, capacity: float, cost: float) -> Tuple[bool, float]:
+        now = time.time()
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row["tokens"] + (now - row["updated_at"]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now),
+            )
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        return await call_sqlite(self.table, "rpc", self._take, key, rate, capacity, cost)
+
+
+class SQLiteSchedulerLeaseRepository(_SQLiteRepository, SchedulerLeaseRepository):
+    """Leases in SQLite, shared by workers on the same host"""
+
+    def _acquire(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "INSERT INTO scheduler_leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE scheduler_leases.holder = excluded.holder OR scheduler_leases.expires_at < ? "
+                "RETURNING holder",
+                (name, holder, now + ttl_seconds, now),
+            ).fetchone()
+        return row is not None
+
+    async def acquire(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        return await call_sqlite(self.table, "rpc", self._acquire, name, holder, ttl_seconds)
+
+    async def release(self, name: str, holder: str) -> None:
+        await self._write("delete", [
+            ("DELETE FROM scheduler_leases WHERE name = ? AND holder = ? RETURNING name", [name, holder]),
+        ])
+
+
+class SQLiteSubscriptionMetricRepository(_SQLiteRepository, SubscriptionMetricRepository):
+    """Subscription counters in SQLite, shared by workers on the same host"""
+
+    _UPSERT = (
+        "INSERT INTO subscription_metrics (name, value, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value, updated_at = excluded.updated_at "
+        "RETURNING name"
+    )
+
+    async def add(self, deltas: Dict[str, int]) -> None:
+        now = _now()
+        await self._write("rpc", [(self._UPSERT, (name, delta, now)) for name, delta in sorted(deltas.items())])
+
+    async def all(self) -> Dict[str, int]:
+        rows = await self._select("SELECT name, value FROM subscription_metrics")
+        return {row["name"]: row["value"] for row in rows}
+
+    async def replace(self, prefixes: List[str], counts: Dict[str, int]) -> None:
+        now = _now()
+        statements = [
+            ("DELETE FROM subscription_metrics WHERE substr(name, 1, ?) = ? RETURNING name", (len(prefix), prefix))
+            for prefix in prefixes
+        ]
+        statements += [(self._UPSERT, (name, value, now)) for name, value in counts.items()]
+        await self._write("rpc", statements)
+
+
+class SQLiteIdempotencyRepository(_SQLiteRepository, IdempotencyRepository):
+    """Idempotency keys in SQLite, shared by workers on the same host"""
+
+    def _claim(self, key: str, fingerprint: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self.db.transaction() as conn:
+            # Expired keys are reclaimed here; purge the rest while holding the write lock
+            conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
+            row = conn.execute(
+                "INSERT INTO idempotency_keys (key, fingerprint, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO NOTHING RETURNING key",
+                (key, fingerprint, now + ttl_seconds),
+            ).fetchone()
+        return row is not None
+
+    async def claim(self, key: str, fingerprint: str, ttl_seconds: float) -> bool:
+        return await call_sqlite(self.table, "rpc", self._claim, key, fingerprint, ttl_seconds)
+
+    async def get(self, key: str) -> Optional[Dict]:
+        rows = await self._select(
+            "SELECT fingerprint, status_code, body FROM idempotency_keys WHERE key = ? AND expires_at >= ?",
+            (key, time.time()),
+        )
+        return rows[0] if rows else None
+
+    async def complete(self, key: str, status_code: int, body: str) -> None:
+        await self._write("update", [(
+            "UPDATE idempotency_keys SET status_code = ?, body = ? WHERE key = ? RETURNING key",
+            [status_code, body, key],
+        )])
+
+    async def release(self, key: str) -> None:
+        await self._write("delete", [
+            ("DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL RETURNING key", [key]),
+        ])
+
+
+class SQLiteOrganizationRepository(_SQLiteRepository, OrganizationRepository):
+    """Organizations and members stored in SQLite"""
+
+    async def create(self, name: str, owner_id: str) -> Dict:
+        organization_id = str(uuid.uuid4())
+        rows = await self._write("insert", [
+            _insert(self.table, {"id": organization_id, "name": name, "created_by": owner_id}),
+            _insert("organization_members", {"organization_id": organization_id, "user_id": owner_id, "role": "owner"}),
+        ])
+        return rows[0]
+
+    async def get(self, organization_id: str) -> Optional[Dict]:
+        rows = await self._select("SELECT * FROM organizations WHERE id = ?", (organization_id,))
+        return rows[0] if rows else None
+
+    async def update(self, organization_id: str, data: Dict) -> Dict:
+        assignments, params = _assignments(self.table, data)
+        rows = await self._write("update", [
+            (f"UPDATE organizations SET {assignments} WHERE id = ? RETURNING *", params + [organization_id]),
+        ])
+        return _first(rows, self.table, f"id={organization_id}")
+
+    async def delete(self, organization_id: str) -> None:
+        await self._write("delete", [("DELETE FROM organizations WHERE id = ? RETURNING id", (organization_id,))])
+
+    async def list_for_user(self, user_id: str) -> List[Dict]:
+        return await self._select(
+            "SELECT o.*, m.role FROM organization_members m "
+            "JOIN organizations o ON o.id = m.organization_id WHERE m.user_id = ? ORDER BY o.created_at",
+            (user_id,),
+        )
+
+    async def memberships(self, organization_id: str) -> List[Dict]:
+        return await self._select(
+            "SELECT user_id, role FROM organization_members WHERE organization_id = ?", (organization_id,)
+        )
+
+    async def user_memberships(self, user_id: str) -> List[Dict]:
+        return await self._select(
+            "SELECT organization_id, role FROM organization_members WHERE user_id = ?", (user_id,)
+        )
+
+    _MEMBERS_SQL = (
+        "SELECT m.user_id, m.role, m.created_at, p.full_name, p.email FROM organization_members m "
+        "LEFT JOIN profiles p ON p.id = m.user_id WHERE m.organization_id = ?"
+    )
+
+    async def members(self, organization_id: str) -> List[Dict]:
+        return await self._select(self._MEMBERS_SQL + " ORDER BY m.created_at", (organization_id,))
+
+    async def update_member(self, organization_id: str, user_id: str, role: str) -> Optional[Dict]:
+        assignments, params = _assignments("organization_members", {"role": role})
+        try:
+            rows = await self._write("update", [(
+                f"UPDATE organization_members SET {assignments} WHERE organization_id = ? AND user_id = ? RETURNING user_id",
+                params + [organization_id, user_id],
+            )])
+        except sqlite3.IntegrityError as e:
+            _raise_if_last_owner(e)
+            raise
+        if not rows:
+            return None
+        rows = await self._select(self._MEMBERS_SQL + " AND m.user_id = ?", (organization_id, user_id))
+        return rows[0] if rows else None
+
+    async def remove_member(self, organization_id: str, user_id: str) -> bool:
+        try:
+            rows = await self._write("delete", [(
+                "DELETE FROM organization_members WHERE organization_id = ? AND user_id = ? RETURNING user_id",
+                (organization_id, user_id),
+            )])
+        except sqlite3.IntegrityError as e:
+            _raise_if_last_owner(e)
+            raise
+        return bool(rows)
+
+
+_ROLE_RANK_SQL = "CASE {} WHEN 'owner' THEN 2 WHEN 'admin' THEN 1 ELSE 0 END"
+
+
+class SQLiteOrganizationInviteRepository(_SQLiteRepository, OrganizationInviteRepository):
+    """Organization invites stored in SQLite"""
+
+    async def bulk_create(self, organization_id: str, rows: List[Dict]) -> List[Dict]:
+        emails = [row["email"] for row in rows]
+        assignments, params = _assignments(self.table, {"status": "revoked"})
+        # Expired invites still hold the one-pending-invite-per-address index
+        expire = (
+            f"UPDATE organization_invites SET {assignments} WHERE organization_id = ? AND status = 'pending' "
+            f"AND expires_at <= ? AND email IN ({_placeholders(emails)}) RETURNING id",
+            params + [organization_id, _now()] + emails,
+        )
+        rows = await self._write("insert", [expire] + [_insert(self.table, row) for row in rows])
+        return [row for row in rows if "email" in row]
+
+    async def list_pending(self, organization_id: str) -> List[Dict]:
+        return await self._select(
+            "SELECT * FROM organization_invites WHERE organization_id = ? AND status = 'pending' "
+            "AND expires_at > ? ORDER BY created_at",
+            (organization_id, _now()),
+        )
+
+    async def pending_emails(self, organization_id: str, emails: List[str]) -> List[str]:
+        rows = await self._select(
+            f"SELECT email FROM organization_invites WHERE organization_id = ? AND status = 'pending' "
+            f"AND expires_at > ? AND email IN ({_placeholders(emails)})",
+            [organization_id, _now()] + list(emails),
+        )
+        return [row["email"] for row in rows]
+
+    async def list_for_email(self, email: str) -> List[Dict]:
+        return await self._select(
+            "SELECT i.*, o.name AS organization_name FROM organization_invites i "
+            "JOIN organizations o ON o.id = i.organization_id "
+            "WHERE i.email = ? AND i.status = 'pending' AND i.expires_at > ? ORDER BY i.created_at",
+            (email, _now()),
+        )
+
+    async def revoke(self, organization_id: str, invite_id: str) -> bool:
+        assignments, params = _assignments(self.table, {"status": "revoked"})
+        rows = await self._write("update", [(
+            f"UPDATE organization_invites SET {assignments} "
+            "WHERE id = ? AND organization_id = ? AND status = 'pending' RETURNING id",
+            params + [invite_id, organization_id],
+        )])
+        return bool(rows)
+
+    def _accept(self, invite_id: str, user_id: str, email: str) -> Optional[Dict]:
+        now = _now()
+        with self.db.transaction() as conn:
+            invite = conn.execute(
+                "UPDATE organization_invites SET status = 'accepted', updated_at = ? "
+                "WHERE id = ? AND status = 'pending' AND email = ? AND expires_at > ? RETURNING *",
+                (now, invite_id, email.lower(), now),
+            ).fetchone()
+            if invite is None:
+                return None
+            # An existing membership keeps the higher of its role and the invited one
+            member = conn.execute(
+                "INSERT INTO organization_members (organization_id, user_id, role, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (organization_id, user_id) DO UPDATE SET "
+                f"role = CASE WHEN {_ROLE_RANK_SQL.format('excluded.role')} > {_ROLE_RANK_SQL.format('role')} "
+                "THEN excluded.role ELSE role END, updated_at = excluded.updated_at RETURNING *",
+                (invite["organization_id"], user_id, invite["role"], now, now),
+            ).fetchone()
+        return _decode(member)
+
+    async def accept(self, invite_id: str, user_id: str, email: str) -> Optional[Dict]:
+        return await call_sqlite(self.table, "rpc", self._accept, invite_id, user_id, email)
+
+
+def create_repositories(db: Optional[SQLiteDatabase] = None) -> Tuple:
+    """Build every repository over one shared database"""
+    db = db or SQLiteDatabase()
+    return (
+        SQLiteProfileRepository(db),
+        SQLiteProductRepository(db),
+        SQLiteSubscriptionRepository(db),
+        SQLiteStripeEventRepository(db),
+        SQLiteCacheVersionRepository(db),
+        SQLiteRateLimitRepository(db),
+        SQLiteSchedulerLeaseRepository(db),
+        SQLiteIdempotencyRepository(db),
+        SQLiteOrganizationRepository(db),
+        SQLiteOrganizationInviteRepository(db),
+        SQLiteSubscriptionMetricRepository(db),
+    )
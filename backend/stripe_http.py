@@ -0,0 +1,44 @@
+"""Stripe HTTP client backed by the shared httpx pool."""
+import io
+import httpx
+from stripe import error
+from stripe.http_client import HTTPClient
+try:
+    from .http_pool import pooled_client
+except ImportError:
+    from http_pool import pooled_client
+
+
+class HTTPXClient(HTTPClient):
+    """stripe-python HTTPClient sending requests through the shared pool"""
+
+    name = "httpx"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client = pooled_client("stripe")
+
+    def request(self, method, url, headers, post_data=None):
+        response = self._send(method, url, headers, post_data)
+        return response.content, response.status_code, response.headers
+
+    def request_stream(self, method, url, headers, post_data=None):
+        response = self._send(method, url, headers, post_data)
+        return io.BytesIO(response.content), response.status_code, response.headers
+
+    def _send(self, method, url, headers, post_data) -> httpx.Response:
+        try:
+            return self._client.request(method, url, headers=headers, content=post_data)
+        except (httpx.TimeoutException, httpx.NetworkError) as e:
+            # Same policy as stripe's requests client: retry connect and timeout errors
+            raise error.APIConnectionError(
+                f"Unexpected error communicating with Stripe. (Network error: {type(e).__name__}: {e})",
+                should_retry=True,
+            )
+        except httpx.HTTPError as e:
+            raise error.APIConnectionError(
+                f"Unexpected error communicating with Stripe. (Network error: {type(e).__name__}: {e})"
+            )
+
+    def close(self):
+        self._client.close()
@@ -0,0 +1,45 @@
+"""supabase-py client whose PostgREST and GoTrue calls use the shared pool."""
+from gotrue import SyncMemoryStorage
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient as PostgrestSession
+from gotrue.http_clients import SyncClient as GoTrueSession
+from supabase import Client, ClientOptions
+from supabase._sync.auth_client import SyncSupabaseAuthClient
+try:
+    from .http_pool import pooled_client
+except ImportError:
+    from http_pool import pooled_client
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True) -> PostgrestSession:
+        # Pool timeouts apply instead of supabase-py's 120s default
+        return pooled_client(
+            "supabase", PostgrestSession, base_url=base_url, headers=headers, follow_redirects=True
+        )
+
+
+class PooledSupabaseClient(Client):
+    """Supabase client sending PostgREST and Auth requests through the shared pool"""
+
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=None) -> SyncPostgrestClient:
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema)
+
+    @staticmethod
+    def _init_supabase_auth_client(auth_url, client_options) -> SyncSupabaseAuthClient:
+        return SyncSupabaseAuthClient(
+            url=auth_url,
+            auto_refresh_token=client_options.auto_refresh_token,
+            persist_session=client_options.persist_session,
+            storage=client_options.storage,
+            headers=client_options.headers,
+            flow_type=client_options.flow_type,
+            http_client=pooled_client("supabase", GoTrueSession),
+        )
+
+
+def create_pooled_client(url: str, key: str) -> PooledSupabaseClient:
+    # Fresh options per client: create_client's default instance (and its
+    # headers) would otherwise be shared by the anon and admin clients
+    return PooledSupabaseClient.create(url, key, ClientOptions(storage=SyncMemoryStorage()))
@@ -1,45 +1,115 @@
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import TYPE_CHECKING, Any, Callable, Optional, Dict, TypeVar
 import jwt
-from supabase import create_client, Client
 import hashlib
 import secrets
+try:
+    from .cache import TTLCache
+except ImportError:
+    from cache import TTLCache
+
+if TYPE_CHECKING:
+    # supabase and stripe are imported on first use (or by the startup
+    # warmup), so processes that never call them skip the import cost
+    from supabase import Client
 
 _SUPABASE_URL = os.getenv("SUPABASE_URL")
 _SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 _SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-_supabase_anon: Optional[Client] = None
-_supabase_admin: Optional[Client] = None
+_supabase_anon: Optional["Client"] = None
+_supabase_admin: Optional["Client"] = None
+_stripe = None
 
 _JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Bounded pool for blocking client calls (supabase-py, stripe) so async
+# handlers never hold the event loop for a network round trip.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "32"))
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+T = TypeVar("T")
+
+# Upper bound on operations accepted by the batch endpoints
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+
+# Lifetime of the single-use tickets that authenticate event streams
+STREAM_TICKET_TTL_SECONDS = int(os.getenv("STREAM_TICKET_TTL_SECONDS", "30"))
+
+# Verified tokens keyed by SHA-256 digest; each entry expires at the token's exp
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+_token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE)
+
 def _require_env(value: Optional[str], name: str) -> str:
     if value:
         return value
     raise RuntimeError(f"Missing required environment variable: {name}")
 
-def get_supabase_anon() -> Client:
+def get_supabase_anon() -> "Client":
     global _supabase_anon
     if _supabase_anon is not None:
         return _supabase_anon
+    try:
+        from .supabase_http import create_pooled_client
+    except ImportError:
+        from supabase_http import create_pooled_client
     url = _require_env(_SUPABASE_URL, "SUPABASE_URL")
     key = _require_env(_SUPABASE_ANON_KEY, "SUPABASE_ANON_KEY")
-    _supabase_anon = create_client(url, key)
+    _supabase_anon = create_pooled_client(url, key)
     return _supabase_anon
 
-def get_supabase_admin() -> Client:
+def get_supabase_admin() -> "Client":
     global _supabase_admin
     if _supabase_admin is not None:
         return _supabase_admin
+    try:
+        from .supabase_http import create_pooled_client
+    except ImportError:
+        from supabase_http import create_pooled_client
     url = _require_env(_SUPABASE_URL, "SUPABASE_URL")
     key = _require_env(_SUPABASE_SERVICE_ROLE_KEY, "SUPABASE_SERVICE_ROLE_KEY")
-    _supabase_admin = create_client(url, key)
+    _supabase_admin = create_pooled_client(url, key)
     return _supabase_admin
 
+def get_stripe():
+    """The stripe module, configured from the environment on first use"""
+    global _stripe
+    if _stripe is not None:
+        return _stripe
+    import stripe
+    try:
+        from .stripe_http import HTTPXClient
+    except ImportError:
+        from stripe_http import HTTPXClient
+    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+    stripe.api_base = os.getenv("STRIPE_API_BASE", stripe.api_base)
+    stripe.default_http_client = HTTPXClient()
+    _stripe = stripe
+    return _stripe
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Get the shared executor used for blocking I/O"""
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(
+            max_workers=DB_EXECUTOR_WORKERS,
+            thread_name_prefix="io",
+        )
+    return _io_executor
+
+async def run_sync(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking callable on the I/O executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_io_executor(), functools.partial(func, *args, **kwargs)
+    )
+
 def _get_jwt_secret() -> str:
     return _require_env(_JWT_SECRET, "SUPABASE_JWT_SECRET")
 
@@ -56,13 +126,44 @@ def create_jwt_token(user_id: str, email: str) -> str:
 
 def verify_jwt_token(token: str) -> Dict:
     """Verify and decode a JWT token"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(key)
+    if payload is not None:
+        return dict(payload)
     try:
         payload = jwt.decode(token, _get_jwt_secret(), algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise Exception("Token has expired")
     except jwt.InvalidTokenError:
         raise Exception("Invalid token")
+    if "exp" in payload:
+        _token_cache.set(key, payload, expires_at=float(payload["exp"]))
+    return dict(payload)
+
+def _get_stream_ticket_secret() -> str:
+    # A key of its own, so tickets and bearer tokens are never accepted for each other
+    return hashlib.sha256(b"stream-ticket:" + _get_jwt_secret().encode()).hexdigest()
+
+def create_stream_ticket(user_id: str, email: Optional[str]) -> str:
+    """Create a short-lived ticket that opens one event stream"""
+    payload = {
+        "sub": user_id,
+        "email": email,
+        "jti": secrets.token_urlsafe(16),
+        "exp": datetime.utcnow() + timedelta(seconds=STREAM_TICKET_TTL_SECONDS)
+    }
+    return jwt.encode(payload, _get_stream_ticket_secret(), algorithm=JWT_ALGORITHM)
+
+def verify_stream_ticket(ticket: str) -> Dict:
+    """Verify and decode a stream ticket; callers must also redeem its jti once"""
+    try:
+        return jwt.decode(ticket, _get_stream_ticket_secret(), algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        raise Exception("Invalid ticket")
+
+def token_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters for the verified-token cache"""
+    return _token_cache.stats()
 
 def hash_password(password: str) -> str:
     """Hash a password using SHA256"""
@@ -76,12 +177,12 @@ class SupabaseClient:
     """Wrapper for Supabase client operations"""
     
     @staticmethod
-    def get_admin_client() -> Client:
+    def get_admin_client() -> "Client":
         """Get admin client for privileged operations"""
         return get_supabase_admin()
     
     @staticmethod
-    def get_user_client() -> Client:
+    def get_user_client() -> "Client":
         """Get user client"""
         return get_supabase_anon()
 
@@ -0,0 +1,68 @@
+"""Startup warmup run by the application lifespan before serving traffic.
+
+A new worker otherwise pays for importing the Supabase and Stripe SDKs,
+building their clients, opening TLS connections and loading the product
+catalog on its first requests. Each step is timed and best effort: a
+failure is logged and the request path falls back to lazy initialisation.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+try:
+    from .utils import get_supabase_anon, get_supabase_admin, get_stripe, run_sync
+    from .instrumentation import call_stripe
+    from .catalog import product_catalog
+except ImportError:
+    from utils import get_supabase_anon, get_supabase_admin, get_stripe, run_sync
+    from instrumentation import call_stripe
+    from catalog import product_catalog
+
+logger = logging.getLogger(__name__)
+
+STARTUP_WARMUP_TIMEOUT_SECONDS = float(os.getenv("STARTUP_WARMUP_TIMEOUT_SECONDS", "10"))
+# Make one cheap Stripe read so the first checkout does not open the connection
+WARMUP_STRIPE_REQUEST = os.getenv("WARMUP_STRIPE_REQUEST", "true").lower() in ("1", "true", "yes")
+
+
+async def _step(name: str, func: Callable[[], Awaitable[None]], timings: Dict[str, Optional[float]]) -> None:
+    started = time.perf_counter()
+    try:
+        await func()
+        timings[name] = time.perf_counter() - started
+    except Exception:
+        timings[name] = None
+        logger.warning("Startup warmup step %s failed", name, exc_info=True)
+
+
+async def _supabase_clients() -> None:
+    await run_sync(get_supabase_anon)
+    await run_sync(get_supabase_admin)
+
+
+async def _stripe() -> None:
+    stripe = await run_sync(get_stripe)
+    if WARMUP_STRIPE_REQUEST and stripe.api_key:
+        await call_stripe("Price.list", stripe.Price.list, limit=1)
+
+
+async def warm_up() -> Dict[str, Optional[float]]:
+    """Run the warmup steps; returns seconds per step (None if it failed)"""
+    timings: Dict[str, Optional[float]] = {}
+
+    async def storage():
+        # Supabase auth is used by every backend, its tables only by this one
+        if os.getenv("SUPABASE_URL"):
+            await _step("supabase_clients", _supabase_clients, timings)
+        # Loading the catalog also opens the first database connections
+        await _step("catalog", product_catalog.refresh, timings)
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(storage(), _step("stripe", _stripe, timings)),
+            STARTUP_WARMUP_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Startup warmup exceeded %.1fs; continuing", STARTUP_WARMUP_TIMEOUT_SECONDS)
+    return timings
@@ -0,0 +1,240 @@
+"""Durable, asynchronous Stripe webhook processing.
+
+The HTTP handler only verifies the signature and calls submit(), which
+persists the event to stripe_events (deduplicated on the Stripe event id)
+and queues it. A fixed pool of worker tasks drains the queues; events are
+partitioned by their ordering key (the Stripe subscription id) so updates
+to one subscription are applied in arrival order. Failures are retried
+with backoff and finally parked as 'dead' for manual replay.
+
+Each event is processed by one worker process at a time. submit() records
+an event already claimed (claimed_at) by the worker that received it.
+A claim older than WEBHOOK_CLAIM_TIMEOUT_SECONDS is taken to belong to a
+worker that died. Every WEBHOOK_RECOVERY_INTERVAL_SECONDS (and at startup)
+each process queues the pending events that are unclaimed or stale, and
+claims them with an atomic conditional update just before processing, so
+only one process applies each recovered event.
+"""
+import asyncio
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+try:
+    from .cache import TTLCache
+    from .repository import stripe_event_repo
+except ImportError:
+    from cache import TTLCache
+    from repository import stripe_event_repo
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.getenv("WEBHOOK_RETRY_BASE_SECONDS", "0.5"))
+WEBHOOK_RECOVERY_BATCH = int(os.getenv("WEBHOOK_RECOVERY_BATCH", "500"))
+WEBHOOK_RECOVERY_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_RECOVERY_INTERVAL_SECONDS", "60"))
+# Well above the time an event spends queued and retried on a live worker
+WEBHOOK_CLAIM_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_CLAIM_TIMEOUT_SECONDS", "600"))
+# Recently accepted event ids, so redeliveries skip the database entirely
+WEBHOOK_SEEN_CACHE_SIZE = int(os.getenv("WEBHOOK_SEEN_CACHE_SIZE", "50000"))
+WEBHOOK_SEEN_TTL_SECONDS = float(os.getenv("WEBHOOK_SEEN_TTL_SECONDS", "86400"))
+
+EventHandler = Callable[[Dict], Awaitable[None]]
+
+
+def ordering_key(event: Dict) -> str:
+    """Key whose events must be applied in order (the subscription id)"""
+    obj = event.get("data", {}).get("object", {}) or {}
+    if obj.get("object") == "subscription":
+        return obj["id"]
+    return obj.get("subscription") or event["id"]
+
+
+class WebhookPipeline:
+    """Persist-then-acknowledge queue with per-key ordered workers"""
+
+    def __init__(self, workers: int = WEBHOOK_WORKERS, max_attempts: int = WEBHOOK_MAX_ATTEMPTS):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._handlers: Dict[str, EventHandler] = {}
+        # Items are (row, claimed); unclaimed rows are claimed when dequeued
+        self._queues: List["asyncio.Queue[Tuple[Dict, bool]]"] = []
+        self._tasks: List[asyncio.Task] = []
+        self._recovery_task: Optional[asyncio.Task] = None
+        # Ids queued by recovery and not yet dequeued, so a sweep never queues one twice
+        self._recovering: Set[str] = set()
+        self._seen = TTLCache(maxsize=WEBHOOK_SEEN_CACHE_SIZE, ttl=WEBHOOK_SEEN_TTL_SECONDS)
+        self.counters = {
+            "received": 0,
+            "duplicates": 0,
+            "processed": 0,
+            "retries": 0,
+            "dead_lettered": 0,
+            "claimed_elsewhere": 0,
+            "recovered": 0,
+        }
+
+    def handler(self, event_type: str) -> Callable[[EventHandler], EventHandler]:
+        """Register the coroutine that applies events of event_type"""
+        def register(func: EventHandler) -> EventHandler:
+            self._handlers[event_type] = func
+            return func
+        return register
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """Start the workers and the periodic recovery sweep"""
+        self._ensure_workers()
+        await self.recover()
+        if self._recovery_task is None:
+            self._recovery_task = asyncio.create_task(self._recover_periodically())
+
+    async def stop(self) -> None:
+        tasks = [task for task in [self._recovery_task, *self._tasks] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+        self._recovery_task = None
+        self._recovering.clear()
+
+    async def recover(self) -> int:
+        """Queue pending events that are unclaimed or whose claim went stale"""
+        stale_before = datetime.utcnow() - timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS)
+        try:
+            rows = await stripe_event_repo.list_claimable(stale_before, WEBHOOK_RECOVERY_BATCH)
+        except Exception:
+            logger.exception("Could not load pending Stripe events")
+            return 0
+        self._ensure_workers()
+        queued = 0
+        for row in rows:
+            self._seen.set(row["id"], True)
+            if row["id"] in self._recovering:
+                continue
+            self._recovering.add(row["id"])
+            self._enqueue(row, claimed=False)
+            queued += 1
+        self.counters["recovered"] += queued
+        return queued
+
+    async def submit(self, event: Dict) -> bool:
+        """Persist and queue a verified event; False for a redelivery"""
+        self.counters["received"] += 1
+        if self._seen.get(event["id"]):
+            self.counters["duplicates"] += 1
+            return False
+        row = {
+            "id": event["id"],
+            "type": event["type"],
+            "ordering_key": ordering_key(event),
+            "payload": event,
+            "status": "pending",
+            "claimed_at": datetime.utcnow().isoformat(),
+        }
+        inserted = await stripe_event_repo.record(row)
+        self._seen.set(event["id"], True)
+        if not inserted:
+            self.counters["duplicates"] += 1
+            return False
+        self._ensure_workers()
+        self._enqueue(row, claimed=True)
+        return True
+
+    async def replay(self, event_id: str) -> None:
+        """Move a dead-lettered event back onto the queue"""
+        row = await stripe_event_repo.get(event_id)
+        if row["status"] != "dead":
+            # Clearing the claim of a live event would let a second worker take it
+            raise ValueError(f"Event {event_id} is {row['status']}, not dead-lettered")
+        await stripe_event_repo.update(event_id, {
+            "status": "pending", "attempts": 0, "last_error": None, "claimed_at": None,
+        })
+        row.update(status="pending", attempts=0)
+        self._ensure_workers()
+        self._enqueue(row, claimed=False)
+
+    def stats(self) -> Dict:
+        depths = [q.qsize() for q in self._queues]
+        return {
+            "workers": len(self._tasks),
+            "queue_depth": sum(depths),
+            "queue_depth_per_worker": depths,
+            **self.counters,
+        }
+
+    async def _recover_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(WEBHOOK_RECOVERY_INTERVAL_SECONDS)
+            await self.recover()
+
+    def _ensure_workers(self) -> None:
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._work(q)) for q in self._queues]
+
+    def _enqueue(self, row: Dict, claimed: bool) -> None:
+        index = zlib.crc32(row["ordering_key"].encode()) % len(self._queues)
+        self._queues[index].put_nowait((row, claimed))
+
+    async def _claim(self, row: Dict) -> Optional[Dict]:
+        stale_before = datetime.utcnow() - timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS)
+        claimed = await stripe_event_repo.claim(row["id"], stale_before)
+        if claimed is None:
+            self.counters["claimed_elsewhere"] += 1
+        return claimed
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            row, claimed = await queue.get()
+            self._recovering.discard(row["id"])
+            try:
+                if not claimed:
+                    row = await self._claim(row)
+                if row is not None:
+                    await self._process(row)
+            except Exception:
+                logger.exception("Unexpected failure processing Stripe event %s", row["id"])
+            finally:
+                queue.task_done()
+
+    async def _process(self, row: Dict) -> None:
+        handler = self._handlers.get(row["type"])
+        attempts = row.get("attempts") or 0
+        while True:
+            attempts += 1
+            try:
+                if handler is not None:
+                    await handler(row["payload"])
+                break
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if attempts >= self.max_attempts:
+                    self.counters["dead_lettered"] += 1
+                    logger.error("Stripe event %s dead-lettered after %d attempts: %s", row["id"], attempts, error)
+                    await stripe_event_repo.update(row["id"], {
+                        "status": "dead",
+                        "attempts": attempts,
+                        "last_error": error,
+                    })
+                    return
+                self.counters["retries"] += 1
+                # Retrying in place holds back later events for the same key
+                await asyncio.sleep(WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        self.counters["processed"] += 1
+        await stripe_event_repo.update(row["id"], {
+            "status": "processed",
+            "attempts": attempts,
+            "last_error": None,
+            "processed_at": datetime.utcnow().isoformat(),
+        })
+
+
+webhook_pipeline = WebhookPipeline()
@@ -0,0 +1,45 @@
+"""Print per-endpoint latency and throughput deltas between two benchmark runs.
+
+    python -m benchmarks.compare results/base.json results/head.json
+"""
+import argparse
+import json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "rps")
+
+
+def _delta(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"base {base['meta'].get('commit') or '?'}  head {head['meta'].get('commit') or '?'}")
+    header = f"{'endpoint':44}" + "".join(f"{m:>26}" for m in METRICS)
+    print(header)
+    for endpoint in sorted(set(base["endpoints"]) | set(head["endpoints"])):
+        before, after = base["endpoints"].get(endpoint), head["endpoints"].get(endpoint)
+        if before is None or after is None:
+            print(f"{endpoint:44}  only in {'head' if before is None else 'base'}")
+            continue
+        cells = "".join(
+            f"{before[m]:>9.1f} -> {after[m]:>7.1f} {_delta(before[m], after[m]):>6}" for m in METRICS
+        )
+        print(f"{endpoint:44}{cells}")
+    print(f"{'total rps':44}{base['totals']['rps']:>9.1f} -> {head['totals']['rps']:.1f} "
+          f"{_delta(base['totals']['rps'], head['totals']['rps'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""Local stand-ins for PostgREST, Supabase Auth and the Stripe API.
+
+One Starlette app serves all three with an in-memory dataset and a
+configurable injected latency per upstream, so the API can be benchmarked
+without a Supabase project or Stripe account:
+
+    python -m benchmarks.fakes --port 54321 --db-latency-ms 5
+
+Point SUPABASE_URL at http://127.0.0.1:<port> and STRIPE_API_BASE at the
+same address. GET /__bench/seed describes the seeded users and products.
+Only the PostgREST features the backend uses are implemented.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+BENCH_PASSWORD = "bench-password"
+
+PRIMARY_KEYS = {"cache_versions": "name"}
+
+
+class Latency:
+    """Injected delay for one upstream, in milliseconds with +/- jitter"""
+
+    def __init__(self, mean_ms: float, jitter_ms: float = 0.0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    async def wait(self) -> None:
+        delay = self.mean_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def seed(users: int, products: int, subscriptions_per_user: int, rng: random.Random) -> Dict[str, Dict[str, Dict]]:
+    """Build the in-memory tables"""
+    now = datetime.now(timezone.utc)
+    tables: Dict[str, Dict[str, Dict]] = {
+        "profiles": {}, "products": {}, "subscriptions": {}, "stripe_events": {}, "cache_versions": {},
+    }
+    for i in range(products):
+        created = _timestamp(now - timedelta(days=365, seconds=i))
+        row = {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "name": f"Plan {i}",
+            "description": f"Benchmark plan {i}",
+            "price": float(rng.choice([9, 19, 29, 49, 79, 99, 249])),
+            "features": [f"Feature {n}" for n in range(rng.randint(2, 6))],
+            "stripe_price_id": f"price_bench_{i}",
+            "created_at": created,
+            "updated_at": created,
+        }
+        tables["products"][row["id"]] = row
+    product_ids = list(tables["products"])
+    counter = itertools.count()
+    for i in range(users):
+        created = _timestamp(now - timedelta(seconds=i * 37 + 1))
+        user_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        tables["profiles"][user_id] = {
+            "id": user_id,
+            "email": f"user{i}@example.com",
+            "full_name": f"Bench User {i}",
+            "role": "admin" if i == 0 else "user",
+            "created_at": created,
+            "updated_at": created,
+        }
+        for _ in range(subscriptions_per_user):
+            n = next(counter)
+            sub_created = _timestamp(now - timedelta(seconds=n * 13 + 1))
+            row = {
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "user_id": user_id,
+                "product_id": rng.choice(product_ids),
+                "stripe_subscription_id": f"sub_bench_{n}",
+                "status": rng.choice(["active", "active", "active", "canceled", "past_due"]),
+                "start_date": sub_created,
+                "end_date": _timestamp(now + timedelta(days=30)),
+                "created_at": sub_created,
+                "updated_at": sub_created,
+            }
+            tables["subscriptions"][row["id"]] = row
+    return tables
+
+
+# --- PostgREST filter evaluation -------------------------------------------
+
+def _coerce(left: Any, right: str):
+    """Compare a stored value with a filter literal using the stored type"""
+    if isinstance(left, bool):
+        return left, right == "true"
+    if isinstance(left, (int, float)):
+        return left, float(right)
+    if isinstance(left, str) and len(left) >= 19 and left[4] == "-" and "T" in left:
+        try:
+            return datetime.fromisoformat(left), datetime.fromisoformat(right)
+        except ValueError:
+            pass
+    return left, right
+
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def _condition(column: str, expression: str) -> Callable[[Dict], bool]:
+    op, _, raw = expression.partition(".")
+    negate = op == "not"
+    if negate:
+        op, _, raw = raw.partition(".")
+    raw = raw.strip('"')
+
+    def test(row: Dict) -> bool:
+        value = row.get(column)
+        if op == "is":
+            result = value is None if raw == "null" else value == (raw == "true")
+        elif op == "in":
+            options = [o.strip('"') for o in _split_top_level(raw.strip("()"))]
+            result = value is not None and str(value) in options
+        elif value is None:
+            result = False
+        else:
+            left, right = _coerce(value, raw)
+            result = {
+                "eq": lambda: left == right,
+                "neq": lambda: left != right,
+                "lt": lambda: left < right,
+                "lte": lambda: left <= right,
+                "gt": lambda: left > right,
+                "gte": lambda: left >= right,
+            }[op]()
+        return not result if negate else result
+
+    return test
+
+
+def _logical(kind: str, body: str) -> Callable[[Dict], bool]:
+    tests = []
+    for term in _split_top_level(body):
+        if term.startswith(("and(", "or(")):
+            inner_kind, _, inner = term.partition("(")
+            tests.append(_logical(inner_kind, inner[:-1]))
+        else:
+            column, _, expression = term.partition(".")
+            tests.append(_condition(column, expression))
+    combine = all if kind == "and" else any
+    return lambda row: combine(test(row) for test in tests)
+
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _filters(request: Request) -> List[Callable[[Dict], bool]]:
+    tests = []
+    for key, value in request.query_params.multi_items():
+        if key in RESERVED_PARAMS:
+            continue
+        if key in ("or", "and"):
+            tests.append(_logical(key, value.strip()[1:-1]))
+        else:
+            tests.append(_condition(key, value))
+    return tests
+
+
+def _project(rows: List[Dict], select: Optional[str]) -> List[Dict]:
+    if not select or select == "*":
+        return [dict(row) for row in rows]
+    columns = [c.strip() for c in select.split(",")]
+    return [{c: row.get(c) for c in columns} for row in rows]
+
+
+def _order(rows: List[Dict], order: Optional[str]) -> List[Dict]:
+    if not order:
+        return rows
+    for term in reversed(order.split(",")):
+        column, _, direction = term.partition(".")
+        rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+    return rows
+
+
+def _prefer(request: Request) -> str:
+    return request.headers.get("prefer", "")
+
+
+class FakeUpstreams:
+    """Request handlers over the seeded tables"""
+
+    def __init__(self, tables, db: Latency, auth: Latency, stripe: Latency):
+        self.tables = tables
+        self.db = db
+        self.auth = auth
+        self.stripe = stripe
+        self.ids = itertools.count(1)
+        self.by_email = {p["email"]: p for p in tables["profiles"].values()}
+        # What each Stripe price charges, checked by the API at checkout
+        self.prices = {
+            p["stripe_price_id"]: {"unit_amount": int(round(p["price"] * 100)), "currency": "usd"}
+            for p in tables["products"].values() if p["stripe_price_id"]
+        }
+
+    def _pk(self, table: str) -> str:
+        return PRIMARY_KEYS.get(table, "id")
+
+    def _defaults(self, table: str, row: Dict) -> Dict:
+        now = _timestamp(datetime.now(timezone.utc))
+        row = dict(row)
+        if table != "cache_versions":
+            row.setdefault("id", str(uuid.uuid4()))
+        if table in ("profiles", "products", "subscriptions"):
+            row.setdefault("created_at", now)
+            row.setdefault("updated_at", now)
+        if table == "products":
+            row.setdefault("stripe_price_id", None)
+            row.setdefault("features", [])
+        if table == "subscriptions":
+            row.setdefault("stripe_subscription_id", None)
+        if table == "stripe_events":
+            row.setdefault("attempts", 0)
+            row.setdefault("received_at", now)
+        return row
+
+    def _matching(self, table: str, request: Request) -> List[Dict]:
+        tests = _filters(request)
+        return [row for row in self.tables[table].values() if all(test(row) for test in tests)]
+
+    def _respond(self, request: Request, rows: List[Dict], status: int = 200, total: Optional[int] = None) -> Response:
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse(
+                    {"code": "PGRST116", "details": f"Results contain {len(rows)} rows", "hint": None,
+                     "message": "JSON object requested, multiple (or no) rows returned"},
+                    status_code=406,
+                )
+            return JSONResponse(rows[0], status_code=status)
+        headers = {}
+        if "count=" in _prefer(request):
+            count = len(rows) if total is None else total
+            headers["content-range"] = f"0-{max(len(rows) - 1, 0)}/{count}"
+        return JSONResponse(rows, status_code=status, headers=headers)
+
+    async def rest(self, request: Request) -> Response:
+        await self.db.wait()
+        table = request.path_params["table"]
+        if table.startswith("rpc/"):
+            return await self.rpc(request, table[len("rpc/"):])
+        if table not in self.tables:
+            return JSONResponse({"code": "42P01", "message": f"relation {table} does not exist"}, status_code=404)
+        params = request.query_params
+
+        if request.method == "GET":
+            rows = _order(self._matching(table, request), params.get("order"))
+            total = len(rows)
+            offset = int(params.get("offset", 0))
+            if "limit" in params:
+                rows = rows[offset:offset + int(params["limit"])]
+            return self._respond(request, _project(rows, params.get("select")), total=total)
+
+        if request.method == "POST":
+            body = await request.json()
+            rows = body if isinstance(body, list) else [body]
+            prefer = _prefer(request)
+            pk = params.get("on_conflict") or self._pk(table)
+            written = []
+            for row in rows:
+                existing = self.tables[table].get(row.get(pk)) if pk in row else None
+                if existing is not None:
+                    if "ignore-duplicates" in prefer:
+                        continue
+                    if "merge-duplicates" not in prefer:
+                        return JSONResponse({"code": "23505", "message": "duplicate key value"}, status_code=409)
+                    existing.update(row)
+                    written.append(existing)
+                    continue
+                row = self._defaults(table, row)
+                self.tables[table][row[self._pk(table)]] = row
+                written.append(row)
+            return self._respond(request, _project(written, params.get("select")), status=201)
+
+        if request.method == "PATCH":
+            changes = await request.json()
+            rows = self._matching(table, request)
+            for row in rows:
+                row.update(changes)
+                if "updated_at" in row:
+                    row["updated_at"] = _timestamp(datetime.now(timezone.utc))
+            return self._respond(request, _project(rows, params.get("select")))
+
+        if request.method == "DELETE":
+            rows = self._matching(table, request)
+            for row in rows:
+                del self.tables[table][row[self._pk(table)]]
+            return self._respond(request, rows)
+
+        return Response(status_code=405)
+
+    async def rpc(self, request: Request, name: str) -> Response:
+        args = await request.json()
+        if name == "bump_cache_version":
+            versions = self.tables["cache_versions"]
+            row = versions.setdefault(args["cache_name"], {"name": args["cache_name"], "version": 0})
+            row["version"] += 1
+            return JSONResponse(row["version"])
+        return JSONResponse({"code": "42883", "message": f"function {name} does not exist"}, status_code=404)
+
+    # --- Supabase Auth (GoTrue) -----------------------------------------
+
+    def _session(self, profile: Dict) -> Dict:
+        return {
+            "access_token": f"fake-access-{profile['id']}",
+            "refresh_token": f"fake-refresh-{next(self.ids)}",
+            "token_type": "bearer",
+            "expires_in": 86400,
+            "user": {
+                "id": profile["id"],
+                "aud": "authenticated",
+                "role": "authenticated",
+                "email": profile["email"],
+                "app_metadata": {},
+                "user_metadata": {},
+                "created_at": profile["created_at"],
+            },
+        }
+
+    async def token(self, request: Request) -> Response:
+        await self.auth.wait()
+        body = await request.json()
+        profile = self.by_email.get(body.get("email"))
+        if profile is None or body.get("password") != BENCH_PASSWORD:
+            return JSONResponse({"error": "invalid_grant", "error_description": "Invalid login credentials"}, status_code=400)
+        return JSONResponse(self._session(profile))
+
+    async def signup(self, request: Request) -> Response:
+        await self.auth.wait()
+        body = await request.json()
+        if body.get("email") in self.by_email:
+            return JSONResponse({"msg": "User already registered"}, status_code=422)
+        profile = {"id": str(uuid.uuid4()), "email": body["email"], "created_at": _timestamp(datetime.now(timezone.utc))}
+        self.by_email[profile["email"]] = profile
+        return JSONResponse(self._session(profile))
+
+    async def logout(self, request: Request) -> Response:
+        return Response(status_code=204)
+
+    # --- Stripe -----------------------------------------------------------
+
+    async def stripe_create(self, request: Request) -> Response:
+        await self.stripe.wait()
+        kind = request.path_params["kind"]
+        form = await request.form()
+        n = next(self.ids)
+        if kind == "products":
+            return JSONResponse({"id": f"prod_fake_{n}", "object": "product", "name": form.get("name")})
+        if kind == "prices":
+            price_id = f"price_fake_{n}"
+            self.prices[price_id] = {"unit_amount": int(form.get("unit_amount")), "currency": form.get("currency")}
+            return JSONResponse({"id": price_id, "object": "price", "product": form.get("product"), **self.prices[price_id]})
+        return JSONResponse({"error": {"message": f"Unknown resource {kind}"}}, status_code=404)
+
+    async def stripe_retrieve_price(self, request: Request) -> Response:
+        await self.stripe.wait()
+        price_id = request.path_params["price_id"]
+        if price_id not in self.prices:
+            return JSONResponse({"error": {"message": f"No such price: '{price_id}'"}}, status_code=404)
+        return JSONResponse({"id": price_id, "object": "price", "product": "prod_fake_0", **self.prices[price_id]})
+
+    async def checkout_session(self, request: Request) -> Response:
+        await self.stripe.wait()
+        n = next(self.ids)
+        return JSONResponse({
+            "id": f"cs_fake_{n}",
+            "object": "checkout.session",
+            "url": f"https://checkout.stripe.test/c/pay/cs_fake_{n}",
+        })
+
+    # --- Harness ----------------------------------------------------------
+
+    async def seed_info(self, request: Request) -> Response:
+        return JSONResponse({
+            "users": [{"id": p["id"], "email": p["email"], "role": p["role"]} for p in self.tables["profiles"].values()],
+            "products": list(self.tables["products"]),
+            "stripe_subscriptions": [
+                s["stripe_subscription_id"] for s in self.tables["subscriptions"].values() if s["stripe_subscription_id"]
+            ],
+            "password": BENCH_PASSWORD,
+        })
+
+
+def create_app(users: int = 1000, products: int = 12, subscriptions_per_user: int = 2,
+               db_latency_ms: float = 5.0, auth_latency_ms: float = 20.0, stripe_latency_ms: float = 50.0,
+               jitter: float = 0.2, random_seed: int = 1) -> Starlette:
+    rng = random.Random(random_seed)
+    fakes = FakeUpstreams(
+        seed(users, products, subscriptions_per_user, rng),
+        db=Latency(db_latency_ms, db_latency_ms * jitter),
+        auth=Latency(auth_latency_ms, auth_latency_ms * jitter),
+        stripe=Latency(stripe_latency_ms, stripe_latency_ms * jitter),
+    )
+    return Starlette(routes=[
+        Route("/rest/v1/{table:path}", fakes.rest, methods=["GET", "POST", "PATCH", "DELETE"]),
+        Route("/auth/v1/token", fakes.token, methods=["POST"]),
+        Route("/auth/v1/signup", fakes.signup, methods=["POST"]),
+        Route("/auth/v1/logout", fakes.logout, methods=["POST"]),
+        Route("/v1/checkout/sessions", fakes.checkout_session, methods=["POST"]),
+        Route("/v1/prices/{price_id}", fakes.stripe_retrieve_price, methods=["GET"]),
+        Route("/v1/{kind}", fakes.stripe_create, methods=["POST"]),
+        Route("/__bench/seed", fakes.seed_info, methods=["GET"]),
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=12)
+    parser.add_argument("--subscriptions-per-user", type=int, default=2)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--auth-latency-ms", type=float, default=20.0)
+    parser.add_argument("--stripe-latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency jitter as a fraction of the mean")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(
+        users=args.users,
+        products=args.products,
+        subscriptions_per_user=args.subscriptions_per_user,
+        db_latency_ms=args.db_latency_ms,
+        auth_latency_ms=args.auth_latency_ms,
+        stripe_latency_ms=args.stripe_latency_ms,
+        jitter=args.jitter,
+        random_seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""Load benchmark for the FastAPI backend against local upstream fakes.
+
+Starts benchmarks.fakes and `uvicorn backend.main:app` as subprocesses,
+drives a weighted mix of user journeys for a fixed duration and writes
+per-endpoint latency percentiles and throughput as JSON:
+
+    python -m benchmarks.run --duration 30 --concurrency 64 --output results/head.json
+
+Compare two result files with `python -m benchmarks.compare a.json b.json`.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+JWT_SECRET = "bench-jwt-secret"
+WEBHOOK_SECRET = "whsec_bench"
+
+# Scenario name -> relative weight in the mix
+DEFAULT_MIX = {
+    "products": 30,
+    "dashboard": 25,
+    "profile": 10,
+    "subscriptions": 10,
+    "login": 10,
+    "checkout": 10,
+    "webhook_burst": 5,
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _service_key(role: str) -> str:
+    # supabase-py only checks that keys look like JWTs
+    return jwt.encode({"role": role, "iss": "supabase-bench"}, JWT_SECRET, algorithm="HS256")
+
+
+def mint_token(user_id: str, email: str) -> str:
+    """Token in the shape backend.utils.create_jwt_token issues"""
+    now = datetime.now(timezone.utc)
+    return jwt.encode(
+        {"sub": user_id, "email": email, "iat": now, "exp": now + timedelta(hours=2)},
+        JWT_SECRET,
+        algorithm="HS256",
+    )
+
+
+def sign_webhook(payload: bytes, secret: str = WEBHOOK_SECRET) -> str:
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Latencies and errors per endpoint, ignoring the warmup window"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.recording = False
+
+    def add(self, endpoint: str, seconds: float, status: Optional[int]) -> None:
+        if not self.recording:
+            return
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status) if status is not None else "transport_error"] += 1
+        if status is None or status >= 400:
+            self.errors[endpoint] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict]:
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            endpoints[endpoint] = {
+                "count": len(values),
+                "errors": self.errors[endpoint],
+                "statuses": dict(self.statuses[endpoint]),
+                "rps": round(len(values) / elapsed, 2),
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+        return endpoints
+
+
+class Workload:
+    """The user journeys the benchmark mixes"""
+
+    def __init__(self, client: httpx.AsyncClient, seed: Dict, recorder: Recorder, burst_size: int, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.burst_size = burst_size
+        self.rng = rng
+        self.users = [u for u in seed["users"] if u["role"] != "admin"]
+        self.password = seed["password"]
+        self.product_ids = seed["products"]
+        self.stripe_subscriptions = seed["stripe_subscriptions"]
+        self.tokens = {u["id"]: mint_token(u["id"], u["email"]) for u in self.users}
+        self.event_ids = itertools.count()
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            pass
+        self.recorder.add(endpoint, time.perf_counter() - started, response.status_code if response is not None else None)
+        return response
+
+    def _auth(self) -> Dict[str, str]:
+        user = self.rng.choice(self.users)
+        return {"Authorization": f"Bearer {self.tokens[user['id']]}"}
+
+    async def products(self):
+        await self.request("GET /api/products/", "GET", "/api/products/")
+
+    async def dashboard(self):
+        await self.request("GET /api/users/me/dashboard", "GET", "/api/users/me/dashboard", headers=self._auth())
+
+    async def profile(self):
+        await self.request("GET /api/users/me", "GET", "/api/users/me", headers=self._auth())
+
+    async def subscriptions(self):
+        await self.request("GET /api/subscriptions/", "GET", "/api/subscriptions/", headers=self._auth())
+
+    async def login(self):
+        user = self.rng.choice(self.users)
+        await self.request(
+            "POST /api/auth/login", "POST", "/api/auth/login",
+            json={"email": user["email"], "password": self.password},
+        )
+
+    async def checkout(self):
+        await self.request(
+            "POST /api/stripe/create-checkout-session", "POST", "/api/stripe/create-checkout-session",
+            params={"product_id": self.rng.choice(self.product_ids)}, headers=self._auth(),
+        )
+
+    async def webhook_burst(self):
+        """Several Stripe deliveries at once, as after a billing run"""
+        async def deliver():
+            event = {
+                "id": f"evt_bench_{os.getpid()}_{next(self.event_ids)}",
+                "object": "event",
+                "type": "customer.subscription.updated",
+                "data": {"object": {
+                    "id": self.rng.choice(self.stripe_subscriptions),
+                    "object": "subscription",
+                    "status": self.rng.choice(["active", "past_due", "canceled"]),
+                }},
+            }
+            payload = json.dumps(event).encode()
+            await self.request(
+                "POST /api/stripe/webhook", "POST", "/api/stripe/webhook", content=payload,
+                headers={"stripe-signature": sign_webhook(payload), "content-type": "application/json"},
+            )
+
+        await asyncio.gather(*(deliver() for _ in range(self.burst_size)))
+
+
+async def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode} before becoming ready")
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_mix(text: Optional[str]) -> Dict[str, int]:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = int(weight)
+    return mix
+
+
+async def drive(args, app_url: str, fakes_url: str) -> Dict:
+    async with httpx.AsyncClient() as client:
+        seed = (await client.get(f"{fakes_url}/__bench/seed")).json()
+
+    recorder = Recorder()
+    mix = _parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=args.timeout) as client:
+        workload = Workload(client, seed, recorder, args.burst_size, random.Random(args.seed))
+        stop_at = time.monotonic() + args.warmup + args.duration
+
+        async def worker(worker_id: int):
+            rng = random.Random(args.seed * 1000 + worker_id)
+            while time.monotonic() < stop_at:
+                await getattr(workload, rng.choices(names, weights)[0])()
+
+        workers = [asyncio.create_task(worker(i)) for i in range(args.concurrency)]
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        started = time.monotonic()
+        await asyncio.gather(*workers)
+        elapsed = time.monotonic() - started
+
+    endpoints = recorder.summary(elapsed)
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+                "concurrency": args.concurrency,
+                "app_workers": args.workers,
+                "mix": mix,
+                "webhook_burst_size": args.burst_size,
+                "users": args.users,
+                "products": args.products,
+                "db_latency_ms": args.db_latency_ms,
+                "auth_latency_ms": args.auth_latency_ms,
+                "stripe_latency_ms": args.stripe_latency_ms,
+                "jitter": args.jitter,
+                "seed": args.seed,
+            },
+        },
+        "totals": {
+            "requests": total,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "rps": round(total / elapsed, 2),
+            "elapsed_s": round(elapsed, 3),
+        },
+        "endpoints": endpoints,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before recording")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent virtual users")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the app")
+    parser.add_argument("--mix", help="Scenario weights, e.g. products=50,dashboard=50")
+    parser.add_argument("--burst-size", type=int, default=10, help="Webhook deliveries per burst")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=12)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--auth-latency-ms", type=float, default=20.0)
+    parser.add_argument("--stripe-latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Keep the per-IP auth limits (all benchmark traffic comes from one address)")
+    parser.add_argument("--output", help="Write the JSON result here as well as to stdout")
+    args = parser.parse_args()
+
+    fakes_port, app_port = _free_port(), _free_port()
+    fakes_url = f"http://127.0.0.1:{fakes_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    fakes = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fakes", "--port", str(fakes_port),
+        "--users", str(args.users), "--products", str(args.products),
+        "--db-latency-ms", str(args.db_latency_ms), "--auth-latency-ms", str(args.auth_latency_ms),
+        "--stripe-latency-ms", str(args.stripe_latency_ms), "--jitter", str(args.jitter),
+        "--seed", str(args.seed),
+    ], cwd=ROOT)
+    env = dict(
+        os.environ,
+        SUPABASE_URL=fakes_url,
+        SUPABASE_ANON_KEY=_service_key("anon"),
+        SUPABASE_SERVICE_ROLE_KEY=_service_key("service_role"),
+        SUPABASE_JWT_SECRET=JWT_SECRET,
+        STRIPE_SECRET_KEY="sk_test_bench",
+        STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+        STRIPE_API_BASE=fakes_url,
+    )
+    if not args.keep_rate_limits:
+        env.update(RATE_LIMIT_LOGIN_IP="off", RATE_LIMIT_REGISTER_IP="off")
+    app = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(app_port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+    ], cwd=ROOT, env=env)
+
+    try:
+        asyncio.run(_wait_ready(f"{fakes_url}/__bench/seed", fakes))
+        asyncio.run(_wait_ready(f"{app_url}/health", app))
+        result = asyncio.run(drive(args, app_url, fakes_url))
+    finally:
+        for process in (app, fakes):
+            process.terminate()
+        for process in (app, fakes):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,26 @@ export async function getProducts() {
   return apiCall("/api/products")
 }
 
+export async function searchProducts(params: {
+  q?: string
+  prefix?: string
+  features?: string[]
+  minPrice?: number
+  maxPrice?: number
+  sort?: string
+  limit?: number
+}) {
+  const query = new URLSearchParams()
+  if (params.q) query.set("q", params.q)
+  if (params.prefix) query.set("prefix", params.prefix)
+  params.features?.forEach((feature) => query.append("feature", feature))
+  if (params.minPrice !== undefined) query.set("min_price", String(params.minPrice))
+  if (params.maxPrice !== undefined) query.set("max_price", String(params.maxPrice))
+  if (params.sort) query.set("sort", params.sort)
+  if (params.limit !== undefined) query.set("limit", String(params.limit))
+  return apiCall(`/api/products/search?${query}`)
+}
+
 export async function getUserProfile(token: string) {
   return apiCall("/api/users/me", { token })
 }
@@ -42,3 +62,7 @@ export async function createSubscription(productId: string, token: string) {
 export async function getUserSubscriptions(token: string) {
   return apiCall("/api/subscriptions", { token })
 }
+
+export async function getDashboardSummary(token: string) {
+  return apiCall("/api/users/me/dashboard", { token })
+}
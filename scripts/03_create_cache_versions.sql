@@ -0,0 +1,26 @@
+-- Version counters used by API workers to invalidate in-memory caches
+CREATE TABLE IF NOT EXISTS cache_versions (
+  name TEXT PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE cache_versions ENABLE ROW LEVEL SECURITY;
+
+-- Atomically increment a counter and return the new value
+CREATE OR REPLACE FUNCTION bump_cache_version(cache_name TEXT)
+RETURNS BIGINT
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  INSERT INTO cache_versions (name, version, updated_at)
+  VALUES (cache_name, 1, CURRENT_TIMESTAMP)
+  ON CONFLICT (name) DO UPDATE
+    SET version = cache_versions.version + 1,
+        updated_at = CURRENT_TIMESTAMP
+  RETURNING version;
+$$;
+
+-- Callable by the API's service role only, or anyone could force cache reloads
+REVOKE EXECUTE ON FUNCTION bump_cache_version(TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION bump_cache_version(TEXT) TO service_role;
@@ -0,0 +1,56 @@
+-- Token buckets shared by API workers when RATE_LIMIT_STORE=database
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+  key TEXT PRIMARY KEY,
+  tokens DOUBLE PRECISION NOT NULL,
+  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE rate_limit_buckets ENABLE ROW LEVEL SECURITY;
+
+-- Refill a bucket, then try to take cost tokens; the row lock serialises callers
+CREATE OR REPLACE FUNCTION take_rate_limit_token(
+  bucket_key TEXT,
+  refill_per_second DOUBLE PRECISION,
+  bucket_capacity DOUBLE PRECISION,
+  cost DOUBLE PRECISION DEFAULT 1
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  current_tokens DOUBLE PRECISION;
+  allowed BOOLEAN;
+BEGIN
+  INSERT INTO rate_limit_buckets (key, tokens, updated_at)
+  VALUES (bucket_key, bucket_capacity, CURRENT_TIMESTAMP)
+  ON CONFLICT (key) DO NOTHING;
+
+  SELECT LEAST(
+           bucket_capacity,
+           tokens + EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - updated_at)) * refill_per_second
+         )
+    INTO current_tokens
+    FROM rate_limit_buckets
+   WHERE key = bucket_key
+     FOR UPDATE;
+
+  allowed := current_tokens >= cost;
+  IF allowed THEN
+    current_tokens := current_tokens - cost;
+  END IF;
+
+  UPDATE rate_limit_buckets
+     SET tokens = current_tokens, updated_at = CURRENT_TIMESTAMP
+   WHERE key = bucket_key;
+
+  RETURN jsonb_build_object(
+    'allowed', allowed,
+    'retry_after', CASE WHEN allowed THEN 0 ELSE (cost - current_tokens) / refill_per_second END
+  );
+END;
+$$;
+
+-- Service role only: anon callers could otherwise drain other clients' buckets
+REVOKE EXECUTE ON FUNCTION take_rate_limit_token(TEXT, DOUBLE PRECISION, DOUBLE PRECISION, DOUBLE PRECISION) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION take_rate_limit_token(TEXT, DOUBLE PRECISION, DOUBLE PRECISION, DOUBLE PRECISION) TO service_role;
@@ -0,0 +1,69 @@
+-- Subscription lifecycle scheduler: due-date index, inactive status and leader lease
+
+-- Range scan for active subscriptions past their end_date
+CREATE INDEX IF NOT EXISTS idx_subscriptions_status_end_date ON subscriptions(status, end_date);
+
+-- Expired subscriptions without auto-renewal become 'inactive'
+ALTER TABLE subscriptions DROP CONSTRAINT IF EXISTS subscriptions_status_check;
+ALTER TABLE subscriptions ADD CONSTRAINT subscriptions_status_check
+  CHECK (status IN ('active', 'canceled', 'past_due', 'inactive'));
+
+-- One row per background job; the holder runs it until the lease expires.
+-- A lease rather than pg_advisory_lock, which would not outlive one
+-- PostgREST request.
+CREATE TABLE IF NOT EXISTS scheduler_leases (
+  name TEXT PRIMARY KEY,
+  holder TEXT NOT NULL,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+ALTER TABLE scheduler_leases ENABLE ROW LEVEL SECURITY;
+
+-- Take or renew a lease; true if lease_holder now holds it
+CREATE OR REPLACE FUNCTION acquire_scheduler_lease(
+  lease_name TEXT,
+  lease_holder TEXT,
+  ttl_seconds DOUBLE PRECISION
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  acquired TEXT;
+BEGIN
+  INSERT INTO scheduler_leases AS lease (name, holder, expires_at)
+  VALUES (lease_name, lease_holder, CURRENT_TIMESTAMP + make_interval(secs => ttl_seconds))
+  ON CONFLICT (name) DO UPDATE
+    SET holder = excluded.holder, expires_at = excluded.expires_at
+    WHERE lease.holder = excluded.holder OR lease.expires_at < CURRENT_TIMESTAMP
+  RETURNING holder INTO acquired;
+
+  RETURN acquired IS NOT NULL;
+END;
+$$;
+
+-- Service role only, so outsiders cannot hold the lease and stall the scheduler
+REVOKE EXECUTE ON FUNCTION acquire_scheduler_lease(TEXT, TEXT, DOUBLE PRECISION) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION acquire_scheduler_lease(TEXT, TEXT, DOUBLE PRECISION) TO service_role;
+
+-- Renew the listed subscriptions that are still in due_status and due, each
+-- from its own end_date so renewals keep their billing anchor
+CREATE OR REPLACE FUNCTION renew_due_subscriptions(
+  subscription_ids UUID[],
+  due_status TEXT,
+  due_before TIMESTAMP WITH TIME ZONE,
+  period_days INTEGER
+)
+RETURNS SETOF subscriptions
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  UPDATE subscriptions
+     SET end_date = end_date + make_interval(days => period_days)
+   WHERE id = ANY(subscription_ids) AND status = due_status AND end_date <= due_before
+  RETURNING *;
+$$;
+
+REVOKE EXECUTE ON FUNCTION renew_due_subscriptions(UUID[], TEXT, TIMESTAMP WITH TIME ZONE, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION renew_due_subscriptions(UUID[], TEXT, TIMESTAMP WITH TIME ZONE, INTEGER) TO service_role;
@@ -0,0 +1,40 @@
+-- Idempotency-Key records shared by API workers when IDEMPOTENCY_STORE=database
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  key TEXT PRIMARY KEY,
+  fingerprint TEXT NOT NULL,
+  status_code INTEGER,
+  body TEXT,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at);
+
+ALTER TABLE idempotency_keys ENABLE ROW LEVEL SECURITY;
+
+-- Reserve a key unless an unexpired claim exists; expired rows are purged first
+CREATE OR REPLACE FUNCTION claim_idempotency_key(
+  idempotency_key TEXT,
+  request_fingerprint TEXT,
+  ttl_seconds DOUBLE PRECISION
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  claimed TEXT;
+BEGIN
+  DELETE FROM idempotency_keys WHERE expires_at < CURRENT_TIMESTAMP;
+
+  INSERT INTO idempotency_keys (key, fingerprint, expires_at)
+  VALUES (idempotency_key, request_fingerprint, CURRENT_TIMESTAMP + make_interval(secs => ttl_seconds))
+  ON CONFLICT (key) DO NOTHING
+  RETURNING key INTO claimed;
+
+  RETURN claimed IS NOT NULL;
+END;
+$$;
+
+-- Service role only: keys must not be claimable through the public anon key
+REVOKE EXECUTE ON FUNCTION claim_idempotency_key(TEXT, TEXT, DOUBLE PRECISION) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_idempotency_key(TEXT, TEXT, DOUBLE PRECISION) TO service_role;
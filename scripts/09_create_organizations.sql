@@ -0,0 +1,136 @@
+-- Organizations (teams), their members with owner/admin/member roles, and email invites
+CREATE TABLE IF NOT EXISTS organizations (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  name TEXT NOT NULL,
+  created_by UUID REFERENCES profiles(id) ON DELETE SET NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS organization_members (
+  organization_id UUID NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+  user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+  role TEXT NOT NULL DEFAULT 'member' CHECK (role IN ('owner', 'admin', 'member')),
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (organization_id, user_id)
+);
+
+-- "Which organizations is this user in" (the primary key covers the reverse)
+CREATE INDEX IF NOT EXISTS idx_organization_members_user ON organization_members(user_id);
+
+CREATE TABLE IF NOT EXISTS organization_invites (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  organization_id UUID NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+  email TEXT NOT NULL,
+  role TEXT NOT NULL DEFAULT 'member' CHECK (role IN ('owner', 'admin', 'member')),
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'accepted', 'revoked')),
+  invited_by UUID REFERENCES profiles(id) ON DELETE SET NULL,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One pending invite per address and organization; emails are stored lowercased
+CREATE UNIQUE INDEX IF NOT EXISTS idx_organization_invites_pending
+  ON organization_invites(organization_id, email) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_organization_invites_email_status ON organization_invites(email, status);
+
+ALTER TABLE organizations ENABLE ROW LEVEL SECURITY;
+ALTER TABLE organization_members ENABLE ROW LEVEL SECURITY;
+ALTER TABLE organization_invites ENABLE ROW LEVEL SECURITY;
+
+DROP TRIGGER IF EXISTS organizations_set_updated_at ON organizations;
+CREATE TRIGGER organizations_set_updated_at
+  BEFORE UPDATE ON organizations
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS organization_members_set_updated_at ON organization_members;
+CREATE TRIGGER organization_members_set_updated_at
+  BEFORE UPDATE ON organization_members
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS organization_invites_set_updated_at ON organization_invites;
+CREATE TRIGGER organization_invites_set_updated_at
+  BEFORE UPDATE ON organization_invites
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Reject changes that would leave an organization without an owner. The
+-- organization row is locked first, so concurrent demotions and removals
+-- are checked one after another instead of each seeing the other's owner.
+-- A missing organization means it is being deleted, which cascades freely.
+CREATE OR REPLACE FUNCTION ensure_organization_owner()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF OLD.role <> 'owner' OR (TG_OP = 'UPDATE' AND NEW.role = 'owner') THEN
+    RETURN COALESCE(NEW, OLD);
+  END IF;
+  PERFORM 1 FROM organizations WHERE id = OLD.organization_id FOR UPDATE;
+  IF FOUND AND NOT EXISTS (
+    SELECT 1 FROM organization_members
+     WHERE organization_id = OLD.organization_id AND role = 'owner' AND user_id <> OLD.user_id
+  ) THEN
+    RAISE EXCEPTION 'An organization needs at least one owner' USING ERRCODE = 'check_violation';
+  END IF;
+  RETURN COALESCE(NEW, OLD);
+END;
+$$;
+
+DROP TRIGGER IF EXISTS organization_members_keep_owner ON organization_members;
+CREATE TRIGGER organization_members_keep_owner
+  BEFORE UPDATE OF role OR DELETE ON organization_members
+  FOR EACH ROW EXECUTE FUNCTION ensure_organization_owner();
+
+-- Create an organization and make its creator the owner in one transaction
+CREATE OR REPLACE FUNCTION create_organization(org_name TEXT, owner_id UUID)
+RETURNS organizations
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  created organizations;
+BEGIN
+  INSERT INTO organizations (name, created_by) VALUES (org_name, owner_id) RETURNING * INTO created;
+  INSERT INTO organization_members (organization_id, user_id, role) VALUES (created.id, owner_id, 'owner');
+  RETURN created;
+END;
+$$;
+
+-- Accept a pending, unexpired invite addressed to user_email; returns the
+-- membership, or nothing if the invite cannot be accepted. An existing
+-- membership keeps the higher of its role and the invited one.
+CREATE OR REPLACE FUNCTION accept_organization_invite(invite_id UUID, accepting_user UUID, user_email TEXT)
+RETURNS SETOF organization_members
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  invite organization_invites;
+BEGIN
+  UPDATE organization_invites
+    SET status = 'accepted'
+    WHERE id = invite_id AND status = 'pending' AND email = lower(user_email) AND expires_at > CURRENT_TIMESTAMP
+    RETURNING * INTO invite;
+  IF invite.id IS NULL THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  INSERT INTO organization_members AS member (organization_id, user_id, role)
+  VALUES (invite.organization_id, accepting_user, invite.role)
+  ON CONFLICT (organization_id, user_id) DO UPDATE
+    SET role = CASE
+      WHEN array_position(ARRAY['member', 'admin', 'owner'], excluded.role)
+           > array_position(ARRAY['member', 'admin', 'owner'], member.role)
+      THEN excluded.role ELSE member.role END
+  RETURNING *;
+END;
+$$;
+
+-- The API calls these with the service role only; neither may be reachable with the anon key
+REVOKE EXECUTE ON FUNCTION create_organization(TEXT, UUID) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION accept_organization_invite(UUID, UUID, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION create_organization(TEXT, UUID) TO service_role;
+GRANT EXECUTE ON FUNCTION accept_organization_invite(UUID, UUID, TEXT) TO service_role;
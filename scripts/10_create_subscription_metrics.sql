@@ -0,0 +1,73 @@
+-- Subscription counters shared by every API worker, named 'status:<status>',
+-- 'active:<product_id>', 'transition:<from>-><to>' and 'meta:recomputed_at'
+CREATE TABLE IF NOT EXISTS subscription_metrics (
+  name TEXT PRIMARY KEY,
+  value BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE subscription_metrics ENABLE ROW LEVEL SECURITY;
+
+-- Add every delta in one statement; rows are locked in name order, so
+-- concurrent writers cannot deadlock
+CREATE OR REPLACE FUNCTION add_subscription_metrics(deltas JSONB)
+RETURNS VOID
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  INSERT INTO subscription_metrics (name, value, updated_at)
+  SELECT key, value::BIGINT, CURRENT_TIMESTAMP FROM jsonb_each_text(deltas) ORDER BY key
+  ON CONFLICT (name) DO UPDATE
+    SET value = subscription_metrics.value + excluded.value,
+        updated_at = CURRENT_TIMESTAMP;
+$$;
+
+-- Swap every counter under the given name prefixes for a recomputed set
+CREATE OR REPLACE FUNCTION replace_subscription_metrics(prefixes TEXT[], counts JSONB)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  DELETE FROM subscription_metrics
+   WHERE name LIKE ANY (ARRAY(SELECT prefix || '%' FROM unnest(prefixes) AS prefix));
+  INSERT INTO subscription_metrics (name, value, updated_at)
+  SELECT key, value::BIGINT, CURRENT_TIMESTAMP FROM jsonb_each_text(counts);
+END;
+$$;
+
+-- Batch status change for one user's subscriptions that also returns each
+-- row's previous status, so the counters above get exact deltas. The rows
+-- are locked before they are read, so the status returned is the one replaced.
+CREATE OR REPLACE FUNCTION update_subscriptions_for_user(
+  subscription_ids UUID[],
+  owner_id UUID,
+  changes JSONB
+)
+RETURNS JSONB
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH previous AS (
+    SELECT id, status FROM subscriptions
+     WHERE id = ANY(subscription_ids) AND user_id = owner_id
+     ORDER BY id
+     FOR UPDATE
+  ), updated AS (
+    UPDATE subscriptions s
+       SET status = COALESCE(changes->>'status', s.status),
+           end_date = COALESCE((changes->>'end_date')::TIMESTAMP WITH TIME ZONE, s.end_date)
+      FROM previous
+     WHERE s.id = previous.id
+    RETURNING to_jsonb(s) || jsonb_build_object('previous_status', previous.status) AS row
+  )
+  SELECT COALESCE(jsonb_agg(row), '[]'::JSONB) FROM updated;
+$$;
+
+-- The API calls these with the service role only
+REVOKE EXECUTE ON FUNCTION add_subscription_metrics(JSONB) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION replace_subscription_metrics(TEXT[], JSONB) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION update_subscriptions_for_user(UUID[], UUID, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION add_subscription_metrics(JSONB) TO service_role;
+GRANT EXECUTE ON FUNCTION replace_subscription_metrics(TEXT[], JSONB) TO service_role;
+GRANT EXECUTE ON FUNCTION update_subscriptions_for_user(UUID[], UUID, JSONB) TO service_role;
@@ -0,0 +1,78 @@
+"""Shared fixtures: the API and repositories run on in-memory SQLite databases"""
+import asyncio
+import os
+import uuid
+
+# Read at import time by the backend modules, so set before importing them
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-secret")
+os.environ.setdefault("WARMUP_STRIPE_REQUEST", "false")
+os.environ.setdefault("SUBSCRIPTION_SCHEDULER_ENABLED", "false")
+os.environ.setdefault("STRIPE_AUTO_PROVISION", "false")
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.repository  # noqa: F401  (imports sqlite_store itself; importing that first is circular)
+from backend.sqlite_store import SQLiteDatabase, create_repositories
+
+REPOSITORY_NAMES = (
+    "profiles", "products", "subscriptions", "stripe_events", "cache_versions",
+    "rate_limits", "scheduler_leases", "idempotency", "organizations",
+    "organization_invites", "subscription_metrics",
+)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def repos():
+    """Every SQLite repository over a fresh database"""
+    db = SQLiteDatabase(":memory:")
+    yield SimpleNamespace(db=db, **dict(zip(REPOSITORY_NAMES, create_repositories(db))))
+    db.close()
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The API over the STORAGE_BACKEND=sqlite singletons, with its background workers running"""
+    from backend.main import app
+    with TestClient(app) as client:
+        yield client
+
+
+def create_user(role: str = "user") -> SimpleNamespace:
+    """A profile in the API's database and a bearer token for it"""
+    from backend.repository import profile_repo
+    from backend.utils import create_jwt_token
+    user_id = str(uuid.uuid4())
+    email = f"{user_id[:8]}@example.com"
+    asyncio.run(profile_repo.create({"id": user_id, "email": email, "full_name": "Test User", "role": role}))
+    return SimpleNamespace(id=user_id, email=email, headers={"Authorization": f"Bearer {create_jwt_token(user_id, email)}"})
+
+
+@pytest.fixture
+def make_user(client):
+    return create_user
+
+
+@pytest.fixture
+def user(client):
+    return create_user()
+
+
+@pytest.fixture
+def admin(client):
+    return create_user("admin")
+
+
+@pytest.fixture
+def product(client):
+    from backend.repository import product_repo
+    return asyncio.run(product_repo.create({"name": f"Plan {uuid.uuid4().hex[:6]}", "price": 10.0, "features": []}))
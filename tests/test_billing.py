@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend import billing
+from backend.repository import product_repo
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeStripe:
+    """call_stripe stand-in recording Stripe calls"""
+
+    def __init__(self, prices):
+        self.prices = dict(prices)
+        self.calls = []
+
+    async def __call__(self, operation, func, *args, **kwargs):
+        self.calls.append(operation)
+        if operation == "Price.retrieve":
+            price_id = args[0]
+            return SimpleNamespace(id=price_id, product="prod_1", **self.prices[price_id])
+        if operation == "Price.create":
+            price_id = f"price_{len(self.prices)}"
+            self.prices[price_id] = {"unit_amount": kwargs["unit_amount"], "currency": kwargs["currency"]}
+            return SimpleNamespace(id=price_id)
+        if operation == "Product.create":
+            return SimpleNamespace(id="prod_1")
+        raise AssertionError(f"Unexpected Stripe call {operation}")
+
+
+@pytest.fixture
+def stripe(monkeypatch):
+    fake = FakeStripe({"price_old": {"unit_amount": 1000, "currency": "usd"}})
+    monkeypatch.setattr(billing, "call_stripe", fake)
+    monkeypatch.setattr(billing, "get_stripe", lambda: SimpleNamespace(
+        Price=SimpleNamespace(retrieve=None, create=None), Product=SimpleNamespace(create=None),
+    ))
+    monkeypatch.setattr(billing, "_price_terms", billing.TTLCache(maxsize=16))
+    return fake
+
+
+async def test_checkout_keeps_a_price_that_charges_the_current_amount(stripe, client, product):
+    product = await product_repo.update(product["id"], {"price": 10.0, "stripe_price_id": "price_old"})
+
+    assert await billing.checkout_price(product) == "price_old"
+    assert await billing.checkout_price(product) == "price_old"
+    # Prices are immutable, so the amount is looked up once
+    assert stripe.calls == ["Price.retrieve"]
+
+
+async def test_checkout_replaces_a_price_left_behind_by_a_price_change(stripe, client, product):
+    # The background re-provisioning after the admin edit has not run (or failed)
+    product = await product_repo.update(product["id"], {"price": 12.5, "stripe_price_id": "price_old"})
+
+    price_id = await billing.checkout_price(product)
+
+    assert price_id != "price_old"
+    assert stripe.prices[price_id] == {"unit_amount": 1250, "currency": "usd"}
+    assert (await product_repo.get(product["id"]))["stripe_price_id"] == price_id
+    assert await billing.checkout_price({**product, "stripe_price_id": price_id}) == price_id
+    assert stripe.calls.count("Price.create") == 1
+
+
+async def test_concurrent_checkouts_share_one_provisioning_run(stripe, client, product):
+    product = await product_repo.update(product["id"], {"price": 20.0, "stripe_price_id": None})
+
+    price_ids = await asyncio.gather(*(billing.checkout_price(product) for _ in range(5)))
+
+    assert len(set(price_ids)) == 1
+    assert stripe.calls.count("Price.create") == 1
+    assert billing._price_locks == {}
@@ -0,0 +1,82 @@
+"""Streaming exports and resuming them from their checkpoints"""
+import csv
+import io
+import json
+
+import pytest
+
+from backend.export import stream_export
+from backend.repository import encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+ROWS = [{"id": str(index), "created_at": f"2026-01-0{index}"} for index in range(1, 6)]
+
+
+def pages(fail_on=None):
+    """Two-row pages over ROWS, with the row index as the cursor"""
+    async def fetch_page(limit, cursor):
+        start = int(cursor or 0)
+        if start == fail_on:
+            raise ConnectionError("database unavailable")
+        end = start + limit
+        return ROWS[start:end], str(end) if end < len(ROWS) else None
+    return fetch_page
+
+
+async def collect(fetch_page, fmt, cursor=None):
+    chunks = []
+    try:
+        async for chunk in stream_export(fetch_page, ["id", "created_at"], fmt, cursor, chunk_size=2):
+            chunks.append(chunk)
+    except ConnectionError:
+        pass
+    return b"".join(chunks).decode()
+
+
+def ndjson(text):
+    lines = [json.loads(line) for line in text.splitlines()]
+    return [line for line in lines if "id" in line], [line["next_cursor"] for line in lines if "id" not in line]
+
+
+async def test_ndjson_pages_end_with_a_checkpoint():
+    rows, checkpoints = ndjson(await collect(pages(), "ndjson"))
+
+    assert rows == ROWS
+    assert checkpoints == ["2", "4", None]
+
+
+async def test_interrupted_export_resumes_from_its_last_checkpoint():
+    rows, checkpoints = ndjson(await collect(pages(fail_on=4), "ndjson"))
+    # Cut short: no final null checkpoint
+    assert checkpoints == ["2", "4"]
+
+    resumed, checkpoints = ndjson(await collect(pages(), "ndjson", checkpoints[-1]))
+
+    assert rows + resumed == ROWS
+    assert checkpoints == [None]
+
+
+async def test_csv_checkpoints_are_comment_lines():
+    text = await collect(pages(fail_on=2), "csv")
+
+    assert text.splitlines() == ["id,created_at", "1,2026-01-01", "2,2026-01-02", "# next_cursor=2"]
+    resumed = await collect(pages(), "csv", "2")
+    rows = list(csv.DictReader(line for line in io.StringIO(resumed) if not line.startswith("#")))
+    assert [row["id"] for row in rows] == ["3", "4", "5"]
+    assert resumed.splitlines()[-1] == "# next_cursor="
+
+
+def test_admin_export_ends_with_a_null_checkpoint_and_resumes_by_cursor(client, admin, make_user):
+    for _ in range(2):
+        make_user()
+
+    response = client.get("/api/admin/export/users", params={"fields": "email"}, headers=admin.headers)
+    rows, checkpoints = ndjson(response.text)
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert len(rows) >= 3 and checkpoints[-1] is None
+    resumed, _ = ndjson(client.get(
+        "/api/admin/export/users", params={"fields": "email", "cursor": encode_cursor(rows[1])}, headers=admin.headers,
+    ).text)
+    assert resumed == rows[2:]
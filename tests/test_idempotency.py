@@ -0,0 +1,159 @@
+"""Idempotency-Key handling on POST /api/subscriptions/, per worker and through the SQLite store"""
+import asyncio
+import hashlib
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend import idempotency
+from backend.repository import idempotency_repo, subscription_repo
+
+
+@pytest.fixture(params=["memory", "database"])
+def store(request, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_STORE", request.param)
+    return request.param
+
+
+@pytest.fixture
+def slow_create(monkeypatch):
+    """Make subscription inserts take `delay` seconds and count them"""
+    calls = []
+    create = subscription_repo.create
+
+    def install(delay):
+        async def delayed(data):
+            calls.append(data)
+            await asyncio.sleep(delay)
+            return await create(data)
+        monkeypatch.setattr(subscription_repo, "create", delayed)
+        return calls
+    return install
+
+
+def subscribe(client, user, product, key):
+    return client.post(
+        "/api/subscriptions/", headers={**user.headers, "Idempotency-Key": key}, json={"product_id": product["id"]},
+    )
+
+
+def concurrently(*calls):
+    """Start each call shortly after the previous one, in parallel threads"""
+    with ThreadPoolExecutor(len(calls)) as pool:
+        futures = []
+        for call in calls:
+            futures.append(pool.submit(call))
+            time.sleep(0.05)
+        return [future.result() for future in futures]
+
+
+def forget_locally():
+    """What another worker sees: nothing in this process's memory"""
+    idempotency._completed.clear()
+
+
+def shared_key(user, key):
+    return hashlib.sha256(f"subscriptions.create:{user.id}:{key}".encode()).hexdigest()
+
+
+def test_retry_replays_the_first_response(client, user, product, store, slow_create):
+    calls = slow_create(0)
+    key = str(uuid.uuid4())
+
+    first = subscribe(client, user, product, key)
+    second = subscribe(client, user, product, key)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert len(calls) == 1
+
+
+def test_duplicate_waits_for_the_request_in_flight(client, user, product, store, slow_create):
+    calls = slow_create(0.3)
+    key = str(uuid.uuid4())
+
+    first, second = concurrently(
+        lambda: subscribe(client, user, product, key),
+        lambda: subscribe(client, user, product, key),
+    )
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert len(calls) == 1
+
+
+def test_key_reused_with_another_payload_is_rejected(client, user, product, store, slow_create):
+    slow_create(0)
+    key = str(uuid.uuid4())
+    subscribe(client, user, product, key)
+
+    response = subscribe(client, user, {"id": str(uuid.uuid4())}, key)
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Idempotency-Key was already used with a different request"
+
+
+def test_duplicate_gives_up_with_409_when_the_first_request_runs_too_long(
+    client, user, product, store, slow_create, monkeypatch
+):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.1)
+    calls = slow_create(0.5)
+    key = str(uuid.uuid4())
+
+    first, second = concurrently(
+        lambda: subscribe(client, user, product, key),
+        lambda: subscribe(client, user, product, key),
+    )
+
+    assert first.status_code == 200
+    assert second.status_code == 409
+    assert second.headers["Retry-After"] == "1"
+    assert len(calls) == 1
+    # Once the first request has finished the key replays
+    assert subscribe(client, user, product, key).json() == first.json()
+
+
+def test_failed_request_releases_the_key(client, user, store):
+    key = str(uuid.uuid4())
+    missing_product = {"id": str(uuid.uuid4())}
+
+    assert subscribe(client, user, missing_product, key).status_code == 400
+    forget_locally()
+
+    assert subscribe(client, user, missing_product, key).status_code == 400
+
+
+def test_completed_response_is_replayed_by_other_workers(client, user, product, slow_create, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_STORE", "database")
+    calls = slow_create(0)
+    key = str(uuid.uuid4())
+
+    first = subscribe(client, user, product, key)
+    forget_locally()
+    second = subscribe(client, user, product, key)
+
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert len(calls) == 1
+
+
+def test_claim_held_by_another_worker_gives_409_then_mismatch_422(client, user, product, slow_create, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_STORE", "database")
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.2)
+    calls = slow_create(0)
+    key = str(uuid.uuid4())
+    # Another worker claimed the key for the same payload and is still running
+    fingerprint = idempotency._fingerprint({"product_id": product["id"]})
+    assert asyncio.run(idempotency_repo.claim(shared_key(user, key), fingerprint, 60))
+
+    assert subscribe(client, user, product, key).status_code == 409
+    # A different payload fails fast instead of waiting
+    started = time.monotonic()
+    assert subscribe(client, user, {"id": str(uuid.uuid4())}, key).status_code == 422
+    assert time.monotonic() - started < 0.2
+    assert calls == []
@@ -0,0 +1,44 @@
+"""The subscription lifecycle sweep"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend import lifecycle
+from backend.repository import subscription_repo
+
+
+@pytest.fixture
+def subscription(client, user, product):
+    def create(**fields):
+        return asyncio.run(subscription_repo.create({
+            "user_id": user.id, "product_id": product["id"], "status": "active", **fields,
+        }))
+    return create
+
+
+def test_auto_renew_is_anchored_on_the_previous_end_date(subscription, monkeypatch):
+    monkeypatch.setattr(lifecycle, "SUBSCRIPTION_AUTO_RENEW", True)
+    now = datetime.now(timezone.utc)
+    # The sweep ran two days late
+    end_date = now - timedelta(days=2)
+    row = subscription(end_date=end_date)
+
+    counts = asyncio.run(lifecycle.subscription_lifecycle.run_once(now))
+
+    renewed = asyncio.run(subscription_repo.get(row["id"]))
+    assert counts["renewed"] >= 1
+    assert renewed["status"] == "active"
+    assert datetime.fromisoformat(renewed["end_date"]) == end_date + timedelta(days=lifecycle.SUBSCRIPTION_PERIOD_DAYS)
+
+
+def test_without_auto_renew_due_subscriptions_become_inactive(subscription, monkeypatch):
+    monkeypatch.setattr(lifecycle, "SUBSCRIPTION_AUTO_RENEW", False)
+    now = datetime.now(timezone.utc)
+    due = subscription(end_date=now - timedelta(days=2))
+    current = subscription(end_date=now + timedelta(days=2))
+
+    asyncio.run(lifecycle.subscription_lifecycle.run_once(now))
+
+    assert asyncio.run(subscription_repo.get(due["id"]))["status"] == "inactive"
+    assert asyncio.run(subscription_repo.get(current["id"]))["status"] == "active"
@@ -0,0 +1,32 @@
+"""Prometheus exposition at /metrics"""
+import re
+
+from backend.http_pool import get_transport
+
+
+def families(text):
+    """{metric name: [sample lines]} grouped by # TYPE"""
+    names = re.findall(r"^# TYPE (\S+) ", text, re.M)
+    return {name: [line for line in text.splitlines() if re.match(rf"{name}[{{ ]", line)] for name in names}
+
+
+def test_every_family_is_declared_once(client):
+    text = client.get("/metrics").text
+    names = re.findall(r"^# TYPE (\S+) ", text, re.M)
+
+    assert len(names) == len(set(names))
+
+
+def test_upstream_gauges_are_labelled_not_named_per_upstream(client):
+    get_transport("supabase-rest"), get_transport("stripe")
+
+    metrics = families(client.get("/metrics").text)
+
+    assert metrics["http_pool_connections"] == [
+        'http_pool_connections{upstream="stripe"} 0', 'http_pool_connections{upstream="supabase-rest"} 0',
+    ]
+    assert len(metrics["http_pool_idle_connections"]) == 2
+    assert sorted(metrics["upstream_in_use"]) == [
+        'upstream_in_use{upstream="auth"} 0', 'upstream_in_use{upstream="stripe"} 0',
+    ]
+    assert not any(re.match(r"(http_pool|upstream)_(supabase|stripe|auth)", name) for name in metrics)
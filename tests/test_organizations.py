@@ -0,0 +1,94 @@
+"""The last-owner rule, enforced by a trigger on organization_members"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.repository import LastOwnerError
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_profile(repos):
+    user_id = str(uuid.uuid4())
+    return await repos.profiles.create({"id": user_id, "email": f"{user_id[:8]}@example.com"})
+
+
+async def add_member(repos, organization, user, role):
+    invite, = await repos.organization_invites.bulk_create(organization["id"], [{
+        "organization_id": organization["id"],
+        "email": user["email"],
+        "role": role,
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=1),
+    }])
+    return await repos.organization_invites.accept(invite["id"], user["id"], user["email"])
+
+
+@pytest.fixture
+async def team(repos):
+    owner, admin = await create_profile(repos), await create_profile(repos)
+    organization = await repos.organizations.create("Acme", owner["id"])
+    await add_member(repos, organization, admin, "admin")
+    return organization, owner, admin
+
+
+async def roles(repos, organization):
+    return {row["user_id"]: row["role"] for row in await repos.organizations.memberships(organization["id"])}
+
+
+async def test_last_owner_cannot_be_demoted_or_removed(repos, team):
+    organization, owner, _ = team
+
+    with pytest.raises(LastOwnerError):
+        await repos.organizations.update_member(organization["id"], owner["id"], "admin")
+    with pytest.raises(LastOwnerError):
+        await repos.organizations.remove_member(organization["id"], owner["id"])
+
+    assert (await roles(repos, organization))[owner["id"]] == "owner"
+
+
+async def test_an_owner_can_step_down_once_another_owner_exists(repos, team):
+    organization, owner, admin = team
+    await repos.organizations.update_member(organization["id"], admin["id"], "owner")
+
+    member = await repos.organizations.update_member(organization["id"], owner["id"], "member")
+
+    assert member["role"] == "member"
+    assert await roles(repos, organization) == {owner["id"]: "member", admin["id"]: "owner"}
+
+
+async def test_concurrent_demotions_leave_one_owner(repos, team):
+    organization, owner, admin = team
+    await repos.organizations.update_member(organization["id"], admin["id"], "owner")
+
+    results = await asyncio.gather(
+        repos.organizations.update_member(organization["id"], owner["id"], "member"),
+        repos.organizations.remove_member(organization["id"], admin["id"]),
+        return_exceptions=True,
+    )
+
+    assert sum(isinstance(result, LastOwnerError) for result in results) == 1
+    assert list((await roles(repos, organization)).values()).count("owner") == 1
+
+
+async def test_deleting_the_organization_removes_its_owners(repos, team):
+    organization, owner, _ = team
+
+    await repos.organizations.delete(organization["id"])
+
+    assert await repos.organizations.get(organization["id"]) is None
+    assert await repos.organizations.memberships(organization["id"]) == []
+    assert await repos.organizations.list_for_user(owner["id"]) == []
+
+
+def test_api_answers_409_for_the_last_owner(client, user):
+    organization = client.post("/api/organizations/", headers=user.headers, json={"name": "Solo"}).json()
+    members = f"/api/organizations/{organization['id']}/members/{user.id}"
+
+    demoted = client.patch(members, headers=user.headers, json={"role": "admin"})
+    left = client.delete(members, headers=user.headers)
+
+    assert (demoted.status_code, left.status_code) == (409, 409)
+    assert demoted.json()["detail"] == "An organization needs at least one owner"
+    assert client.delete(f"/api/organizations/{organization['id']}", headers=user.headers).status_code == 200
@@ -0,0 +1,125 @@
+"""Keyset cursors over (created_at, id), newest first"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.repository import decode_cursor, encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+BASE = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+async def seed_profiles(repos, count, role="user", tied=0):
+    """count profiles a minute apart; the last `tied` share one created_at"""
+    rows = []
+    for index in range(count):
+        created_at = BASE + timedelta(minutes=min(index, count - tied))
+        user_id = str(uuid.uuid4())
+        rows.append(await repos.profiles.create({
+            "id": user_id, "email": f"{user_id[:8]}@example.com", "role": role, "created_at": created_at,
+        }))
+    return sorted(rows, key=lambda row: (row["created_at"], row["id"]), reverse=True)
+
+
+async def all_pages(page, limit):
+    rows, cursor, pages = [], None, 0
+    while True:
+        items, cursor = await page(limit, cursor=cursor)
+        rows.extend(items)
+        pages += 1
+        if cursor is None:
+            return rows, pages
+
+
+async def test_pages_cover_every_row_once_including_created_at_ties(repos):
+    expected = await seed_profiles(repos, 10, tied=4)
+
+    rows, pages = await all_pages(repos.profiles.page, 3)
+
+    assert [row["id"] for row in rows] == [row["id"] for row in expected]
+    assert pages == 4
+
+
+async def test_exact_multiple_of_the_page_size_ends_without_an_empty_page(repos):
+    await seed_profiles(repos, 6)
+
+    first, cursor = await repos.profiles.page(3)
+    second, cursor = await repos.profiles.page(3, cursor=cursor)
+
+    assert len(first) == len(second) == 3
+    assert cursor is None
+
+
+async def test_rows_inserted_between_pages_do_not_shift_later_pages(repos):
+    expected = await seed_profiles(repos, 6)
+    first, cursor = await repos.profiles.page(3)
+
+    # Newer than everything already paged past
+    await repos.profiles.create({"id": str(uuid.uuid4()), "email": "late@example.com"})
+    second, cursor = await repos.profiles.page(3, cursor=cursor)
+
+    assert [row["id"] for row in first + second] == [row["id"] for row in expected]
+    assert cursor is None
+
+
+async def test_filters_apply_to_every_page(repos):
+    await seed_profiles(repos, 5, role="user")
+    admins = await seed_profiles(repos, 5, role="admin")
+
+    rows, _ = await all_pages(lambda limit, cursor: repos.profiles.page(limit, cursor=cursor, role="admin"), 2)
+    assert [row["id"] for row in rows] == [row["id"] for row in admins]
+
+    recent, _ = await repos.profiles.page(10, role="admin", created_after=BASE + timedelta(minutes=3))
+    assert [row["id"] for row in recent] == [row["id"] for row in admins[:2]]
+
+
+async def test_subscription_pages_with_a_column_subset(repos):
+    user = await repos.profiles.create({"id": str(uuid.uuid4()), "email": "sub@example.com"})
+    product = await repos.products.create({"name": "Plan", "price": 5.0, "features": []})
+    for index in range(5):
+        await repos.subscriptions.create({
+            "user_id": user["id"], "product_id": product["id"],
+            "status": "active" if index % 2 else "canceled", "created_at": BASE + timedelta(minutes=index),
+        })
+
+    rows, pages = await all_pages(
+        lambda limit, cursor: repos.subscriptions.page(limit, cursor=cursor, columns="id,created_at,status", status="active"),
+        1,
+    )
+
+    assert [set(row) for row in rows] == [{"id", "created_at", "status"}] * 2
+    assert pages == 2
+
+
+def test_cursor_round_trip():
+    row = {"created_at": "2026-01-01T00:00:00.000001+00:00", "id": str(uuid.uuid4())}
+
+    assert decode_cursor(encode_cursor(row)) == (row["created_at"], row["id"])
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor({"created_at": "yesterday", "id": "1"})])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_admin_list_rejects_a_malformed_cursor(client, admin):
+    response = client.get("/api/admin/users", params={"cursor": "not-a-cursor"}, headers=admin.headers)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_admin_list_follows_next_cursor(client, admin, make_user):
+    for _ in range(3):
+        make_user()
+
+    first = client.get("/api/admin/users", params={"limit": 2}, headers=admin.headers).json()
+    second = client.get(
+        "/api/admin/users", params={"limit": 2, "cursor": first["next_cursor"]}, headers=admin.headers,
+    ).json()
+
+    ids = [item["id"] for item in first["items"] + second["items"]]
+    assert len(ids) == len(set(ids)) == 4
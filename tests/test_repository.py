@@ -0,0 +1,219 @@
+"""Storage contract every repository backend implements, run against SQLite"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def product_fields(name="Plan", price=10.0):
+    return {"name": name, "description": None, "price": price, "features": []}
+
+
+async def create_profile(repos, role="user", **fields):
+    user_id = str(uuid.uuid4())
+    return await repos.profiles.create({"id": user_id, "email": f"{user_id[:8]}@example.com", "role": role, **fields})
+
+
+async def create_subscription(repos, user, product, **fields):
+    return await repos.subscriptions.create({
+        "user_id": user["id"], "product_id": product["id"], "status": "active", **fields,
+    })
+
+
+async def test_profiles_round_trip_and_cache_roles(repos):
+    profile = await create_profile(repos, full_name="Ada")
+
+    assert (await repos.profiles.get(profile["id"]))["full_name"] == "Ada"
+    assert await repos.profiles.get(profile["id"], columns="id,email") == {
+        "id": profile["id"], "email": profile["email"],
+    }
+    assert await repos.profiles.get_role(profile["id"]) == "user"
+
+    updated = await repos.profiles.update(profile["id"], {"role": "admin"})
+    assert updated["updated_at"] > profile["updated_at"]
+    # update() drops the cached role, so the change is visible at once
+    assert await repos.profiles.get_role(profile["id"]) == "admin"
+    assert await repos.profiles.get_role(str(uuid.uuid4())) is None
+    with pytest.raises(LookupError):
+        await repos.profiles.get(str(uuid.uuid4()))
+    with pytest.raises(ValueError):
+        await repos.profiles.get(profile["id"], columns="id,password")
+
+
+async def test_profile_count_estimate_honours_filters(repos):
+    for role in ("user", "user", "admin"):
+        await create_profile(repos, role=role)
+
+    assert await repos.profiles.count_estimate() == 3
+    assert await repos.profiles.count_estimate(role="admin") == 1
+    assert await repos.profiles.count_estimate(created_after=datetime.now(timezone.utc) + timedelta(days=1)) == 0
+
+
+async def test_products_crud(repos):
+    product = await repos.products.create(product_fields("Basic", 9.5))
+    assert product["features"] == []
+
+    updated = await repos.products.update(product["id"], {"price": 12.0, "features": ["API"]})
+    assert (updated["price"], updated["features"]) == (12.0, ["API"])
+    assert [row["id"] for row in await repos.products.list_all()] == [product["id"]]
+    assert await repos.products.existing_ids([product["id"], str(uuid.uuid4())]) == [product["id"]]
+
+    await repos.products.delete(product["id"])
+    with pytest.raises(LookupError):
+        await repos.products.get(product["id"])
+
+
+async def test_product_bulk_operations(repos):
+    rows = await repos.products.bulk_create([product_fields("A"), product_fields("B"), product_fields("C")])
+    assert [row["name"] for row in rows] == ["A", "B", "C"]
+
+    deleted = await repos.products.bulk_delete([rows[0]["id"], rows[1]["id"], str(uuid.uuid4())])
+
+    assert sorted(row["id"] for row in deleted) == sorted([rows[0]["id"], rows[1]["id"]])
+    assert [row["id"] for row in await repos.products.list_all()] == [rows[2]["id"]]
+
+
+async def test_product_bulk_update_never_recreates_deleted_rows(repos):
+    kept, deleted = await repos.products.bulk_create([product_fields("Kept"), product_fields("Deleted")])
+    await repos.products.delete(deleted["id"])
+
+    rows = await repos.products.bulk_update([
+        {"id": kept["id"], **product_fields("Kept", 12.0)},
+        {"id": deleted["id"], **product_fields("Deleted", 12.0)},
+        {"id": str(uuid.uuid4()), **product_fields("Never existed")},
+    ])
+
+    assert [(row["id"], row["price"]) for row in rows] == [(kept["id"], 12.0)]
+    assert rows[0]["updated_at"] > kept["updated_at"]
+    assert await repos.products.existing_ids([kept["id"], deleted["id"]]) == [kept["id"]]
+
+
+async def test_subscriptions_for_user(repos):
+    user, other = await create_profile(repos), await create_profile(repos)
+    product = await repos.products.create(product_fields())
+    mine = await create_subscription(repos, user, product)
+    theirs = await create_subscription(repos, other, product)
+
+    assert [row["id"] for row in await repos.subscriptions.list_for_user(user["id"])] == [mine["id"]]
+    assert (await repos.subscriptions.update(mine["id"], {"status": "past_due"}))["status"] == "past_due"
+
+    rows = await repos.subscriptions.update_many_for_user(
+        [mine["id"], theirs["id"]], user["id"], {"status": "canceled"},
+    )
+    # Ownership is part of the update, and each row reports the status it replaced
+    assert [(row["id"], row["previous_status"], row["status"]) for row in rows] == [
+        (mine["id"], "past_due", "canceled"),
+    ]
+    assert (await repos.subscriptions.get(theirs["id"]))["status"] == "active"
+
+
+async def test_subscriptions_by_stripe_id(repos):
+    user = await create_profile(repos)
+    product = await repos.products.create(product_fields())
+    subscription = await create_subscription(repos, user, product, stripe_subscription_id="sub_123")
+
+    assert await repos.subscriptions.list_by_stripe_id("sub_123", columns="id,status") == [
+        {"id": subscription["id"], "status": "active"},
+    ]
+    rows = await repos.subscriptions.update_by_stripe_id("sub_123", {"status": "past_due"})
+    assert [row["status"] for row in rows] == ["past_due"]
+    assert await repos.subscriptions.update_by_stripe_id("sub_missing", {"status": "past_due"}) == []
+
+
+async def test_due_subscriptions(repos):
+    user = await create_profile(repos)
+    product = await repos.products.create(product_fields())
+    now = datetime.now(timezone.utc)
+    overdue = await create_subscription(repos, user, product, end_date=now - timedelta(days=2))
+    due = await create_subscription(repos, user, product, end_date=now - timedelta(days=1))
+    await create_subscription(repos, user, product, end_date=now + timedelta(days=1))
+    await create_subscription(repos, user, product, end_date=now - timedelta(days=1), stripe_subscription_id="sub_1")
+
+    listed = await repos.subscriptions.list_due("active", now, 10, stripe_managed=False)
+    assert [row["id"] for row in listed] == [overdue["id"], due["id"]]
+    assert len(await repos.subscriptions.list_due("active", now, 10, stripe_managed=True)) == 1
+
+    # Rows that changed status since they were listed are skipped
+    await repos.subscriptions.update(due["id"], {"status": "canceled"})
+    changed = await repos.subscriptions.update_due([overdue["id"], due["id"]], "active", now, {"status": "inactive"})
+    assert [row["id"] for row in changed] == [overdue["id"]]
+
+
+async def test_renewals_extend_each_end_date(repos):
+    user = await create_profile(repos)
+    product = await repos.products.create(product_fields())
+    now = datetime.now(timezone.utc)
+    first_end, second_end = now - timedelta(days=3), now - timedelta(hours=1)
+    first = await create_subscription(repos, user, product, end_date=first_end)
+    second = await create_subscription(repos, user, product, end_date=second_end)
+    canceled = await create_subscription(repos, user, product, end_date=first_end, status="canceled")
+
+    renewed = await repos.subscriptions.renew_due([first["id"], second["id"], canceled["id"]], "active", now, 30)
+
+    assert {row["id"]: datetime.fromisoformat(row["end_date"]) for row in renewed} == {
+        first["id"]: first_end + timedelta(days=30), second["id"]: second_end + timedelta(days=30),
+    }
+    assert (await repos.subscriptions.get(canceled["id"]))["end_date"] == canceled["end_date"]
+
+
+async def test_cache_versions_bump_atomically(repos):
+    assert await repos.cache_versions.get("products") == 0
+
+    versions = await asyncio.gather(*(repos.cache_versions.bump("products") for _ in range(10)))
+
+    assert sorted(versions) == list(range(1, 11))
+    assert await repos.cache_versions.get("products") == 10
+
+
+async def test_scheduler_lease_has_one_holder(repos):
+    assert await repos.scheduler_leases.acquire("job", "a", 60)
+    assert not await repos.scheduler_leases.acquire("job", "b", 60)
+    # The holder renews its own lease
+    assert await repos.scheduler_leases.acquire("job", "a", 60)
+
+    await repos.scheduler_leases.release("job", "b")
+    assert not await repos.scheduler_leases.acquire("job", "b", 60)
+    await repos.scheduler_leases.release("job", "a")
+    assert await repos.scheduler_leases.acquire("job", "b", 60)
+
+
+async def test_expired_lease_can_be_taken_over(repos):
+    assert await repos.scheduler_leases.acquire("job", "a", 0.01)
+    await asyncio.sleep(0.02)
+    assert await repos.scheduler_leases.acquire("job", "b", 60)
+
+
+async def test_rate_limit_bucket(repos):
+    results = [await repos.rate_limits.take("login:1.2.3.4", rate=0.5, capacity=2) for _ in range(3)]
+
+    assert [allowed for allowed, _ in results] == [True, True, False]
+    assert results[2][1] == pytest.approx(2.0, abs=0.1)
+
+
+async def test_idempotency_keys(repos):
+    assert await repos.idempotency.claim("key", "fp", 60)
+    assert not await repos.idempotency.claim("key", "fp", 60)
+    assert await repos.idempotency.get("key") == {"fingerprint": "fp", "status_code": None, "body": None}
+
+    await repos.idempotency.release("key")
+    assert await repos.idempotency.get("key") is None
+    assert await repos.idempotency.claim("key", "fp", 60)
+
+    await repos.idempotency.complete("key", 200, '{"ok":true}')
+    # Completed records are kept for replay
+    await repos.idempotency.release("key")
+    assert await repos.idempotency.get("key") == {"fingerprint": "fp", "status_code": 200, "body": '{"ok":true}'}
+
+
+async def test_subscription_metrics(repos):
+    await repos.subscription_metrics.add({"status:active": 2, "transition:new->active": 2})
+    await repos.subscription_metrics.add({"status:active": -1, "status:canceled": 1})
+    assert await repos.subscription_metrics.all() == {
+        "status:active": 1, "status:canceled": 1, "transition:new->active": 2,
+    }
+
+    await repos.subscription_metrics.replace(["status:"], {"status:active": 5})
+    assert await repos.subscription_metrics.all() == {"status:active": 5, "transition:new->active": 2}
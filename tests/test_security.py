@@ -0,0 +1,35 @@
+"""Single-use stream tickets"""
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from backend import security
+from backend.repository import idempotency_repo
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_ticket_is_single_use_across_workers(client):
+    jti = str(uuid.uuid4())
+
+    assert await security._redeem_ticket(jti)
+    assert not await security._redeem_ticket(jti)
+    # Another worker has nothing in memory but sees the shared record
+    security._redeemed_tickets.clear()
+    assert not await security._redeem_ticket(jti)
+
+
+async def test_ticket_is_refused_when_the_shared_store_is_down(client, monkeypatch):
+    async def unreachable(*args):
+        raise ConnectionError("database unavailable")
+    monkeypatch.setattr(idempotency_repo, "claim", unreachable)
+    jti = str(uuid.uuid4())
+
+    with pytest.raises(HTTPException) as refused:
+        await security._redeem_ticket(jti)
+
+    assert refused.value.status_code == 503
+    # Not marked used, so the client may retry once the store is back
+    monkeypatch.undo()
+    assert await security._redeem_ticket(jti)
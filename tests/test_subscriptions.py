@@ -0,0 +1,50 @@
+import uuid
+
+
+def summary(client, admin):
+    response = client.get("/api/admin/analytics/summary", headers=admin.headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_batch_update_applies_exact_metric_deltas(client, user, admin, product):
+    created = [
+        client.post("/api/subscriptions/", headers=user.headers, json={"product_id": product["id"]}).json()
+        for _ in range(3)
+    ]
+    before = summary(client, admin)
+
+    response = client.patch("/api/subscriptions/batch", headers=user.headers, json={"updates": [
+        {"id": created[0]["id"], "status": "canceled"},
+        {"id": created[1]["id"], "status": "past_due"},
+        {"id": created[2]["id"], "status": "active"},
+        {"id": str(uuid.uuid4()), "status": "canceled"},
+    ]})
+
+    assert response.status_code == 200
+    assert [result["ok"] for result in response.json()["results"]] == [True, True, True, False]
+    after = summary(client, admin)
+    counts_before, counts_after = before["status_counts"], after["status_counts"]
+    assert counts_after["active"] == counts_before["active"] - 2
+    assert counts_after["canceled"] == counts_before.get("canceled", 0) + 1
+    assert counts_after["past_due"] == counts_before.get("past_due", 0) + 1
+    transitions_before = before["transitions"]
+    assert after["transitions"]["active->canceled"] == transitions_before.get("active->canceled", 0) + 1
+    assert after["transitions"]["active->past_due"] == transitions_before.get("active->past_due", 0) + 1
+    # An unchanged status is not a transition
+    assert "active->active" not in after["transitions"]
+
+
+def test_batch_update_only_touches_the_callers_subscriptions(client, user, make_user, product):
+    other = make_user()
+    theirs = client.post("/api/subscriptions/", headers=other.headers, json={"product_id": product["id"]}).json()
+
+    response = client.patch("/api/subscriptions/batch", headers=user.headers, json={"updates": [
+        {"id": theirs["id"], "status": "canceled"},
+    ]})
+
+    assert response.json()["results"][0] == {
+        "index": 0, "ok": False, "id": theirs["id"], "error": "Subscription not found",
+    }
+    mine = client.get("/api/subscriptions/", headers=other.headers).json()
+    assert [row["status"] for row in mine] == ["active"]
@@ -0,0 +1,41 @@
+"""GET /api/users/me and /me/dashboard"""
+import uuid
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.repository import subscription_repo
+from backend.utils import create_jwt_token
+
+
+def test_dashboard_joins_subscriptions_and_products(client, user, admin):
+    # Created through the API so the product catalog sees it
+    product = client.post("/api/admin/products", headers=admin.headers, json={"name": "Pro", "price": 10.0}).json()
+    client.post("/api/subscriptions/", headers=user.headers, json={"product_id": product["id"]})
+
+    dashboard = client.get("/api/users/me/dashboard", headers=user.headers).json()
+
+    assert dashboard["profile"]["id"] == user.id
+    assert [row["product"]["id"] for row in dashboard["subscriptions"]] == [product["id"]]
+    assert dashboard["status_counts"] == {"active": 1}
+    assert dashboard["monthly_spend"] == product["price"]
+
+
+def test_missing_profile_is_404(client):
+    user_id = str(uuid.uuid4())
+    headers = {"Authorization": f"Bearer {create_jwt_token(user_id, 'ghost@example.com')}"}
+
+    for path in ("/api/users/me", "/api/users/me/dashboard"):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 404
+        assert response.json()["detail"] == "User profile not found"
+
+
+def test_storage_failure_is_not_reported_as_a_missing_profile(client, user, monkeypatch):
+    async def unreachable(user_id):
+        raise ConnectionError("database unavailable")
+    monkeypatch.setattr(subscription_repo, "list_for_user", unreachable)
+
+    response = TestClient(app, raise_server_exceptions=False).get("/api/users/me/dashboard", headers=user.headers)
+
+    assert response.status_code == 500
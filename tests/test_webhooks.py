@@ -0,0 +1,176 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import webhooks
+from backend.webhooks import WebhookPipeline
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def events(repos, monkeypatch):
+    monkeypatch.setattr(webhooks, "stripe_event_repo", repos.stripe_events)
+    monkeypatch.setattr(webhooks, "WEBHOOK_RETRY_BASE_SECONDS", 0)
+    return repos.stripe_events
+
+
+def event(event_id, subscription="sub_1"):
+    return {
+        "id": event_id,
+        "type": "customer.subscription.updated",
+        "data": {"object": {"object": "subscription", "id": subscription}},
+    }
+
+
+def row(event_id, claimed_at=None, **fields):
+    return {
+        "id": event_id,
+        "type": "customer.subscription.updated",
+        "ordering_key": "sub_1",
+        "payload": event(event_id),
+        "status": "pending",
+        "claimed_at": claimed_at,
+        **fields,
+    }
+
+
+def ago(seconds):
+    return datetime.utcnow() - timedelta(seconds=seconds)
+
+
+async def wait_for_status(events, event_id, status, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        current = await events.get(event_id)
+        if current["status"] == status:
+            return current
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError(f"{event_id} is {current['status']}, expected {status}")
+        await asyncio.sleep(0.01)
+
+
+async def test_claim_is_exclusive(events):
+    await events.record(row("evt_free"))
+    results = await asyncio.gather(*(events.claim("evt_free", ago(600)) for _ in range(5)))
+    assert sum(result is not None for result in results) == 1
+
+
+async def test_claim_takes_over_only_stale_claims(events):
+    await events.record(row("evt_stale", claimed_at=ago(3600)))
+    await events.record(row("evt_live", claimed_at=ago(1)))
+    await events.record(row("evt_done", status="processed"))
+
+    assert await events.claim("evt_stale", ago(600)) is not None
+    assert await events.claim("evt_live", ago(600)) is None
+    assert await events.claim("evt_done", ago(600)) is None
+
+
+async def test_failed_event_is_retried_until_it_succeeds(events):
+    pipeline = WebhookPipeline(workers=2, max_attempts=5)
+    calls = []
+
+    @pipeline.handler("customer.subscription.updated")
+    async def flaky(payload):
+        calls.append(payload["id"])
+        if len(calls) < 3:
+            raise RuntimeError("upstream timeout")
+
+    try:
+        assert await pipeline.submit(event("evt_retry"))
+        stored = await wait_for_status(events, "evt_retry", "processed")
+    finally:
+        await pipeline.stop()
+    assert calls == ["evt_retry"] * 3
+    assert stored["attempts"] == 3
+    assert stored["last_error"] is None
+    assert pipeline.counters["retries"] == 2
+
+
+async def test_exhausted_event_is_dead_lettered_and_can_be_replayed(events):
+    pipeline = WebhookPipeline(workers=1, max_attempts=2)
+    failing = True
+
+    @pipeline.handler("customer.subscription.updated")
+    async def handler(payload):
+        if failing:
+            raise ValueError("bad payload")
+
+    try:
+        await pipeline.submit(event("evt_dead"))
+        dead = await wait_for_status(events, "evt_dead", "dead")
+        assert dead["attempts"] == 2
+        assert dead["last_error"] == "ValueError: bad payload"
+        assert [stored["id"] for stored in await events.list_by_status("dead", 10)] == ["evt_dead"]
+
+        failing = False
+        await pipeline.replay("evt_dead")
+        processed = await wait_for_status(events, "evt_dead", "processed")
+        with pytest.raises(ValueError):
+            await pipeline.replay("evt_dead")
+    finally:
+        await pipeline.stop()
+    assert processed["attempts"] == 1
+    assert pipeline.counters["dead_lettered"] == 1
+
+
+async def test_startup_recovers_unclaimed_and_stale_events_only(events):
+    await events.record(row("evt_unclaimed"))
+    await events.record(row("evt_crashed", claimed_at=ago(3600)))
+    await events.record(row("evt_in_flight", claimed_at=ago(1)))
+    pipeline = WebhookPipeline(workers=2)
+    handled = []
+
+    @pipeline.handler("customer.subscription.updated")
+    async def handler(payload):
+        handled.append(payload["id"])
+
+    try:
+        await pipeline.start()
+        await wait_for_status(events, "evt_unclaimed", "processed")
+        await wait_for_status(events, "evt_crashed", "processed")
+    finally:
+        await pipeline.stop()
+    assert sorted(handled) == ["evt_crashed", "evt_unclaimed"]
+    assert (await events.get("evt_in_flight"))["status"] == "pending"
+
+
+async def test_periodic_sweep_recovers_claims_that_go_stale_while_running(events, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_RECOVERY_INTERVAL_SECONDS", 0.05)
+    pipeline = WebhookPipeline(workers=1)
+    handled = []
+
+    @pipeline.handler("customer.subscription.updated")
+    async def handler(payload):
+        handled.append(payload["id"])
+
+    try:
+        await pipeline.start()
+        # A worker in another process claimed the event after startup and then died
+        await events.record(row("evt_orphaned", claimed_at=ago(3600)))
+        await wait_for_status(events, "evt_orphaned", "processed")
+    finally:
+        await pipeline.stop()
+    assert handled == ["evt_orphaned"]
+
+
+async def test_concurrent_recovery_processes_each_event_once(events):
+    for index in range(20):
+        await events.record(row(f"evt_{index}", ordering_key=f"sub_{index}"))
+    pipelines = [WebhookPipeline(workers=2) for _ in range(3)]
+    handled = []
+    for pipeline in pipelines:
+        pipeline.handler("customer.subscription.updated")(lambda payload: _record(handled, payload))
+
+    try:
+        await asyncio.gather(*(pipeline.start() for pipeline in pipelines))
+        for index in range(20):
+            await wait_for_status(events, f"evt_{index}", "processed")
+    finally:
+        await asyncio.gather(*(pipeline.stop() for pipeline in pipelines))
+    assert sorted(handled) == sorted(f"evt_{index}" for index in range(20))
+
+
+async def _record(handled, payload):
+    handled.append(payload["id"])